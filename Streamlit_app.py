@@ -7,15 +7,154 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import quote
-from bs4 import BeautifulSoup, NavigableString
+from urllib.parse import quote, urljoin, urlparse, parse_qs
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
 import requests
-from openai import OpenAI
+import httpx
+from openai import DEFAULT_MAX_RETRIES, NOT_GIVEN, APITimeoutError, OpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
 import os
+import re
 import logging
+import contextvars
+import functools
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from webdriver_pool import BrowserBusyError, get_driver_pool
+import http_client
+from page_cache import cached_page
+from search_cache import get_search_cache, normalize_query
+from search_index import get_local_search
+from context_packing import count_tokens, pack_sources
+from answer_cache import get_answer_cache, source_fingerprint
+from extractor_registry import extractor_registry
+from single_flight import get_single_flight
+from tracing import span, stage_metrics, start_trace
+from deadline import current_deadline, deadline_scope, time_left
+from prewarm import record_question
+from placeholders import FORUM_FAILURE, HELP_FAILURE, SEARCH_FAILURE, is_failed_extraction
 
 logging.basicConfig(level=logging.INFO)
 
+BUSY_MESSAGE = "Too many questions are being answered right now. Please try again in a minute."
+ANSWER_TIMEOUT = "The answer could not be generated in time. Please try again."
+# Resources the scraped pages do not need, since only their DOM is read: stylesheets, fonts, images, media and
+# analytics. Blocked by the lean browser mode.
+LEAN_BLOCKED_URLS = [
+    "*.css*", "*.woff*", "*.ttf*", "*.otf*", "*.eot*",
+    "*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.svg*", "*.webp*", "*.ico*", "*.mp4*", "*.webm*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*adobedtm.com*", "*demdex.net*",
+    "*omtrdc.net*", "*hotjar.com*", "*optimizely.com*", "*qualtrics.com*", "*nr-data.net*", "*newrelic.com*",
+]
+# Sums what the page and its resources transferred, as reported by the Resource Timing API
+PAGE_WEIGHT_SCRIPT = """
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return {bytes: entries.reduce((total, entry) => total + (entry.transferSize || 0), 0), requests: entries.length};
+"""
+# Number of answers remembered per session, so reruns of the page do not answer the same question again
+SESSION_ANSWERS = 20
+# Shares of the time left before the answer deadline given to the search, then to the extraction of its results.
+# The rest is left for the model.
+SEARCH_SHARE = 0.4
+EXTRACTION_SHARE = 0.75
+# Slow extractions are started a second time once they run longer than this quantile of the recent extractions,
+# measured over at least HEDGE_MIN_SAMPLES of them. At most HEDGE_MAX links are hedged per question. Only the
+# extractions that downloaded or rendered a page and succeeded count (the HEDGE_STAGE stage), not cache hits or
+# failures, which would make every uncached extraction look slow.
+HEDGE_STAGE = "page_extraction"
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX = 2
+
+
+def create_chrome_driver(lean=None):
+    """
+        Starts a new headless Chrome WebDriver. Used as the factory of the shared WebDriver pool.
+
+        In lean mode, page loads return once the DOM is ready instead of after every resource, and stylesheets,
+        fonts, images, media and known analytics hosts are not downloaded at all.
+
+        Args:
+            lean (bool): Whether to use the lean mode. Defaults to the BROWSER_LEAN environment variable, on
+                unless set to 0.
+
+        Returns:
+            webdriver.Chrome: The started driver.
+    """
+    lean = lean if lean is not None else os.getenv("BROWSER_LEAN", "1") != "0"
+    # Set up Chrome options for headless mode
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run in headless mode
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-extensions")
+    # No fixed --remote-debugging-port: ChromeDriver then lets every browser pick a free port, so several browsers
+    # can run side by side
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_argument('--disable-infobars')
+    chrome_options.add_argument('--disable-browser-side-navigation')
+    chrome_options.add_argument('--disable-features=VizDisplayCompositor')
+    if lean:
+        # Return from driver.get() at DOMContentLoaded, the callers then wait for the elements they read
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+    if lean:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+    return driver
+
+
+def page_weight(driver):
+    """
+        Measures what the page loaded in a driver transferred.
+
+        Args:
+            driver (webdriver.Chrome): The driver, after the page was loaded.
+
+        Returns:
+            dict: The bytes transferred and the number of requests of the page and its resources, empty if they
+                could not be measured.
+    """
+    try:
+        weight = driver.execute_script(PAGE_WEIGHT_SCRIPT)
+    except Exception as e:
+        logging.info(f"Could not measure the page weight: {e}")
+        return {}
+    if not isinstance(weight, dict):
+        return {}
+    return {"bytes": int(weight.get("bytes", 0)), "requests": int(weight.get("requests", 0))}
+
+
+def timed_extraction(is_failure):
+    """
+        Decorator recording the duration of the successful runs of a page extractor as the HEDGE_STAGE stage.
+
+        Placed under cached_page, it only times the extractions that reached the site.
+
+        Args:
+            is_failure (callable): Takes the extractor's result and returns True if the extraction failed.
+
+        Returns:
+            callable: The decorator.
+    """
+    def decorator(extractor):
+        @functools.wraps(extractor)
+        def wrapper(url):
+            started = time.monotonic()
+            result = extractor(url)
+            if not is_failure(result):
+                stage_metrics.observe(HEDGE_STAGE, time.monotonic() - started)
+            return result
+        return wrapper
+    return decorator
+
+
+@cached_page("forum", is_failure=lambda content: content[0] == FORUM_FAILURE)
+@timed_extraction(is_failure=lambda content: content[0] == FORUM_FAILURE)
 def extract_forum_info(url):
     """
         Extracts the original question, and accepted solutions from a given Civil 3D forum page URL.
@@ -33,92 +172,163 @@ def extract_forum_info(url):
     """
     try:
         # Send a GET request to the specified URL
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an HTTPError for bad responses
+        # Revalidate threads downloaded before, an unchanged thread is answered with a 304 without its body
+        with span("forum.fetch", url=url) as attributes:
+            response = http_client.fetch(url, conditional=True)
+            attributes["revalidated"] = response.revalidated
     except requests.RequestException as e:
         raise requests.RequestException(f"Failed to retrieve the page: {e}")
 
     try:
-        # Parse the content of the response with BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        header = soup.find('h2', class_='PageTitle lia-component-common-widget-page-title').text.strip()
-
-        # Extract the body content of the original question
-        question = soup.find('div', itemprop='text').text.strip()
-
-        # Combine the header and the body to form the full original question
-        original_question = header + " " + question
-
-        # Find all comments on page
-        comments = soup.find_all('div', class_='lia-message-body-content')
-
-        # Extract the kudos counts for each comment
-        kudos_counts = [int(count.text) for count in
-                        soup.find_all('span', class_='MessageKudosCount lia-component-kudos-widget-message-kudos-count')]
-
-        # Combine comments and kudos counts into a list of tuples
-        comment_kudos = list(zip(comments, kudos_counts))[1:]
-        
-        # Extract accepted solutions
-        accepted_solutions = []
-        for comment in soup.find_all('div', class_='lia-message-body-content')[1:]:
-            checkmark_div = comment.find('div', class_='lia-message-body-accepted-solution-checkmark')
-            if checkmark_div:
-                # Get the parent element containing the checkmark and solution text
-                solution_container = checkmark_div.parent
-
-                # Find the iframe element and extract the link
-                iframe = solution_container.find('iframe')
-                link = iframe.get('src') if iframe else None  # Get link if iframe exists
-
-                # Extract child elements (including text nodes and tags)
-                children = list(solution_container.children)
-
-                # Extract text content from child elements
-                text_parts = []
-                for child in children:
-                    if isinstance(child, NavigableString):
-                        text_parts.append(child.strip())
-                    elif child.name not in ['iframe', 'br']:
-                        text_parts.append(child.text.strip())
-
-                # Insert the link at the position where the iframe was (if it exists)
-                if link:
-                    # Find the index where the iframe WOULD HAVE BEEN before it was removed
-                    iframe_index = -1
-                    for i, child in enumerate(children):
-                        if child == iframe:
-                            iframe_index = i
-                            break
-
-                    if iframe_index != -1:
-                        text_parts.insert(iframe_index + 1, f"\n\nLink: {link}\n\n")
-                    else:
-                        text_parts.append(f"\n\nLink: {link}\n\n")
-
-                # Join the text parts to form the final solution text
-                solution_text = ''.join(text_parts)
-
-                # Append the solution text to the list of accepted solutions
-                accepted_solutions.append(solution_text.strip().replace("\xa0",""))
-
-        if not original_question:
-            original_question = "Failed to retrieve the original question."
-
-        # Check if the accepted solutions list is empty and provide a fallback message if necessary
-        if not accepted_solutions:
-            accepted_solutions = ["No accepted solutions found."]
         # Return the original question, top comments, and accepted solutions
-        return original_question, accepted_solutions
+        with span("forum.parse", url=url):
+            return parse_forum_page(response.content)
     except Exception as e:
         logging.info(f"An error occurred: {e}")
-        original_question = "Failed to retrieve the original question."
+        original_question = FORUM_FAILURE
         accepted_solutions = ["No accepted solutions found."]
         return original_question, accepted_solutions
 
 
+def _is_forum_content(name, attrs):
+    """
+        SoupStrainer filter keeping only the elements extract_forum_info reads: the page title, the original question
+        and the message bodies.
+    """
+    if name not in ('h2', 'div'):
+        return False
+    classes = attrs.get('class') or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    if name == 'h2':
+        return 'PageTitle' in classes
+    return attrs.get('itemprop') == 'text' or 'lia-message-body-content' in classes
+
+
+FORUM_PARSE_ONLY = SoupStrainer(_is_forum_content)
+
+
+def get_forum_parser():
+    """
+        Returns the BeautifulSoup backend used to parse forum pages: the FORUM_PARSER environment variable, or lxml
+        when it is installed, or the pure-Python html.parser.
+    """
+    parser = os.getenv("FORUM_PARSER")
+    if parser:
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def parse_forum_page(page_source, parser=None):
+    """
+        Extracts the original question, and accepted solutions from the HTML of a Civil 3D forum page.
+
+        Only the page title, the original question and the message bodies are turned into a tree, and the message
+        bodies are walked once.
+
+        Args:
+            page_source (str or bytes): The HTML of the forum page.
+            parser (str): The BeautifulSoup backend, e.g. 'lxml' or 'html.parser'. Defaults to get_forum_parser().
+
+        Returns:
+            tuple: A tuple containing:
+                - original_question (str): The combined header and body of the original question.
+                - accepted_solutions (list of str): A list of accepted solutions with their links (if any).
+
+        Raises:
+            AttributeError: If the page has no title or original question.
+    """
+    # Parse the relevant parts of the page with BeautifulSoup
+    soup = BeautifulSoup(page_source, parser or get_forum_parser(), parse_only=FORUM_PARSE_ONLY)
+
+    header = soup.find('h2', class_='PageTitle lia-component-common-widget-page-title').text.strip()
+
+    # Extract the body content of the original question
+    question = soup.find('div', itemprop='text').text.strip()
+
+    # Combine the header and the body to form the full original question
+    original_question = header + " " + question
+
+    # Extract accepted solutions from every comment but the original post
+    accepted_solutions = []
+    for comment in soup.find_all('div', class_='lia-message-body-content')[1:]:
+        checkmark_div = comment.find('div', class_='lia-message-body-accepted-solution-checkmark')
+        if not checkmark_div:
+            continue
+        # Get the parent element containing the checkmark and solution text
+        solution_container = checkmark_div.parent
+
+        # Find the iframe element and extract the link
+        iframe = solution_container.find('iframe')
+        link = iframe.get('src') if iframe else None  # Get link if iframe exists
+
+        # Extract text content from child elements (including text nodes and tags), noting where the iframe is
+        text_parts = []
+        iframe_index = -1
+        for i, child in enumerate(solution_container.children):
+            if child is iframe:
+                iframe_index = i
+            if isinstance(child, NavigableString):
+                text_parts.append(child.strip())
+            elif child.name not in ['iframe', 'br']:
+                text_parts.append(child.text.strip())
+
+        # Insert the link at the position where the iframe was (if it exists)
+        if link:
+            if iframe_index != -1:
+                text_parts.insert(iframe_index + 1, f"\n\nLink: {link}\n\n")
+            else:
+                text_parts.append(f"\n\nLink: {link}\n\n")
+
+        # Join the text parts to form the final solution text
+        solution_text = ''.join(text_parts)
+
+        # Append the solution text to the list of accepted solutions
+        accepted_solutions.append(solution_text.strip().replace("\xa0", ""))
+
+    if not original_question:
+        original_question = FORUM_FAILURE
+
+    # Check if the accepted solutions list is empty and provide a fallback message if necessary
+    if not accepted_solutions:
+        accepted_solutions = ["No accepted solutions found."]
+    return original_question, accepted_solutions
+
+
 def get_top_5_links(search_query, year=2024):
+    """
+       Retrieves the top 5 pages links for a query.
+
+       The local search index of the version is used when it was built (see search_index.py). Otherwise, or when
+       it has no match and SEARCH_LIVE_FALLBACK is not set to 0, the live search on the Autodesk Help page is used,
+       from the search cache when the same (or a trivially different) query was searched recently.
+
+       Args:
+           search_query (str): The search query string.
+           year (int): The Civil 3D version to search the documentation of.
+
+       Returns:
+           list: A list of the top 5 links (str) from the search results.
+       """
+    local_search = get_local_search()
+    if local_search is not None:
+        top_5_links = local_search.search(search_query, year, k=5)
+        if top_5_links:
+            return top_5_links
+        if local_search.get_index(int(year)) is not None and os.getenv("SEARCH_LIVE_FALLBACK", "1") == "0":
+            return [SEARCH_FAILURE]
+
+    cache = get_search_cache(is_failure=lambda links: links == [SEARCH_FAILURE])
+    if cache is None:
+        return search_autodesk_help(search_query, year)
+    return cache.get_or_fetch(search_query, year, lambda: search_autodesk_help(search_query, year))
+
+
+def search_autodesk_help(search_query, year=2024):
     """
        Simulates a search for a query on the Autodesk Civil 3D 2024 Help page and retrieves the top 5 pages links.
 
@@ -139,47 +349,154 @@ def get_top_5_links(search_query, year=2024):
     simulated_search_url = f"https://help.autodesk.com/view/CIV3D/{year}/ENU/?query={encoded_query}"
 
     try:
-        # Set up Chrome options for headless mode
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run in headless mode
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--remote-debugging-port=9222")
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_argument('--disable-infobars')
-        chrome_options.add_argument('--disable-browser-side-navigation')
-        chrome_options.add_argument('--disable-features=VizDisplayCompositor')
-
-        # Set up WebDriver
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        driver.get(simulated_search_url)
-
-        # Wait for the content to load
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".results-item .results-item-title a"))
-        )
+        # Borrow an already running WebDriver from the shared pool
+        with get_driver_pool(create_chrome_driver).driver(timeout=time_left()) as driver, \
+                span("search.browser", url=simulated_search_url) as attributes:
+            started = time.monotonic()
+            driver.get(simulated_search_url)
+
+            # Wait for the content to load, at most until the current deadline
+            WebDriverWait(driver, time_left(10)).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, ".results-item .results-item-title a"))
+            )
+            attributes.update(page_weight(driver), load_seconds=time.monotonic() - started)
+            logging.info(f"Loaded the search results in {attributes['load_seconds']:.2f}s, "
+                         f"{attributes.get('bytes')} bytes")
+
+            # Find the element containing the instructions (inspect the page to get the correct selector)
+            links = driver.find_elements(By.CSS_SELECTOR, '.results-item .results-item-title a')
+            top_5_links = [link.get_attribute("href") for link in links[:5]]
 
-        # Find the element containing the instructions (inspect the page to get the correct selector)
-        links = driver.find_elements(By.CSS_SELECTOR, '.results-item .results-item-title a')
-        top_5_links = [link.get_attribute("href") for link in links[:5]]
-        
         if not top_5_links:
             raise Exception("Top_5_links retrieval error. List is empty")
 
+    except BrowserBusyError:
+        # Not a search failure, the caller tells the user to come back later
+        raise
     except Exception as e:
-        top_5_links = ["Failed to retrieve the top 5 links."]
+        top_5_links = [SEARCH_FAILURE]
         logging.info(f"An error occurred: {e}")
-    finally:
-        driver.quit()  # Close the browser
     return top_5_links
 
+def parse_help_content(page_source, base_url=None, allow_document_body=False):
+    """
+        Extracts text, image URLs, and video URLs from the HTML of a Civil 3D documentation page.
+
+        Args:
+            page_source (str or bytes): The HTML of the page.
+            base_url (str): If given, relative image and video URLs are resolved against it.
+            allow_document_body (bool): Whether to fall back to the whole <body> when the page has no caas_body
+                element, which is the case for the standalone article files the help viewer loads.
+
+        Returns:
+            tuple: A tuple containing:
+                - extracted_text (str): The text content of the article.
+                - image_urls (list of str): List of image URLs from the article.
+                - video_urls (list of str): List of video URLs from the article.
+
+        Raises:
+            ValueError: If the page has no article body.
+    """
+    # Parse page source with BeautifulSoup
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    # Extract Text
+    content = soup.find('div', class_='caas_body')
+    if content is None and allow_document_body:
+        content = soup.body
+    if content is None:
+        raise ValueError("The page has no article body")
+    extracted_text = content.get_text(separator=" ", strip=True)
+
+    # Extract Image URLs
+    image_urls = []
+    image_elements = content.find_all('img')
+    for img in image_elements:
+        image_url = img['src']
+        if image_url:
+            image_urls.append(urljoin(base_url, image_url) if base_url else image_url)
+
+    # Extract Video URLs
+    video_urls = []
+    video_elements = content.find_all('video')
+    for video in video_elements:
+        sources = video.find_all('source')
+        for source in sources:
+            video_url = source['src']
+            if video_url:
+                video_urls.append(urljoin(base_url, video_url) if base_url else video_url)
+
+    return extracted_text, image_urls, video_urls
+
+
+def get_help_content_urls(url, base_url=None):
+    """
+        Works out the URLs of the article files the help viewer loads for a documentation page.
+
+        The viewer at help.autodesk.com/view/CIV3D/<year>/ENU/?guid=<GUID> renders the article from
+        <base_url>/<year>/ENU/<book>/files/<GUID>.htm, where the books are listed in the HELP_CONTENT_BOOKS
+        environment variable. A URL that already points at an article file is returned as is.
+
+        Args:
+            url (str): The URL of the documentation page.
+            base_url (str): The root of the article files. Defaults to the HELP_CONTENT_BASE_URL environment
+                variable or https://help.autodesk.com/cloudhelp.
+
+        Returns:
+            list of str: The candidate article URLs, possibly empty.
+    """
+    parsed = urlparse(url)
+    if "/cloudhelp/" in parsed.path and parsed.path.endswith((".htm", ".html")):
+        return [url]
+
+    guid = parse_qs(parsed.query).get("guid", [None])[0]
+    match = re.search(r"/view/[^/]+/(\d{4})/([^/]+)/", parsed.path)
+    if not guid or not match:
+        return []
+
+    year, language = match.groups()
+    base_url = (base_url or os.getenv("HELP_CONTENT_BASE_URL", "https://help.autodesk.com/cloudhelp")).rstrip("/")
+    books = os.getenv("HELP_CONTENT_BOOKS", "Civil3D-UserGuide").split(",")
+    return [f"{base_url}/{year}/{language}/{book.strip()}/files/{quote(guid)}.htm" for book in books if book.strip()]
+
+
+def extract_help_content_http(url, base_url=None):
+    """
+        Extracts a documentation page with plain HTTP requests for its article file, without a browser.
+
+        Args:
+            url (str): The URL of the Autodesk help page.
+            base_url (str): The root of the article files, see get_help_content_urls.
+
+        Returns:
+            tuple: The (extracted_text, image_urls, video_urls) of the article, or None if no article file
+                could be downloaded or it had no body.
+    """
+    for content_url in get_help_content_urls(url, base_url=base_url):
+        try:
+            with span("help.fetch", url=content_url):
+                response = http_client.fetch(content_url, conditional=True)
+            with span("help.parse", url=content_url):
+                extracted_text, image_urls, video_urls = parse_help_content(
+                    response.content, base_url=content_url, allow_document_body=True
+                )
+        except (requests.RequestException, ValueError) as e:
+            logging.info(f"Help fast path failed for {content_url}: {e}")
+            continue
+        if extracted_text:
+            return extracted_text, image_urls, video_urls
+    return None
+
+
+@cached_page("help", is_failure=lambda content: content[0] == HELP_FAILURE)
+@timed_extraction(is_failure=lambda content: content[0] == HELP_FAILURE)
 def extract_content_from_autodesk_help(url):
     """
         Extracts text, image URLs, and video URLs from a Civil 3D documentation page.
 
+        The article file is first downloaded over plain HTTP (see extract_help_content_http). The page is only
+        rendered in a headless browser when that returns nothing, or when HELP_FAST_PATH is set to 0.
+
         Args:
             url (str): The URL of the Autodesk help page.
 
@@ -192,74 +509,320 @@ def extract_content_from_autodesk_help(url):
         Raises:
             Exception: If there is an issue with the web scraping process.
         """
-    try:
-        # Set up Chrome options for headless mode
-        chrome_options = Options()
-        chrome_options.add_argument("--headless") 
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--remote-debugging-port=9222")
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_argument('--disable-infobars')
-        chrome_options.add_argument('--disable-browser-side-navigation')
-        chrome_options.add_argument('--disable-features=VizDisplayCompositor')
-
-        # Set up WebDriver
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        driver.get(url)
-
-        # Wait for the content to load
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "caas_body"))
-        )
-
-        # Extract page source after it is fully loaded
-        page_source = driver.page_source
+    if os.getenv("HELP_FAST_PATH", "1") != "0":
+        content = extract_help_content_http(url)
+        if content is not None:
+            return content
 
+    try:
+        # Borrow an already running WebDriver from the shared pool
+        with get_driver_pool(create_chrome_driver).driver(timeout=time_left()) as driver, \
+                span("help.browser", url=url) as attributes:
+            started = time.monotonic()
+            driver.get(url)
 
-        # Parse page source with BeautifulSoup
-        soup = BeautifulSoup(page_source, 'html.parser')
-
-        # Extract Text
-        content = soup.find('div', class_='caas_body')
-        extracted_text = content.get_text(separator=" ", strip=True)
+            # Wait for the content to load, at most until the current deadline
+            WebDriverWait(driver, time_left(10)).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "caas_body"))
+            )
+            attributes.update(page_weight(driver), load_seconds=time.monotonic() - started)
+            logging.info(f"Loaded {url} in {attributes['load_seconds']:.2f}s, {attributes.get('bytes')} bytes")
 
-        # Extract Image URLs
-        image_urls = []
-        image_elements = content.find_all('img')
-        for img in image_elements:
-            image_url = img['src']
-            if image_url:
-                image_urls.append(image_url)
+            # Extract page source after it is fully loaded
+            page_source = driver.page_source
 
-        # Extract Video URLs
-        video_urls = []
-        video_elements = content.find_all('video')
-        for video in video_elements:
-            sources = video.find_all('source')
-            for source in sources:
-                video_url = source['src']
-                if video_url:
-                    video_urls.append(video_url)
+        with span("help.parse", url=url):
+            extracted_text, image_urls, video_urls = parse_help_content(page_source)
 
     except Exception as e:
-        extracted_text = "Failed to extract text from the page."
+        extracted_text = HELP_FAILURE
         image_urls = ["Failed to extract image URLs from the page."]
         video_urls = ["Failed to extract video URLs from the page."]
         logging.info(f"An error occurred: {e}")
-    finally:
-        driver.quit()
     return extracted_text, image_urls, video_urls
 
-def ask_question_on_autodesk_and_generate_prompt(question, year=2024):
+# Route links straight to the extractor of their site. The lambdas look the extractors up at call time so the
+# registry always uses the current module's functions. Unknown hosts keep the forum-then-documentation fallback.
+extractor_registry.register(
+    "forum", lambda url: extract_forum_info(url), hosts=["forums.autodesk.com"],
+    is_failure=lambda content: content[0] == FORUM_FAILURE,
+)
+extractor_registry.register(
+    "help", lambda url: extract_content_from_autodesk_help(url), hosts=["help.autodesk.com"],
+    is_failure=lambda content: content[0] == HELP_FAILURE,
+)
+extractor_registry.register(
+    "unknown", lambda url: extract_forum_info(url), source_type="forum", fallback="help",
+    is_failure=lambda content: content[0] == FORUM_FAILURE, default=True,
+)
+
+
+def extract_source(link):
+    """
+        Extracts the information of a single search result with the extractor registered for its host.
+
+        Args:
+            link (str): The URL of the search result.
+
+        Returns:
+            tuple: A tuple containing:
+                - source_type (str): Either "forum" or "help".
+                - content (tuple): The result of extract_forum_info or extract_content_from_autodesk_help.
+    """
+    with span("extract_source", url=link) as attributes:
+        source_type, content = extractor_registry.extract(link)
+        attributes["source_type"] = source_type
+        return source_type, content
+
+
+def format_source(source_type, content):
+    """
+        Formats an extracted source the way it is laid out in the prompt.
+
+        Args:
+            source_type (str): Either "forum" or "help", as returned by extract_source.
+            content (tuple): The extracted content, as returned by extract_source.
+
+        Returns:
+            str: The prompt section for the source.
+    """
+    section = ""
+    if source_type == "forum":
+        original_question, accepted_solutions = content
+        section += f"\n"
+        section += f"**Original question**: {original_question} \n"
+        section += f"\n**Accepted solution(s)** \n"
+        for solution in accepted_solutions:
+            section += solution.strip()
+        return section
+
+    text, images, videos = content
+    if text:
+        section += f"\n**Text from article**:\n"
+        section += text
+    if images:
+        section += f"\n**Link to images in article**:\n"
+        for img in images:
+            section += img
+            section += " "
+    if videos:
+        section += f"\n**Link to videos in article**:\n"
+        for vid in videos:
+            section += vid
+            section += " "
+    return section
+
+
+def extract_sources_concurrently(links, max_workers=None, link_timeout=None, deadline=None, extract=None, hedge=None,
+                                 timed_out=None):
+    """
+        Extracts all links in parallel on a thread pool.
+
+        A link still running after the HEDGE_PERCENTILE quantile of the recent extraction times is hedged: the same
+        extraction is started a second time and whichever run finishes first is kept. At most HEDGE_MAX links are
+        hedged per call, and only once HEDGE_MIN_SAMPLES extraction times were recorded.
+
+        Args:
+            links (list of str): The links to extract, in search-rank order.
+            max_workers (int): The number of links extracted at the same time. Defaults to one thread per link.
+            link_timeout (float): The number of seconds after which a single link is abandoned, counted from the
+                start of its extraction. Defaults to the EXTRACTION_LINK_TIMEOUT environment variable or 30.
+            deadline (float): The number of seconds after which all unfinished links are abandoned.
+                Defaults to the EXTRACTION_DEADLINE environment variable or 60, and never runs past the current
+                deadline.
+            extract (callable): Takes a link and returns its (source_type, content). Defaults to extract_source.
+            hedge (bool): Whether to hedge slow links. Defaults to the HEDGE_REQUESTS environment variable or on.
+            timed_out (list): If given, the links that did not finish in time are appended to it, in search-rank
+                order.
+
+        Returns:
+            list: One (source_type, content) tuple per link, in the same order as `links`. Links that failed or
+                did not finish in time are None.
+    """
+    if not links:
+        return []
+    max_workers = max_workers or len(links)
+    extract = extract or extract_source
+    link_timeout = link_timeout if link_timeout is not None else float(os.getenv("EXTRACTION_LINK_TIMEOUT", "30"))
+    deadline = deadline if deadline is not None else float(os.getenv("EXTRACTION_DEADLINE", "60"))
+    deadline = time_left(deadline)
+    hedge = hedge if hedge is not None else os.getenv("HEDGE_REQUESTS", "1") != "0"
+    hedge_delay = stage_metrics.quantile(HEDGE_STAGE, HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES) \
+        if hedge else None
+    timed_out = timed_out if timed_out is not None else []
+    late = set()
+
+    started = time.monotonic()
+    results = [None] * len(links)
+    # The hedges get their own threads, so they do not queue behind the runs they duplicate
+    executor = ThreadPoolExecutor(max_workers=max_workers + (HEDGE_MAX if hedge_delay is not None else 0),
+                                  thread_name_prefix="extract")
+    pending = {}
+    run_starts = {}
+
+    def submit(i):
+        # Run every extraction in a copy of the current context, so its spans are added to the caller's trace and
+        # its downloads stop at the caller's deadline
+        context = contextvars.copy_context()
+        run_start = {}
+
+        def run():
+            # The link_timeout of a run starts when it does, not while it waits for a free thread
+            run_start["time"] = time.monotonic()
+            return context.run(extract, links[i])
+
+        future = executor.submit(run)
+        pending[future] = i
+        run_starts[future] = run_start
+
+    try:
+        for i in range(len(links)):
+            submit(i)
+        hedged = set()
+        while pending:
+            # A run gets at most link_timeout seconds from its start, and never runs past the overall deadline. The
+            # runs still waiting for a thread start now at the earliest.
+            now = time.monotonic()
+            elapsed = now - started
+            first_timeout = min(run_starts[future].get("time", now) for future in pending) + link_timeout
+            timeout = max(0, min(first_timeout, started + deadline) - now)
+            if hedge_delay is not None and len(hedged) < HEDGE_MAX and hedge_delay > elapsed:
+                timeout = min(timeout, hedge_delay - elapsed)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                # Already abandoned when the other run of its link finished in the same wait
+                if future not in pending:
+                    continue
+                i = pending.pop(future)
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    logging.info(f"Extraction of {links[i]} failed: {e}")
+                    continue
+                # The first run of a link to succeed wins, the other one is abandoned
+                for other in [other for other, j in pending.items() if j == i]:
+                    other.cancel()
+                    del pending[other]
+
+            now = time.monotonic()
+            elapsed = now - started
+            if elapsed >= deadline:
+                late.update(pending.values())
+                break
+            # Abandon the runs past their link_timeout, a link times out once none of its runs is left
+            for future in [future for future in pending if run_starts[future].get("time", now) + link_timeout <= now]:
+                i = pending.pop(future)
+                if i not in pending.values():
+                    late.add(i)
+            if hedge_delay is not None and elapsed >= hedge_delay:
+                # Hedge the slowest links, in search-rank order
+                for i in sorted(set(pending.values()) - hedged)[:HEDGE_MAX - len(hedged)]:
+                    logging.info(f"Hedging the extraction of {links[i]} after {elapsed:.2f}s")
+                    hedged.add(i)
+                    submit(i)
+    finally:
+        # Do not wait for abandoned extractions, they finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+    for i in sorted(late):
+        logging.info(f"Extraction of {links[i]} timed out")
+        timed_out.append(links[i])
+    return results
+
+
+def ask_question_on_autodesk_and_generate_prompt(question, year=2024, max_workers=None, token_budget=None):
     """
        Generates a prompt using information from Autodesk Civil 3D documentation and forum based on a given question.
 
        Args:
            question (str): The question to search for.
+           year (int): The Civil 3D version to search the documentation of.
+           max_workers (int): The number of links extracted at the same time. 1 extracts them sequentially.
+           token_budget (int): The maximum number of tokens of source passages in the prompt, 0 for no limit.
+               Defaults to the PROMPT_TOKEN_BUDGET environment variable or 6000.
+
+       Returns:
+           str: The generated prompt with information from documentation and forum.
+       """
+    timed_out = []
+    sources, top_5_links = retrieve_sources(question, year=year, max_workers=max_workers, timed_out=timed_out)
+    return build_prompt(question, sources, token_budget=token_budget, timed_out=timed_out), top_5_links
+
+
+def retrieve_sources(question, year=2024, max_workers=None, extract=None, deadline=None, link_timeout=None,
+                     timed_out=None):
+    """
+       Searches the Autodesk Civil 3D documentation and forum for a question and extracts the top 5 results.
+
+       The search may use SEARCH_SHARE of the time left before the deadline and is retried while that lasts, when
+       it raises or returns SEARCH_FAILURE. The extraction may then use EXTRACTION_SHARE of the time left, the
+       results not extracted by then are None. Nothing is extracted if every search attempt failed.
+
+       Args:
+           question (str): The question to search for.
+           year (int): The Civil 3D version to search the documentation of.
+           max_workers (int): The number of links extracted at the same time. 1 extracts them sequentially.
+           extract (callable): Takes a link and returns its (source_type, content). Defaults to extract_source.
+           deadline (Deadline or float): The deadline of the whole answer, or its number of seconds from now.
+               Defaults to the current deadline, or the ANSWER_DEADLINE environment variable or 45 without one.
+           link_timeout (float): The number of seconds after which a single link is abandoned, see
+               extract_sources_concurrently.
+           timed_out (list): If given, the links that were not extracted in time are appended to it.
+
+       Returns:
+           tuple: A tuple containing:
+               - sources (list): One (source_type, content) tuple per link, None for links that failed. Empty if
+                 the search failed.
+               - top_5_links (list of str): The links, in search-rank order, or [SEARCH_FAILURE].
+
+       Raises:
+           BrowserBusyError: If the search needed a browser and all of them were busy.
+       """
+    if deadline is None:
+        deadline = current_deadline() or float(os.getenv("ANSWER_DEADLINE", "45"))
+    with deadline_scope(deadline) as deadline:
+        # Get the top 5 links, retrying right away while the search has time left
+        top_5_links = [SEARCH_FAILURE]
+        attempts = 0
+        max_attempts = 2
+        with deadline_scope(deadline.share(SEARCH_SHARE)) as search_deadline:
+            while attempts < max_attempts and not search_deadline.expired():
+                try:
+                    with span("get_top_5_links", year=year):
+                        top_5_links = get_top_5_links(search_query=question, year=year)
+                    if top_5_links != [SEARCH_FAILURE]:
+                        break
+                    # The live search reports its errors with the placeholder instead of raising
+                    error = SEARCH_FAILURE
+                except BrowserBusyError:
+                    raise
+                except Exception as e:
+                    top_5_links = [SEARCH_FAILURE]
+                    error = e
+                attempts += 1
+                logging.info(f"Top 5 links attempt {attempts} failed: {error}")
+        if top_5_links == [SEARCH_FAILURE]:
+            return [], top_5_links
+
+        # Extract their information concurrently
+        with deadline_scope(deadline.share(EXTRACTION_SHARE)):
+            sources = extract_sources_concurrently(top_5_links, max_workers=max_workers, link_timeout=link_timeout,
+                                                   extract=extract, timed_out=timed_out)
+    return sources, top_5_links
+
+
+def build_prompt(question, sources, token_budget=None, timed_out=None):
+    """
+       Structurally adds the extracted sources to the prompt in search-rank order.
+
+       Args:
+           question (str): The user's question.
+           sources (list): The (source_type, content) tuples returned by retrieve_sources. Sources that are None or
+               an extractor's failure placeholder are left out.
+           token_budget (int): The maximum number of tokens of source passages in the prompt, 0 for no limit.
+               Defaults to the PROMPT_TOKEN_BUDGET environment variable or 6000.
+           timed_out (list of str): The links that could not be retrieved in time, named in the prompt. The links
+               that failed for other reasons are left out silently.
 
        Returns:
            str: The generated prompt with information from documentation and forum.
@@ -272,56 +835,89 @@ def ask_question_on_autodesk_and_generate_prompt(question, year=2024):
     # Add the user question to the prompt
     prompt += f"Use the information given to answer this question: {question}"
 
-    # Get the top 5 links and iterate through them to extract their information then structurally
-    # adding the information into the prompt
-    retry = True
-    attempts = 0
-    max_attempts = 2
-    while retry and attempts < max_attempts:
-        try:
-            top_5_links = get_top_5_links(search_query=question, year=year)
-            retry = False  # If the function succeeds, stop retrying
-        except Exception as e:
-            attempts += 1
-            time.sleep(1)
-            logging.info(f"Top 5 links attempt {attempts} failed: {e}")
-            if attempts >= max_attempts:
-                logging.info("Max attempts reached. Exiting.")
-            else:
-                logging.info("Retrying...")
-    for link in top_5_links:
-        # Try to extract the page as if it's a forum page
-        try:
-            original_question, accepted_solutions = extract_forum_info(link)
-            if original_question == "Failed to retrieve the original question.":
-                raise Exception
-            prompt += f"\n"
-            prompt += f"**Original question**: {original_question} \n"
-            prompt += f"\n**Accepted solution(s)** \n"
-            for solution in accepted_solutions:
-                prompt += solution.strip()
-        # If the page does not contain forum information, extract it as a documentation page
-        except:
-            text, images, videos = extract_content_from_autodesk_help(link)
-            if text:
-                prompt += f"\n**Text from article**:\n"
-                prompt += text
-            if images:
-                prompt += f"\n**Link to images in article**:\n"
-                for img in images:
-                    prompt += img
-                    prompt += " "
-            if videos:
-                prompt += f"\n**Link to videos in article**:\n"
-                for vid in videos:
-                    prompt += vid
-                    prompt += " "
+    # The failure placeholders of the extractors are no information for the model
+    sources = [None if source is not None and is_failed_extraction(source[1]) else source for source in sources]
+
+    with span("prompt_assembly") as attributes:
+        # Keep only the passages most relevant to the question when the sources exceed the token budget
+        token_budget = token_budget if token_budget is not None else int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+        if token_budget > 0:
+            packed_sources, packing_stats = pack_sources(question, sources, token_budget)
+            tokens_before = count_tokens(assemble_prompt(prompt, sources))
+            prompt = assemble_prompt(prompt, packed_sources)
+            logging.info(f"Prompt tokens: {tokens_before} before packing, {count_tokens(prompt)} after packing "
+                         f"({packing_stats['passages_after']} of {packing_stats['passages_before']} passages kept)")
+        else:
+            prompt = assemble_prompt(prompt, sources)
+        # Tell the model which results were left out, so it does not take the sources for the complete picture
+        if timed_out:
+            prompt += ("\n\nThese search results could not be retrieved in time and were left out: "
+                       + ", ".join(timed_out))
+        attributes["sources"] = sum(source is not None for source in sources)
+        attributes["timed_out"] = len(timed_out or [])
+        attributes["characters"] = len(prompt)
+    # The full prompt is only logged at debug level, it is several thousand tokens long
+    logging.info(f"Prompt assembled from {attributes['sources']} of {len(sources)} sources, "
+                 f"{len(prompt)} characters")
+    logging.debug(prompt)
+    return prompt
+
+
+def assemble_prompt(prompt, sources):
+    """
+        Appends the extracted sources to the start of a prompt and cleans the result up.
+
+        Args:
+            prompt (str): The start of the prompt.
+            sources (list): The (source_type, content) tuples to append, None for sources to leave out.
+
+        Returns:
+            str: The complete prompt.
+    """
+    for source in sources:
+        if source is not None:
+            prompt += format_source(*source)
     prompt = prompt.replace("\xa0", " ")
     prompt = prompt.replace("\t", "")
     prompt = prompt.replace("Solved!\n\nGo to Solution.", "")
     prompt = prompt.replace("\n\n\n\n", "")
-    logging.info(prompt)
-    return prompt, top_5_links
+    return prompt
+
+def create_openai_client():
+    """
+        Creates an OpenAI client from the OPENAI_API_KEY environment variable.
+
+        The client also honours OPENAI_BASE_URL, which can point it at any OpenAI-compatible server.
+
+        Returns:
+            OpenAI: The client.
+    """
+    # Get the OpenAI API key from the environment variable
+    openai_key = os.getenv("OPENAI_API_KEY")
+    # Within a deadline a timed out request is not retried, the retry would not have any time left
+    max_retries = DEFAULT_MAX_RETRIES if current_deadline() is None else 0
+    return OpenAI(api_key=openai_key, max_retries=max_retries)
+
+
+def model_timeout():
+    """
+        Returns the timeout of a GPT-4o request: the time left before the current deadline, or the client's default
+        without one.
+    """
+    timeout = time_left()
+    return NOT_GIVEN if timeout is None else timeout
+
+
+def make_completion(completion_id, answer):
+    """
+        Wraps an answer that did not come from the model, e.g. a cached one, in a ChatCompletion.
+    """
+    return ChatCompletion(
+        id=completion_id, object="chat.completion", created=int(time.time()), model="gpt-4o",
+        choices=[Choice(index=0, finish_reason="stop",
+                        message=ChatCompletionMessage(role="assistant", content=answer))],
+    )
+
 
 def ask_gpt_4o(question, year="2024"):
     """
@@ -336,24 +932,154 @@ def ask_gpt_4o(question, year="2024"):
         Raises:
             Exception: If there is an issue with the API request.
         """
-    # Get the OpenAI API key from the environment variable
-    openai_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=openai_key)
-
-    prompt, top_5_links = ask_question_on_autodesk_and_generate_prompt(question=question, year=year)
-    # Generate the prompt using the provided question and send the request to the GPT-4o model
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-    )
+    timed_out = []
+    sources, top_5_links = retrieve_sources(question, year=year, timed_out=timed_out)
+
+    # Reuse the answer to the same question generated from the same sources
+    cached_answer = lookup_answer(question, year, sources)
+    if cached_answer is not None:
+        return make_completion("cached", cached_answer), top_5_links
+
+    prompt = build_prompt(question, sources, timed_out=timed_out)
+    response = generate_answer(prompt)
+    store_answer(question, year, sources, prompt, response.choices[0].message.content)
     return response, top_5_links
 
 
+def generate_answer(prompt):
+    """
+        Sends a prompt to the GPT-4o model and waits for the complete response, at most until the current deadline.
+
+        Args:
+            prompt (str): The prompt to send.
+
+        Returns:
+            ChatCompletion: The response from the GPT-4o model, or one answering ANSWER_TIMEOUT if it did not come
+                before the deadline.
+
+        Raises:
+            Exception: If there is an issue with the API request.
+    """
+    client = create_openai_client()
+    # Send the request to the GPT-4o model
+    with span("gpt_4o", stream=False) as attributes:
+        try:
+            return client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                timeout=model_timeout(),
+            )
+        except (APITimeoutError, httpx.TimeoutException) as e:
+            logging.info(f"GPT-4o did not answer in time: {e}")
+            attributes["timed_out"] = True
+            return make_completion("timeout", ANSWER_TIMEOUT)
+
+
+def lookup_answer(question, year, sources):
+    """
+        Looks up a cached answer to a question generated from the same sources.
+
+        Args:
+            question (str): The user's question.
+            year (int): The Civil 3D version.
+            sources (list): The sources returned by retrieve_sources.
+
+        Returns:
+            str: The cached answer, or None.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    return cache.get(question, year, source_fingerprint(sources))
+
+
+def store_answer(question, year, sources, prompt, answer):
+    """
+        Caches an answer with the number of tokens a later cache hit saves.
+
+        Args:
+            question (str): The user's question.
+            year (int): The Civil 3D version.
+            sources (list): The sources the answer was generated from.
+            prompt (str): The prompt sent to the model.
+            answer (str): The answer of the model. Answers cut short by the deadline are not cached.
+    """
+    cache = get_answer_cache()
+    if cache is None or not answer or answer.endswith(ANSWER_TIMEOUT):
+        return
+    cache.put(question, year, source_fingerprint(sources), answer,
+              tokens=count_tokens(prompt) + count_tokens(answer))
+
+
+def stream_gpt_4o(prompt, timings=None):
+    """
+        Sends a prompt to the GPT-4o model and yields the response text as it is generated.
+
+        The response is cut short at the current deadline, and ANSWER_TIMEOUT is yielded after what was generated
+        until then.
+
+        Args:
+            prompt (str): The prompt to send.
+            timings (dict): If given, filled with the time_to_first_token and generation_time in seconds, measured
+                from the moment the request is sent, and whether the response timed_out, once it is complete.
+
+        Yields:
+            str: The pieces of the response text, in order.
+
+        Raises:
+            Exception: If there is an issue with the API request.
+    """
+    timings = timings if timings is not None else {}
+    started = time.monotonic()
+    deadline = current_deadline()
+    with span("gpt_4o", stream=True) as attributes:
+        time_to_first_token = None
+        timed_out = False
+        try:
+            stream = create_openai_client().chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                stream=True,
+                timeout=model_timeout(),
+            )
+            for chunk in stream:
+                # The timeout bounds every read, not the whole response
+                if deadline is not None and deadline.expired():
+                    stream.close()
+                    timed_out = True
+                    break
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.monotonic() - started
+                        attributes["time_to_first_token"] = time_to_first_token
+                    yield content
+        except (APITimeoutError, httpx.TimeoutException) as e:
+            logging.info(f"GPT-4o did not answer in time: {e}")
+            timed_out = True
+        if timed_out:
+            attributes["timed_out"] = True
+            yield ("\n\n" if time_to_first_token is not None else "") + ANSWER_TIMEOUT
+
+    timings["time_to_first_token"] = time_to_first_token
+    timings["timed_out"] = timed_out
+    timings["generation_time"] = time.monotonic() - started
+    logging.info(f"GPT-4o time to first token: {time_to_first_token}s, "
+                 f"generation time: {timings['generation_time']:.2f}s")
+
+
 def main():
     # Initiate a container
     with st.container():
@@ -369,18 +1095,193 @@ def main():
         user_input = st.text_input("Please don't enter any sensitive information:")
         submit_button = st.button("Submit")
 
-        # Generate the prompt and inject it into GPT 4o
         if submit_button or user_input:
-            with st.spinner("Processing..."):
-                response, top_5_links = ask_gpt_4o(question=user_input, year=int(year_version))
-            # Display the generated response
-            st.write("These instructions are AI generated. Please proceed at your own risk")
-            st.subheader("Summarized troubleshooting steps", divider=True)
-            st.write(response.choices[0].message.content)
-            st.subheader("URLs to reference resources", divider = True)
-            st.write("This application uses OpenAI API to generate responses. OpenAI API does not train models on inputs and outputs")
-            for link in top_5_links:
-                st.write(link)
+            # Streamlit reruns the script on every interaction, reuse the answer this session already got
+            answers = st.session_state.setdefault("answers", {})
+            key = (normalize_query(user_input), int(year_version))
+            if key in answers:
+                show_answer(answers[key])
+                return
+            # Let the pre-warm crawler keep the sources of the question fresh
+            record_question(user_input, int(year_version))
+            # Give up on the sources that are not retrieved in time rather than keeping the user waiting
+            with start_trace("question") as trace, deadline_scope(float(os.getenv("ANSWER_DEADLINE", "45"))):
+                try:
+                    answers[key] = answer_question(user_input, int(year_version))
+                except BrowserBusyError as e:
+                    logging.info(f"Question turned away: {e}")
+                    st.warning(BUSY_MESSAGE)
+            while len(answers) > SESSION_ANSWERS:
+                answers.pop(next(iter(answers)))
+            if os.getenv("DEBUG_PANEL", "0") == "1":
+                show_trace(trace)
+
+
+def answer_question(user_input, year):
+    """
+        Answers a question on the page, sharing the work with every session asking the same question at that time.
+
+        The pipeline runs once for all the sessions asking the same question for the same version, on a thread of
+        its own (see produce_answer). Each session shows the answer on its own page as it is produced, so a session
+        rerunning or closing meanwhile does not affect the others.
+
+        Args:
+            user_input (str): The user's question.
+            year (int): The Civil 3D version.
+
+        Returns:
+            dict: The answer (str) and the top_5_links (list of str) it was generated from.
+
+        Raises:
+            BrowserBusyError: If the search needed a browser and all of them were busy.
+    """
+    streaming = os.getenv("STREAM_RESPONSES", "1") != "0"
+    with span("answer_question") as attributes:
+        progress, started = get_single_flight("questions").start(
+            (normalize_query(user_input), year), lambda progress: produce_answer(user_input, year, streaming, progress)
+        )
+        attributes["shared"] = not started
+        return show_progress(progress, streaming)
+
+
+def produce_answer(user_input, year, streaming, progress):
+    """
+        Runs the pipeline of a question without touching the page, for every session asking it.
+
+        Publishes ("links", top_5_links) once the sources are retrieved, then the answer: ("answer", text) if it
+        is complete at once, or ("chunk", text) for every part of it as it is generated followed by
+        ("timings", timings).
+
+        Args:
+            user_input (str): The user's question.
+            year (int): The Civil 3D version.
+            streaming (bool): Whether to stream the answer of GPT-4o.
+            progress (single_flight.Progress): Where the progress is published.
+    """
+    if not streaming:
+        response, top_5_links = ask_gpt_4o(question=user_input, year=year)
+        progress.publish(("links", top_5_links))
+        progress.publish(("answer", response.choices[0].message.content))
+        return
+
+    timed_out = []
+    sources, top_5_links = retrieve_sources(user_input, year=year, timed_out=timed_out)
+    progress.publish(("links", top_5_links))
+    answer = lookup_answer(user_input, year, sources)
+    if answer is not None:
+        progress.publish(("answer", answer))
+        return
+    prompt = build_prompt(user_input, sources, timed_out=timed_out)
+    timings = {}
+    chunks = []
+    for chunk in stream_gpt_4o(prompt, timings):
+        chunks.append(chunk)
+        progress.publish(("chunk", chunk))
+    store_answer(user_input, year, sources, prompt, "".join(chunks))
+    progress.publish(("timings", timings))
+
+
+def show_progress(progress, streaming):
+    """
+        Shows an answer on the page as produce_answer publishes it: the sources first, then the answer streamed
+        into the page, or everything at once when the answer is not streamed.
+
+        Returns:
+            dict: The answer (str) and the top_5_links (list of str) it was generated from.
+    """
+    events = iter(progress)
+    with st.spinner("Searching the Civil 3D documentation and forum..." if streaming else "Processing..."):
+        _, top_5_links = next(events)
+        if not streaming:
+            _, answer = next(events)
+    if not streaming:
+        result = {"answer": answer, "top_5_links": top_5_links}
+        show_answer(result)
+        return result
+
+    st.write("These instructions are AI generated. Please proceed at your own risk")
+    st.subheader("Summarized troubleshooting steps", divider=True)
+    # Reserve the place of the answer, so the sources are shown while it is being generated
+    answer_container = st.container()
+    show_links(top_5_links)
+
+    first = next(events)
+    if first[0] == "answer":
+        answer_container.write(first[1])
+        return {"answer": first[1], "top_5_links": top_5_links}
+
+    timings = {}
+
+    def chunks():
+        # The timings come last, right after the links if the model returned nothing
+        for kind, value in itertools.chain([first], events):
+            if kind == "timings":
+                timings.update(value)
+                return
+            yield value
+
+    answer = answer_container.write_stream(chunks())
+    if timings.get("time_to_first_token") is not None:
+        answer_container.caption(f"First words after {timings['time_to_first_token']:.1f}s, "
+                                 f"answer generated in {timings['generation_time']:.1f}s")
+    return {"answer": answer, "top_5_links": top_5_links}
+
+
+def show_answer(result):
+    """
+        Shows a finished answer with its sources.
+
+        Args:
+            result (dict): The answer and top_5_links, as returned by answer_question.
+    """
+    # Display the generated response
+    st.write("These instructions are AI generated. Please proceed at your own risk")
+    st.subheader("Summarized troubleshooting steps", divider=True)
+    st.write(result["answer"])
+    show_links(result["top_5_links"])
+
+
+def show_links(top_5_links):
+    st.subheader("URLs to reference resources", divider = True)
+    st.write("This application uses OpenAI API to generate responses. OpenAI API does not train models on inputs and outputs")
+    for link in top_5_links:
+        st.write(link)
+
+
+def show_trace(trace):
+    """
+        Shows the stages of a traced question as a waterfall, with the latency quantiles of every stage since the
+        app started. Enabled with DEBUG_PANEL=1.
+
+        Args:
+            trace (tracing.Trace): The trace of the question.
+    """
+    records = trace.to_records()
+    with st.expander("Request timings"):
+        if records:
+            import altair as alt
+            import pandas as pd
+
+            spans = pd.DataFrame([{
+                "stage": record["name"],
+                "url": record["attributes"].get("url", ""),
+                "start": record["start"],
+                "end": record["start"] + record["duration"],
+                "duration": record["duration"],
+                "status": record["status"],
+            } for record in records])
+            spans["label"] = spans["stage"] + " " + spans["url"].str.slice(0, 60)
+            chart = alt.Chart(spans).mark_bar().encode(
+                x=alt.X("start", title="Seconds since the question was asked"),
+                x2="end",
+                y=alt.Y("label", sort=None, title=None),
+                color="stage",
+                tooltip=["stage", "url", "duration", "status"],
+            )
+            st.altair_chart(chart, use_container_width=True)
+        st.dataframe(stage_metrics.summary())
 
 if __name__ == "__main__":
+    # Start the browsers in the background so the first question does not pay for the cold start
+    get_driver_pool(create_chrome_driver).warm_up(block=False)
     main()
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from search_cache import normalize_query
+from search_index import tokenize
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def source_fingerprint(sources):
+    """
+        Hashes the content of the retrieved sources, so that cached answers are invalidated when a source changes.
+
+        Args:
+            sources (list): The (source_type, content) tuples returned by extract_source, None for failed ones.
+
+        Returns:
+            str: The hexadecimal SHA-256 digest of the sources.
+    """
+    data = json.dumps(sources, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def question_similarity(first, second):
+    """
+        Returns the Jaccard similarity between the search terms of two questions, between 0 and 1.
+    """
+    first_terms, second_terms = set(tokenize(first)), set(tokenize(second))
+    if not first_terms or not second_terms:
+        return 0.0
+    return len(first_terms & second_terms) / len(first_terms | second_terms)
+
+
+class AnswerCache:
+    """
+        A bounded, least recently used cache of GPT-4o answers.
+
+        Answers are keyed by the normalized question, the Civil 3D version and the fingerprint of the sources the
+        answer was generated from. With a similarity threshold, a question that misses the exact key is also
+        answered by a cached question with the same version and sources whose terms are similar enough.
+
+        Args:
+            max_entries (int): The maximum number of answers kept.
+            similarity_threshold (float): The minimum Jaccard similarity of a near-duplicate question, 0 to only
+                reuse answers of identical normalized questions.
+    """
+
+    def __init__(self, max_entries=1000, similarity_threshold=0.0):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_duplicate_hits": 0, "misses": 0, "evictions": 0, "tokens_saved": 0}
+
+    @staticmethod
+    def key(question, year, fingerprint):
+        return (str(year), fingerprint, normalize_query(question))
+
+    def get(self, question, year, fingerprint):
+        """
+            Looks up the answer to a question generated from the same sources.
+
+            Args:
+                question (str): The user's question.
+                year (int): The Civil 3D version.
+                fingerprint (str): The source_fingerprint of the retrieved sources.
+
+            Returns:
+                str: The cached answer, or None.
+        """
+        key = self.key(question, year, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            counter = "hits"
+            if entry is None and self.similarity_threshold > 0:
+                best = max(
+                    ((question_similarity(question, cached_question), cached_key)
+                     for cached_key, (cached_question, _, _) in self._entries.items()
+                     if cached_key[:2] == key[:2]),
+                    default=(0.0, None),
+                )
+                if best[1] is not None and best[0] >= self.similarity_threshold:
+                    key = best[1]
+                    entry = self._entries[key]
+                    counter = "near_duplicate_hits"
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats[counter] += 1
+            self._stats["tokens_saved"] += entry[2]
+            return entry[1]
+
+    def put(self, question, year, fingerprint, answer, tokens=0):
+        """
+            Stores an answer, evicting the least recently used answers beyond max_entries.
+
+            Args:
+                question (str): The user's question.
+                year (int): The Civil 3D version.
+                fingerprint (str): The source_fingerprint of the sources the answer was generated from.
+                answer (str): The answer text.
+                tokens (int): The estimated prompt and completion tokens a cache hit saves.
+        """
+        key = self.key(question, year, fingerprint)
+        with self._lock:
+            self._entries[key] = (question, answer, tokens)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        """
+            Returns a snapshot of the cache statistics.
+
+            Returns:
+                dict: The exact and near-duplicate hits, misses, evictions, hit rate, estimated tokens saved and
+                    number of entries.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["near_duplicate_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["near_duplicate_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def get_answer_cache():
+    """
+        Returns the process-wide answer cache, creating it on first use.
+
+        The cache is configured through the ANSWER_CACHE_ENABLED (default 1), ANSWER_CACHE_SIZE (default 1000)
+        and ANSWER_CACHE_SIMILARITY (default 0, exact questions only) environment variables.
+
+        Returns:
+            AnswerCache: The shared cache, or None if caching is disabled.
+    """
+    global _cache
+    if os.getenv("ANSWER_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(
+                max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+                similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")),
+            )
+        return _cache
+
+
+def reset_answer_cache():
+    """
+        Forgets the process-wide cache so the next get_answer_cache() call reads the configuration again.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
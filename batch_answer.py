@@ -0,0 +1,295 @@
+"""
+    Answers a list of questions without the Streamlit interface, for example to pre-answer common support
+    questions.
+
+    The input is a JSONL file with one {"question": ..., "year": ...} object per line, optionally with an "id"
+    (defaults to the line number) and without "year" for the default version. Every answer is appended to the
+    output JSONL file as soon as it is ready, with the links it was generated from. The output file is also the
+    checkpoint: running the same command again skips the questions it already answers, so an interrupted run
+    resumes where it stopped.
+
+    Several questions are processed at the same time, and a link shared by several questions is only extracted
+    once per run. The links a question could not get the content of are listed as "dropped" in its result, and
+    --retry-failed answers such questions again like those that failed.
+
+    Usage:
+        python batch_answer.py questions.jsonl answers.jsonl --concurrency 8
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import Streamlit_app
+from deadline import Deadline, deadline_scope
+from page_cache import normalize_url
+from placeholders import is_failed_extraction
+from single_flight import SingleFlight
+
+# The number of seconds a question may take, including the wait for free fetch slots. Much longer than
+# ANSWER_DEADLINE, as nobody waits for the answer on a page.
+BATCH_DEADLINE = 600
+
+
+class FailedExtraction(Exception):
+    """
+        Raised by a shared extraction that returned a failure placeholder, so it is not remembered for the run.
+
+        Attributes:
+            result (tuple): The (source_type, content) returned by the extractor.
+    """
+
+    def __init__(self, result):
+        super().__init__(result[1][0])
+        self.result = result
+
+
+def read_questions(path, default_year=2024):
+    """
+        Reads the questions of a JSONL file.
+
+        Args:
+            path (str): The JSONL file, one object with a "question" and optionally an "id" and a "year" per line.
+            default_year (int): The Civil 3D version of questions without a year.
+
+        Yields:
+            dict: The id (str), question (str) and year (int) of every question, in file order.
+
+        Raises:
+            ValueError: If a line is not valid JSON or has no question.
+    """
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {number} of {path} is not valid JSON: {e}")
+            if not isinstance(record, dict) or not record.get("question"):
+                raise ValueError(f"Line {number} of {path} has no question")
+            yield {
+                "id": str(record.get("id", number)),
+                "question": record["question"],
+                "year": int(record.get("year", default_year)),
+            }
+
+
+def read_checkpoint(path, retry_failed=False):
+    """
+        Reads the ids already answered in an output file, and cuts off a last line left incomplete by a crash.
+
+        Args:
+            path (str): The output JSONL file, which may not exist yet.
+            retry_failed (bool): Whether questions that failed, or were answered without some of their links, are
+                answered again.
+
+        Returns:
+            set of str: The ids of the questions not to answer again.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    valid_bytes = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            valid_bytes += len(line)
+            if not (retry_failed and (record.get("error") or record.get("dropped"))):
+                done.add(record["id"])
+    if valid_bytes != os.path.getsize(path):
+        logging.info(f"Discarding the incomplete end of {path}")
+        with open(path, "r+b") as file:
+            file.truncate(valid_bytes)
+    return done
+
+
+class BatchAnswerer:
+    """
+        Answers questions with the app's pipeline, extracting every distinct link once.
+
+        Extractions of the same (normalized) link are shared while in flight and, unless they failed, remembered for
+        the rest of the run, so a link that failed once is extracted again for the next question. At most
+        max_fetches links are extracted at the same time across all questions.
+
+        Args:
+            max_fetches (int): The maximum number of links extracted at the same time.
+            memo_size (int): The number of extracted links remembered.
+            answer (bool): Whether to ask GPT-4o. If False only the prompts are generated.
+            deadline (float): The number of seconds a question may take, including the wait for fetch slots.
+            link_timeout (float): The number of seconds the extraction of a link may take once it has a fetch slot.
+                Defaults to the EXTRACTION_LINK_TIMEOUT environment variable or 30.
+    """
+
+    def __init__(self, max_fetches=10, memo_size=10000, answer=True, deadline=BATCH_DEADLINE, link_timeout=None):
+        self.answer = answer
+        self.deadline = deadline
+        self.link_timeout = link_timeout if link_timeout is not None \
+            else float(os.getenv("EXTRACTION_LINK_TIMEOUT", "30"))
+        self._extractions = SingleFlight(memo_size=memo_size)
+        self._fetch_slots = threading.BoundedSemaphore(max_fetches)
+
+    def extract(self, link):
+        """
+            Extracts a link like extract_source, sharing the result with every question that has the same link.
+        """
+        def fetch():
+            # The link timeout starts once the link has a slot, the wait for one only counts against the deadline
+            # of the question
+            with self._fetch_slots, deadline_scope(self.link_timeout):
+                result = Streamlit_app.extract_source(link)
+            if is_failed_extraction(result[1]):
+                raise FailedExtraction(result)
+            return result
+        try:
+            return self._extractions.do(normalize_url(link), fetch)
+        except FailedExtraction as e:
+            return e.result
+
+    def answer_question(self, item):
+        """
+            Answers one question.
+
+            Args:
+                item (dict): The id, question and year of the question, see read_questions.
+
+            Returns:
+                dict: The item with the answer (or the prompt if answering is disabled), the links the answer was
+                    generated from, the links left out because they could not be extracted, whether it came from
+                    the answer cache, the processing time in seconds, and an error message if the question failed.
+        """
+        started = time.monotonic()
+        result = dict(item)
+        try:
+            question, year = item["question"], item["year"]
+            deadline = Deadline(self.deadline)
+            # Abandoning links is left to the deadlines of fetch(), so the wait for a fetch slot does not count
+            timed_out = []
+            sources, top_5_links = Streamlit_app.retrieve_sources(question, year=year, extract=self.extract,
+                                                                  deadline=deadline, link_timeout=self.deadline,
+                                                                  timed_out=timed_out)
+            result["sources"] = top_5_links
+            if top_5_links == [Streamlit_app.SEARCH_FAILURE]:
+                raise Exception(Streamlit_app.SEARCH_FAILURE)
+            result["dropped"] = [
+                link for link, source in zip(top_5_links, sources)
+                if source is None or is_failed_extraction(source[1])
+            ]
+            cached_answer = Streamlit_app.lookup_answer(question, year, sources)
+            result["cached"] = cached_answer is not None
+            if cached_answer is not None:
+                result["answer"] = cached_answer
+            else:
+                prompt = Streamlit_app.build_prompt(question, sources, timed_out=timed_out)
+                if self.answer:
+                    with deadline_scope(deadline):
+                        response = Streamlit_app.generate_answer(prompt)
+                    if response.choices[0].message.content == Streamlit_app.ANSWER_TIMEOUT:
+                        # Recorded as a failure, so --retry-failed answers the question again
+                        raise TimeoutError(Streamlit_app.ANSWER_TIMEOUT)
+                    result["answer"] = response.choices[0].message.content
+                    Streamlit_app.store_answer(question, year, sources, prompt, result["answer"])
+                else:
+                    result["prompt"] = prompt
+        except Exception as e:
+            logging.info(f"Question {item['id']} failed: {e}")
+            result["error"] = str(e)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def stats(self):
+        """
+            Returns the number of distinct links extracted and of extractions saved by sharing them.
+        """
+        stats = self._extractions.stats()
+        return {"links_extracted": stats["calls"], "links_reused": stats["shared"] + stats["memo_hits"]}
+
+
+def run_batch(input_path, output_path, concurrency=4, max_fetches=10, answer=True, retry_failed=False,
+              default_year=2024, deadline=BATCH_DEADLINE):
+    """
+        Answers the questions of a JSONL file and appends the results to another, resuming an earlier run.
+
+        Args:
+            input_path (str): The questions, see read_questions.
+            output_path (str): The JSONL file the results are appended to, see BatchAnswerer.answer_question.
+            concurrency (int): The number of questions processed at the same time.
+            max_fetches (int): The maximum number of links extracted at the same time.
+            answer (bool): Whether to ask GPT-4o. If False only the prompts are written.
+            retry_failed (bool): Whether questions that failed, or were answered without some of their links, in an
+                earlier run are answered again.
+            default_year (int): The Civil 3D version of questions without a year.
+            deadline (float): The number of seconds a question may take, see BatchAnswerer.
+
+        Returns:
+            dict: The number of questions answered, answered without some of their links, skipped and failed, and
+                the link statistics.
+    """
+    done = read_checkpoint(output_path, retry_failed=retry_failed)
+    answerer = BatchAnswerer(max_fetches=max_fetches, answer=answer, deadline=deadline)
+    summary = {"answered": 0, "partial": 0, "skipped": 0, "failed": 0}
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor, \
+            open(output_path, "a", encoding="utf-8") as output:
+
+        def write_finished(return_when):
+            finished, _ = wait(pending, return_when=return_when)
+            for future in finished:
+                pending.remove(future)
+                result = future.result()
+                summary["failed" if "error" in result else "answered"] += 1
+                summary["partial"] += bool(result.get("dropped"))
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            # Every written line is a checkpoint
+            output.flush()
+            os.fsync(output.fileno())
+
+        for item in read_questions(input_path, default_year=default_year):
+            if item["id"] in done:
+                summary["skipped"] += 1
+                continue
+            done.add(item["id"])
+            # Keep a bounded number of questions queued, so a long file is not loaded at once
+            if len(pending) >= concurrency * 2:
+                write_finished(FIRST_COMPLETED)
+            pending.add(executor.submit(answerer.answer_question, item))
+        while pending:
+            write_finished(FIRST_COMPLETED)
+
+    summary.update(answerer.stats())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("output", help="JSONL file the answers are appended to, also used to resume")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions processed at the same time")
+    parser.add_argument("--max-fetches", type=int, default=10, help="Links extracted at the same time")
+    parser.add_argument("--year", type=int, default=2024, help="Civil 3D version of questions without a year")
+    parser.add_argument("--prompts-only", action="store_true", help="Write the prompts instead of asking GPT-4o")
+    parser.add_argument("--deadline", type=float, default=BATCH_DEADLINE,
+                        help="Seconds a question may take, including the wait for links to be extracted")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Answer questions that failed or left links out before again")
+    args = parser.parse_args()
+
+    summary = run_batch(
+        args.input, args.output, concurrency=args.concurrency, max_fetches=args.max_fetches,
+        answer=not args.prompts_only, retry_failed=args.retry_failed, default_year=args.year,
+        deadline=args.deadline,
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+    Compares the default and the lean browser mode on a local page built like the Autodesk search results and
+    help articles: a stylesheet with a web font, large images, a tracking script and the elements the scrapers
+    read. Reports the load time (until the scraped element is present) and the bytes transferred per page.
+
+    Needs Chrome, like the app.
+
+    Usage:
+        python bench_browser.py --pages 10 --latency 0.05
+"""
+import argparse
+import json
+import statistics
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from Streamlit_app import create_chrome_driver, page_weight
+from fixture_server import FixtureServer
+
+IMAGES = 8
+
+
+def fixture_routes(image_bytes=200 * 1024, font_bytes=100 * 1024):
+    """
+        Returns the routes of a search results page and a help article with their resources.
+    """
+    head = ("<head><link rel='stylesheet' href='/static/site.css'>"
+            "<script src='/static/analytics.js'></script></head>")
+    images = "".join(f"<img src='/static/image{i}.png'>" for i in range(IMAGES))
+    results = "".join(
+        f"<div class='results-item'><div class='results-item-title'><a href='/article{i}.htm'>Result {i}</a>"
+        f"</div></div>" for i in range(10)
+    )
+    routes = {
+        "/search.htm": f"<html>{head}<body>{images}<div class='results'>{results}</div></body></html>",
+        "/article.htm": (f"<html>{head}<body><div class='caas_body'><p>Corridor targets.</p>{images}</div>"
+                         f"</body></html>"),
+        "/static/site.css": (200, "text/css",
+                             "@font-face {font-family: Artifakt; src: url('/static/font.woff2');}"
+                             "body {font-family: Artifakt;}"),
+        "/static/font.woff2": (200, "font/woff2", b"\0" * font_bytes),
+        "/static/analytics.js": (200, "application/javascript", "window.tracked = true;" + " " * 50000),
+    }
+    for i in range(IMAGES):
+        routes[f"/static/image{i}.png"] = (200, "image/png", b"\0" * image_bytes)
+    return routes
+
+
+def load(driver, url, locator):
+    started = time.perf_counter()
+    driver.get(url)
+    WebDriverWait(driver, 30).until(EC.presence_of_element_located(locator))
+    seconds = time.perf_counter() - started
+    return seconds, page_weight(driver).get("bytes", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=10, help="Loads per page and mode")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before every response is served")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    pages = {"search": ("/search.htm", (By.CSS_SELECTOR, ".results-item .results-item-title a")),
+             "article": ("/article.htm", (By.CLASS_NAME, "caas_body"))}
+    results = {}
+    with FixtureServer(fixture_routes(), latency=args.latency) as server:
+        for mode, lean in (("default", False), ("lean", True)):
+            driver = create_chrome_driver(lean=lean)
+            try:
+                for name, (path, locator) in pages.items():
+                    # Query strings defeat the browser cache, like different search results would
+                    loads = [load(driver, server.url(f"{path}?load={i}"), locator) for i in range(args.pages)]
+                    results.setdefault(name, {})[mode] = {
+                        "median_load_ms": round(statistics.median(seconds for seconds, _ in loads) * 1000, 1),
+                        "median_bytes": statistics.median(weight for _, weight in loads),
+                    }
+            finally:
+                driver.quit()
+
+    for name, modes in results.items():
+        print(name)
+        for mode, result in modes.items():
+            print(f"    {mode:<8} {result['median_load_ms']:9.1f} ms {result['median_bytes']:>12,.0f} bytes")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+    Compares keeping a corpus of extracted pages in a JSON file, a pickle file and a CorpusStore: the size on
+    disk, the time to load it, the time to look pages up and the resident memory of the process afterwards.
+
+    Every storage is loaded in a fresh Python process, so the memory of one does not count for another. The
+    corpus is synthetic (see bench_search_index.synthetic_corpus), with half of the documentation pages repeated
+    for every supported version like the real documentation, with the same text but image URLs of their year.
+
+    Usage:
+        python bench_corpus_store.py --documents 20000 --lookups 1000
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_search_index import percentile, synthetic_corpus
+from corpus_store import CorpusStore
+
+STORAGES = ("json", "pickle", "store")
+
+
+def rss_mib():
+    """
+        Returns the resident set size of the process in MiB, or the peak where the current one is not available.
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as file:
+            return round(int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def write_corpus(records, directory):
+    """
+        Writes the records in every storage.
+
+        Returns:
+            dict: The path of every storage.
+    """
+    pages = {record["url"]: [record["source_type"], record["content"]] for record in records}
+    paths = {storage: os.path.join(directory, f"corpus.{storage}") for storage in STORAGES}
+    with open(paths["json"], "w", encoding="utf-8") as file:
+        json.dump(pages, file)
+    with open(paths["pickle"], "wb") as file:
+        pickle.dump(pages, file, protocol=pickle.HIGHEST_PROTOCOL)
+    with CorpusStore(paths["store"]) as store:
+        for url, (source_type, content) in pages.items():
+            store.put(url, source_type, content)
+    return paths
+
+
+def disk_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def load_and_look_up(storage, path, urls):
+    """
+        Loads a storage and looks the URLs up, in the current process.
+
+        Returns:
+            dict: The load time in milliseconds, the median and p99 lookup time in microseconds, the number of
+                pages found, and the RSS before loading and after the lookups in MiB.
+    """
+    rss_before = rss_mib()
+    started = time.perf_counter()
+    if storage == "json":
+        with open(path, encoding="utf-8") as file:
+            pages = json.load(file)
+        get = pages.get
+    elif storage == "pickle":
+        with open(path, "rb") as file:
+            pages = pickle.load(file)
+        get = pages.get
+    else:
+        store = CorpusStore(path)
+        get = store.get
+    load_seconds = time.perf_counter() - started
+
+    timings = []
+    found = 0
+    for url in urls:
+        started = time.perf_counter()
+        page = get(url)
+        timings.append(time.perf_counter() - started)
+        found += page is not None
+    return {
+        "load_ms": round(load_seconds * 1000, 2),
+        "lookup_p50_us": round(percentile(timings, 0.5) * 1e6, 1) if timings else None,
+        "lookup_p99_us": round(percentile(timings, 0.99) * 1e6, 1) if timings else None,
+        "found": found,
+        "rss_before_mib": rss_before,
+        "rss_after_mib": rss_mib(),
+    }
+
+
+def run_benchmark(documents=5000, lookups=1000, directory=None):
+    """
+        Writes a synthetic corpus in every storage and measures each one in a fresh process.
+
+        Args:
+            documents (int): The number of distinct documents of the synthetic corpus.
+            lookups (int): The number of random pages looked up after loading.
+            directory (str): Where to write the storages. Defaults to a temporary directory.
+
+        Returns:
+            dict: The settings, and the results of every storage including its size on disk.
+    """
+    records, _ = synthetic_corpus(documents)
+    urls = random.Random(0).choices([record["url"] for record in records], k=lookups)
+    with tempfile.TemporaryDirectory(dir=directory) as directory:
+        paths = write_corpus(records, directory)
+        urls_path = os.path.join(directory, "urls.json")
+        with open(urls_path, "w", encoding="utf-8") as file:
+            json.dump(urls, file)
+
+        results = {}
+        for storage in STORAGES:
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", storage, paths[storage], urls_path],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            results[storage] = json.loads(process.stdout.strip().splitlines()[-1])
+            results[storage]["disk_bytes"] = disk_bytes(paths[storage])
+            results[storage]["rss_mib"] = round(results[storage]["rss_after_mib"] - results[storage]["rss_before_mib"],
+                                                1)
+    return {"settings": {"documents": documents, "pages": len(records), "lookups": lookups}, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5000, help="Distinct documents of the synthetic corpus")
+    parser.add_argument("--lookups", type=int, default=1000, help="Random pages looked up after loading")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--child", nargs=3, metavar=("STORAGE", "PATH", "URLS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        storage, path, urls_path = args.child
+        with open(urls_path, encoding="utf-8") as file:
+            urls = json.load(file)
+        print(json.dumps(load_and_look_up(storage, path, urls)))
+        return
+
+    report = run_benchmark(documents=args.documents, lookups=args.lookups)
+    print(f"{report['settings']['pages']} pages, {args.lookups} lookups")
+    for storage, result in report["results"].items():
+        print(f"{storage:<7} {result['disk_bytes']:>12,} bytes  load {result['load_ms']:>9.1f} ms  "
+              f"lookup p50 {result['lookup_p50_us']:>7.1f} us  RSS +{result['rss_mib']:.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+    Benchmarks parsing forum threads with the single-pass parse_forum_page against the previous full-tree parse, for
+    every available BeautifulSoup backend, on small, medium and very large synthetic threads.
+
+    Usage:
+        python bench_forum_parser.py --repeat 5
+"""
+import argparse
+import json
+import time
+
+from bs4 import BeautifulSoup, NavigableString
+
+from Streamlit_app import FORUM_FAILURE, parse_forum_page
+
+THREAD_SIZES = {"small": 5, "medium": 100, "very_large": 1000}
+
+
+def legacy_parse_forum_page(page_source):
+    """
+        The forum parsing of extract_forum_info before the single-pass parser, kept as the reference implementation.
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
+    header = soup.find('h2', class_='PageTitle lia-component-common-widget-page-title').text.strip()
+    question = soup.find('div', itemprop='text').text.strip()
+    original_question = header + " " + question
+    comments = soup.find_all('div', class_='lia-message-body-content')
+    kudos_counts = [int(count.text) for count in
+                    soup.find_all('span', class_='MessageKudosCount lia-component-kudos-widget-message-kudos-count')]
+    list(zip(comments, kudos_counts))[1:]
+    accepted_solutions = []
+    for comment in soup.find_all('div', class_='lia-message-body-content')[1:]:
+        checkmark_div = comment.find('div', class_='lia-message-body-accepted-solution-checkmark')
+        if checkmark_div:
+            solution_container = checkmark_div.parent
+            iframe = solution_container.find('iframe')
+            link = iframe.get('src') if iframe else None
+            children = list(solution_container.children)
+            text_parts = []
+            for child in children:
+                if isinstance(child, NavigableString):
+                    text_parts.append(child.strip())
+                elif child.name not in ['iframe', 'br']:
+                    text_parts.append(child.text.strip())
+            if link:
+                iframe_index = -1
+                for i, child in enumerate(children):
+                    if child == iframe:
+                        iframe_index = i
+                        break
+                if iframe_index != -1:
+                    text_parts.insert(iframe_index + 1, f"\n\nLink: {link}\n\n")
+                else:
+                    text_parts.append(f"\n\nLink: {link}\n\n")
+            solution_text = ''.join(text_parts)
+            accepted_solutions.append(solution_text.strip().replace("\xa0", ""))
+    if not original_question:
+        original_question = FORUM_FAILURE
+    if not accepted_solutions:
+        accepted_solutions = ["No accepted solutions found."]
+    return original_question, accepted_solutions
+
+
+def synthetic_thread(replies, accepted_every=25):
+    """
+        Generates a forum thread with the markup of the Autodesk community pages, including the navigation, kudos
+        and sidebar markup that the extraction does not need.
+
+        Args:
+            replies (int): The number of replies.
+            accepted_every (int): Every accepted_every-th reply is an accepted solution.
+
+        Returns:
+            str: The HTML of the thread.
+    """
+    chrome = "".join(f"<li class='lia-nav-item'><a href='/t5/board/{i}'>Board {i}</a></li>" for i in range(50))
+    parts = [
+        "<html><head><title>Thread</title><script>var config = {};</script></head><body>",
+        f"<nav><ul>{chrome}</ul></nav>",
+        "<h2 class='PageTitle lia-component-common-widget-page-title'>Corridor region &amp; target problem</h2>",
+        "<div itemprop='text'><p>My corridor ignores the width targets&nbsp;after the second region.</p></div>",
+        "<div class='lia-message-body-content'><p>Original post body</p></div>",
+    ]
+    for i in range(1, replies + 1):
+        body = " ".join(f"Reply {i} sentence {j} about corridor targets and baselines." for j in range(8))
+        if i % accepted_every == 0:
+            parts.append(
+                "<div class='lia-message-body-content'>"
+                "<div class='lia-message-body-accepted-solution-checkmark'></div>"
+                f"Check the target mapping.<br/><iframe src='https://example.com/video{i}.mp4'></iframe>"
+                f"<p>{body}</p></div>"
+            )
+        else:
+            parts.append(f"<div class='lia-message-body-content'><p>{body}</p></div>")
+        parts.append(
+            "<div class='lia-message-footer'>"
+            f"<span class='MessageKudosCount lia-component-kudos-widget-message-kudos-count'>{i % 7}</span>"
+            f"<a class='lia-link' href='/t5/reply/{i}'>Reply</a><img src='/avatar/{i}.png'/></div>"
+        )
+    parts.append(f"<aside>{chrome}</aside></body></html>")
+    return "".join(parts)
+
+
+def available_parsers():
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        parsers.append("lxml")
+    except ImportError:
+        pass
+    return parsers
+
+
+def time_call(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one is reported")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for size, replies in THREAD_SIZES.items():
+        page = synthetic_thread(replies).encode("utf-8")
+        expected = legacy_parse_forum_page(page)
+        timings = {"legacy html.parser": time_call(lambda: legacy_parse_forum_page(page), args.repeat)}
+        for backend in available_parsers():
+            if parse_forum_page(page, parser=backend) != expected:
+                raise AssertionError(f"The {backend} backend returned a different result on the {size} thread")
+            timings[f"single-pass {backend}"] = time_call(lambda: parse_forum_page(page, parser=backend), args.repeat)
+        results[size] = {"replies": replies, "bytes": len(page),
+                         "milliseconds": {name: round(seconds * 1000, 2) for name, seconds in timings.items()}}
+        print(f"{size} ({replies} replies, {len(page) // 1024} KiB)")
+        for name, seconds in timings.items():
+            print(f"    {name:<24} {seconds * 1000:9.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+    Benchmarks the whole question pipeline offline: search, extraction of the top 5 results, prompt assembly and
+    the GPT-4o call, at several concurrency levels.
+
+    The Autodesk sites are replaced by a local AutodeskReplayServer replaying test_forum_page.txt,
+    test_help_page.txt and generated threads and articles, and OpenAI by a FakeOpenAIServer with configurable
+    latency. The browser search is replaced by a plain HTTP download of the local search results page, read with
+    the same CSS selector. The caches are disabled unless --caches is given.
+
+    Every run writes latency percentiles, throughput and peak RSS per scenario and concurrency level to a JSON
+    file. Pass the file of an earlier commit to --compare to print the change of every percentile.
+
+    Usage:
+        python bench_pipeline.py --questions 40 --concurrency 1 4 16 --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import patch
+from urllib.parse import quote
+
+from bs4 import BeautifulSoup
+
+import http_client
+import Streamlit_app
+from bench_forum_parser import synthetic_thread
+from bench_search_index import percentile
+from extractor_registry import extractor_registry
+from fixture_server import AutodeskReplayServer, FakeOpenAIServer
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+QUESTIONS = [
+    "How do I add a target to a corridor region?",
+    "Why does my dynamic block rotate grip move after stretching?",
+    "How do I create a profile view from a surface?",
+    "How can I edit pipe network parts in a profile view?",
+    "How do I label alignment stations?",
+    "Why are my feature lines not showing in the corridor?",
+    "How do I create a grading group?",
+    "How do I export a surface to LandXML?",
+]
+SCENARIOS = ("prompt", "answer")
+
+
+def generated_help_page(i):
+    """
+        Generates a documentation article file with a few paragraphs, images and a video.
+    """
+    paragraphs = "".join(
+        f"<p>Step {j} of article {i}: select the corridor, open the region properties and edit the targets "
+        f"of the baseline before rebuilding the corridor.</p>" for j in range(30)
+    )
+    return (f"<html><body><h1>Article {i}</h1>{paragraphs}<img src='../images/GUID-{i}.png'/>"
+            f"<video><source src='../videos/GUID-{i}.mp4'/></video></body></html>")
+
+
+def build_pages(forum_pages, help_pages):
+    """
+        Returns the forum threads and documentation articles the replay server serves, seeded with the recorded
+        test pages.
+    """
+    with open("test_forum_page.txt", encoding="utf-8") as file:
+        forums = [file.read()]
+    with open("test_help_page.txt", encoding="utf-8") as file:
+        helps = [file.read()]
+    forums += [synthetic_thread(replies=20 * (i + 1)) for i in range(forum_pages - 1)]
+    helps += [generated_help_page(i) for i in range(1, help_pages)]
+    return forums, helps
+
+
+def search_replay(server):
+    """
+        Returns a stand-in for search_autodesk_help that reads the links of the replay server's results page.
+    """
+    def search(search_query, year=2024):
+        response = http_client.fetch(server.url(f"/search?query={quote(search_query, safe='')}&year={year}"))
+        soup = BeautifulSoup(response.content, "html.parser")
+        links = [link.get("href") for link in soup.select(".results-item .results-item-title a")[:5]]
+        return links or [Streamlit_app.SEARCH_FAILURE]
+    return search
+
+
+@contextmanager
+def replay_routes():
+    """
+        Context manager routing the replay server's forum threads and articles like the real forum and
+        documentation hosts, and removing the routes from the process-wide registry again on exit.
+    """
+    extractor_registry.register(
+        "replay-forum", lambda url: Streamlit_app.extract_forum_info(url), hosts=["127.0.0.1"],
+        path_prefixes=["/t5/"], source_type="forum",
+        is_failure=lambda content: content[0] == Streamlit_app.FORUM_FAILURE,
+    )
+    extractor_registry.register(
+        "replay-help", lambda url: Streamlit_app.extract_content_from_autodesk_help(url), hosts=["127.0.0.1"],
+        path_prefixes=["/cloudhelp/"], source_type="help",
+        is_failure=lambda content: content[0] == Streamlit_app.HELP_FAILURE,
+    )
+    try:
+        yield
+    finally:
+        extractor_registry.unregister("replay-forum")
+        extractor_registry.unregister("replay-help")
+
+
+def peak_rss_mib():
+    """
+        Returns the peak resident set size of the process in MiB, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(scenario, questions, concurrency):
+    """
+        Answers the questions on `concurrency` threads and measures every call.
+
+        Args:
+            scenario (str): "prompt" for ask_question_on_autodesk_and_generate_prompt, "answer" for ask_gpt_4o.
+            questions (list of str): The questions to ask, one call each.
+            concurrency (int): The number of questions processed at the same time.
+
+        Returns:
+            dict: The number of requests and errors, the p50, p95, p99 and maximum latency in milliseconds, the
+                throughput in requests per second and the peak RSS in MiB.
+    """
+    def call(question):
+        started = time.perf_counter()
+        if scenario == "prompt":
+            Streamlit_app.ask_question_on_autodesk_and_generate_prompt(question, year=2024)
+        else:
+            Streamlit_app.ask_gpt_4o(question, year=2024)
+        return time.perf_counter() - started
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(call, question) for question in questions]:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"    {scenario} failed: {e}", file=sys.stderr)
+    wall_seconds = time.perf_counter() - started
+
+    result = {"requests": len(questions), "errors": errors,
+              "throughput_per_second": round(len(latencies) / wall_seconds, 2), "peak_rss_mib": peak_rss_mib()}
+    if latencies:
+        result.update({
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "max_ms": round(max(latencies) * 1000, 1),
+        })
+    return result
+
+
+def run_benchmark(questions=40, concurrency=(1, 4, 16), scenarios=SCENARIOS, forum_pages=10, help_pages=10,
+                  site_latency=0.02, first_token_delay=0.2, token_delay=0.005, caches=False):
+    """
+        Starts the local servers, points the app at them and runs every scenario at every concurrency level.
+
+        Args:
+            questions (int): The number of questions asked per scenario and concurrency level.
+            concurrency (iterable of int): The concurrency levels.
+            scenarios (iterable of str): The scenarios, see run_scenario.
+            forum_pages (int): The number of forum threads served.
+            help_pages (int): The number of documentation articles served.
+            site_latency (float): The seconds the replay server waits before every response.
+            first_token_delay (float): The seconds the fake OpenAI endpoint waits before answering.
+            token_delay (float): The seconds between two streamed tokens of the fake OpenAI endpoint.
+            caches (bool): Whether the page, search and answer caches are enabled. They are kept in a temporary
+                directory either way.
+
+        Returns:
+            dict: The settings and environment of the run, and the results keyed by scenario and concurrency level.
+    """
+    forums, helps = build_pages(forum_pages, help_pages)
+    answer = " ".join(["Open the corridor properties and add the target to the region."] * 20)
+    question_list = [QUESTIONS[i % len(QUESTIONS)] + ("" if i < len(QUESTIONS) else f" ({i})")
+                     for i in range(questions)]
+
+    with tempfile.TemporaryDirectory() as directory, \
+            AutodeskReplayServer(forums, helps, latency=site_latency) as site, \
+            FakeOpenAIServer(answer, first_token_delay=first_token_delay, token_delay=token_delay) as openai_server:
+        enabled = "1" if caches else "0"
+        environment = {
+            "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": openai_server.url("/v1"),
+            "PAGE_CACHE_ENABLED": enabled, "PAGE_CACHE_PATH": os.path.join(directory, "pages.sqlite3"),
+            "SEARCH_CACHE_ENABLED": enabled, "SEARCH_CACHE_PATH": os.path.join(directory, "search.sqlite3"),
+            "ANSWER_CACHE_ENABLED": enabled, "SEARCH_INDEX_ENABLED": "0",
+        }
+        results = {}
+        with replay_routes(), patch.dict(os.environ, environment), \
+                patch("Streamlit_app.search_autodesk_help", search_replay(site)):
+            for scenario in scenarios:
+                results[scenario] = {}
+                for level in concurrency:
+                    results[scenario][str(level)] = result = run_scenario(scenario, question_list, level)
+                    print(f"{scenario:<7} concurrency {level:>3}: p50 {result.get('p50_ms')} ms, "
+                          f"p95 {result.get('p95_ms')} ms, p99 {result.get('p99_ms')} ms, "
+                          f"{result['throughput_per_second']} req/s, peak RSS {result['peak_rss_mib']} MiB")
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"questions": questions, "forum_pages": forum_pages, "help_pages": help_pages,
+                     "site_latency": site_latency, "first_token_delay": first_token_delay,
+                     "token_delay": token_delay, "caches": caches},
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """
+        Returns the relative change of every latency percentile and of the throughput between two runs.
+
+        Returns:
+            list of str: One line per scenario, concurrency level and measurement present in both runs.
+    """
+    lines = []
+    for scenario, levels in current["results"].items():
+        for level, result in levels.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(level)
+            if not before:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_per_second"):
+                if before.get(key) and result.get(key) is not None:
+                    change = (result[key] - before[key]) / before[key] * 100
+                    lines.append(f"{scenario:<7} concurrency {level:>3} {key:<22} "
+                                 f"{before[key]:>9} -> {result[key]:>9} ({change:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=40, help="Questions per scenario and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--site-latency", type=float, default=0.02, help="Seconds before every page is served")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--caches", action="store_true", help="Enable the page, search and answer caches")
+    parser.add_argument("--output", default="bench_pipeline.json", help="The JSON file the results are written to")
+    parser.add_argument("--compare", help="The JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+    # Keep the per-page logging of the app out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = run_benchmark(
+        questions=args.questions, concurrency=args.concurrency, scenarios=args.scenarios,
+        site_latency=args.site_latency, first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+        caches=args.caches,
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        print(f"Compared with {args.compare} ({baseline.get('commit')}):")
+        for line in compare(baseline, report):
+            print(f"    {line}")
+
+
+if __name__ == "__main__":
+    main()
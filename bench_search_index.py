@@ -0,0 +1,92 @@
+"""
+    Benchmarks building and querying the local search index on a synthetic corpus, without any network access.
+
+    Usage:
+        python bench_search_index.py --documents 20000 --queries 1000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from search_index import SUPPORTED_YEARS, build_indexes
+
+
+def image_urls(year, document, count=3):
+    """
+        Returns the URLs of the images of a synthetic documentation page, which differ by year like the real ones.
+    """
+    return [f"https://help.autodesk.com/cloudhelp/{year}/ENU/Civil3D-UserGuide/images/GUID-{document}-{n}.png"
+            for n in range(count)]
+
+
+def synthetic_corpus(documents, vocabulary_size=20000, words_per_document=400, seed=0):
+    """
+        Generates help and forum records whose word frequencies follow a Zipf-like distribution.
+
+        Half of the documentation pages are repeated across every supported year, like the real documentation:
+        the same text with image URLs under the year's own path.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    records = []
+    for i in range(documents):
+        text = " ".join(rng.choices(vocabulary, weights=weights, k=words_per_document))
+        if i % 4 == 0:
+            records.append({"url": f"https://forums.autodesk.com/t5/thread/{i}", "source_type": "forum",
+                            "content": [text, []]})
+        elif i % 2:
+            for year in SUPPORTED_YEARS:
+                records.append({"url": f"https://help.autodesk.com/view/CIV3D/{year}/ENU/?guid=GUID-{i}",
+                                "source_type": "help", "content": [text, image_urls(year, i), []]})
+        else:
+            year = SUPPORTED_YEARS[i % len(SUPPORTED_YEARS)]
+            records.append({"url": f"https://help.autodesk.com/view/CIV3D/{year}/ENU/?guid=GUID-{i}",
+                            "source_type": "help", "content": [text, image_urls(year, i), []]})
+    queries = [" ".join(rng.choices(vocabulary[:2000], k=rng.randint(2, 8))) for _ in range(documents)]
+    return records, queries
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    records, queries = synthetic_corpus(args.documents)
+    started = time.perf_counter()
+    indexes = build_indexes(records)
+    build_seconds = time.perf_counter() - started
+
+    index = indexes[2024]
+    latencies = []
+    for query in queries[:args.queries]:
+        started = time.perf_counter()
+        index.search(query, k=5)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    results = {
+        "records": len(records),
+        "documents_per_year": {year: len(index) for year, index in indexes.items()},
+        "build_seconds": round(build_seconds, 3),
+        "query_ms_p50": round(percentile(latencies, 0.50), 3),
+        "query_ms_p95": round(percentile(latencies, 0.95), 3),
+        "query_ms_p99": round(percentile(latencies, 0.99), 3),
+        "query_ms_mean": round(statistics.mean(latencies), 3),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+from search_index import tokenize
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional, fall back to the ~4 characters per token rule of thumb
+    _encoding = None
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    """
+        Counts the tokens of a text with tiktoken when it is installed, or estimates them as 4 characters each.
+
+        Args:
+            text (str): The text to count.
+
+        Returns:
+            int: The number of tokens.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def split_passages(text, max_words=120):
+    """
+        Splits a text into passages of whole sentences with at most max_words words each.
+
+        A sentence longer than max_words becomes a passage of its own.
+
+        Args:
+            text (str): The text to split.
+            max_words (int): The maximum number of words of a passage.
+
+        Returns:
+            list of str: The passages, in order.
+    """
+    passages = []
+    current = []
+    current_words = 0
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        words = len(sentence.split())
+        if not words:
+            continue
+        if current and current_words + words > max_words:
+            passages.append(" ".join(current))
+            current, current_words = [], 0
+        current.append(sentence)
+        current_words += words
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def score_passages(question, passages):
+    """
+        Scores passages by the TF-IDF cosine similarity between each passage and the question.
+
+        Args:
+            question (str): The user's question.
+            passages (list of str): The passages to score.
+
+        Returns:
+            numpy.ndarray: One score between 0 and 1 per passage.
+    """
+    question_terms = Counter(tokenize(question))
+    if not passages or not question_terms:
+        return np.zeros(len(passages))
+
+    # Only the question's terms can contribute to the dot product, but the passage norms need all of their terms
+    vocabulary = {term: i for i, term in enumerate(question_terms)}
+    passage_counts = [Counter(tokenize(passage)) for passage in passages]
+    for counts in passage_counts:
+        for term in counts:
+            vocabulary.setdefault(term, len(vocabulary))
+
+    matrix = np.zeros((len(passages), len(vocabulary)))
+    for row, counts in enumerate(passage_counts):
+        for term, count in counts.items():
+            matrix[row, vocabulary[term]] = count
+    query = np.zeros(len(vocabulary))
+    for term, count in question_terms.items():
+        query[vocabulary[term]] = count
+
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(passages)) / (1 + document_frequency)) + 1
+    matrix = np.log1p(matrix) * idf
+    query = np.log1p(query) * idf
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1
+    return matrix @ query / norms
+
+
+def pack_sources(question, sources, token_budget, max_words=120):
+    """
+        Keeps the passages of the extracted sources most relevant to the question within a token budget.
+
+        The article text of documentation pages and the accepted solutions of forum threads are split into
+        passages, scored against the question and greedily packed, best first, until the budget is used. The
+        kept passages stay in their source and in their original order. The original question of a thread and
+        the image and video links of an article are kept as long as one passage of their source is. Sources whose
+        passages all fit are returned unchanged, and sources none of whose passages fit are dropped whole, e.g. a
+        thread none of whose solutions fit is dropped with its question.
+
+        Args:
+            question (str): The user's question.
+            sources (list): The (source_type, content) tuples returned by extract_source, or None for failed ones.
+            token_budget (int): The maximum number of tokens of the kept passages.
+            max_words (int): The maximum number of words of a passage.
+
+        Returns:
+            tuple: A tuple containing:
+                - packed_sources (list): The (source_type, content) tuples with only the kept passages, None for
+                  dropped sources.
+                - stats (dict): The number of passages and passage tokens before and after packing.
+    """
+    # Split every source into (source index, part index, passage) where a part is the article text or a solution
+    passages = []
+    for source_index, source in enumerate(sources):
+        if source is None:
+            continue
+        source_type, content = source
+        parts = content[1] if source_type == "forum" else [content[0]]
+        for part_index, part in enumerate(parts):
+            for passage in split_passages(part, max_words=max_words):
+                passages.append((source_index, part_index, passage))
+
+    texts = [passage for _, _, passage in passages]
+    tokens = [count_tokens(text) for text in texts]
+    scores = score_passages(question, texts)
+
+    # Greedy packing, best score first. Ties go to the higher-ranked source and the earlier passage.
+    selected = set()
+    used = 0
+    for i in sorted(range(len(passages)), key=lambda i: (-scores[i], passages[i][0], i)):
+        if used + tokens[i] <= token_budget:
+            selected.add(i)
+            used += tokens[i]
+
+    kept = {}
+    for i, (source_index, part_index, passage) in enumerate(passages):
+        part = kept.setdefault(source_index, {}).setdefault(part_index, [])
+        part.append(passage if i in selected else None)
+
+    packed_sources = []
+    for source_index, source in enumerate(sources):
+        parts = kept.get(source_index)
+        # Sources without passages (e.g. an article with only images) have nothing to pack
+        if source is None or parts is None:
+            packed_sources.append(source)
+            continue
+        if all(passage is not None for part in parts.values() for passage in part):
+            packed_sources.append(source)
+            continue
+
+        source_type, content = source
+        part_texts = {part_index: " ".join(passage for passage in part if passage is not None)
+                      for part_index, part in parts.items()}
+        part_texts = {part_index: text for part_index, text in part_texts.items() if text}
+        if not part_texts:
+            packed_sources.append(None)
+        elif source_type == "forum":
+            packed_sources.append(("forum", (content[0], [part_texts[i] for i in sorted(part_texts)])))
+        else:
+            packed_sources.append(("help", (part_texts[0], content[1], content[2])))
+
+    stats = {
+        "passages_before": len(passages),
+        "passages_after": len(selected),
+        "passage_tokens_before": sum(tokens),
+        "passage_tokens_after": used,
+    }
+    return packed_sources, stats
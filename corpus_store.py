@@ -0,0 +1,499 @@
+"""
+    A compact on-disk store of extracted pages, for corpora too large to keep as JSONL or in memory.
+
+    The documentation of every Civil 3D version is mostly the same text under a different URL, with links to
+    images and videos that often differ by year. So each part of a page (its text, each list of URLs, the question
+    and solutions of a forum thread) is a record of its own, stored once per distinct content whatever the URL or
+    year, and a page is a small record with its source type and the ids of its parts. A store is a directory
+    holding:
+
+        CURRENT                 The name of the current generation directory.
+        generation-N/
+            segment-M.log       Append-only segments of zlib-compressed records, each prefixed with its length
+                                and CRC32.
+            records.idx         One fixed-size entry per record: its segment, offset, length and content hash.
+                                The record id is the position of the entry.
+            urls.idx            An open-addressing hash table of the URL hashes and the record ids of their
+                                pages.
+            urls.log            The URLs and the record ids of their pages, in the order they were stored.
+
+    Both index files are memory-mapped, so a page is read through the URL table and the index without loading the
+    corpus. Storing a URL again with new content leaves the old records behind until compact() rewrites the live
+    records into the next generation.
+
+    Usage:
+        python corpus_store.py convert corpus.jsonl corpus_store
+        python corpus_store.py stats corpus_store
+        python corpus_store.py compact corpus_store
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+from page_cache import normalize_url
+
+FRAME_HEADER = struct.Struct("<II")  # Compressed length, CRC32 of the compressed bytes
+INDEX_ENTRY = struct.Struct("<IQI20s")  # Segment, offset, frame length, SHA-1 of the uncompressed record
+TABLE_HEADER = struct.Struct("<8sQQ")  # Magic, number of slots, used slots
+SLOT = struct.Struct("<QI")  # URL hash (0 for an empty slot), record id
+TABLE_MAGIC = b"C3DURLS1"
+# The URL table is doubled once more than half of its slots are used
+MAX_LOAD = 0.5
+MIN_SLOTS = 1024
+
+
+class CorpusStore:
+    """
+        Stores the (source_type, content) of pages by URL, see the module documentation.
+
+        A store is written by one process at a time. Other processes can read it at the same time and see the
+        records added after they opened it once they call refresh().
+
+        Args:
+            directory (str): The store directory, created if needed.
+            max_segment_bytes (int): The size after which records go into a new segment.
+            compression_level (int): The zlib compression level of the records.
+    """
+
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024, compression_level=6):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.compression_level = compression_level
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        current = os.path.join(directory, "CURRENT")
+        if not os.path.exists(current):
+            self._set_current("generation-000000")
+        with open(current, encoding="utf-8") as file:
+            self._open(file.read().strip())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """
+            Returns the number of URLs stored.
+        """
+        with self._lock:
+            return TABLE_HEADER.unpack_from(self._table, 0)[2]
+
+    def put(self, url, source_type, content):
+        """
+            Stores the content of a page, replacing what was stored for the URL.
+
+            Args:
+                url (str): The URL of the page. Trivially different URLs are stored as one, see normalize_url.
+                source_type (str): Either "forum" or "help".
+                content (list or tuple): The result of the extractor.
+
+            Returns:
+                bool: Whether any part of the content was new, False if every part was already stored for any URL.
+        """
+        with self._lock:
+            part_ids = []
+            new = False
+            for part in content:
+                part_id, stored = self._store(part)
+                part_ids.append(part_id)
+                new |= stored
+            record_id, stored = self._store([source_type, part_ids])
+            new |= stored
+            if self._set_url(url_hash(normalize_url(url)), record_id):
+                self._urls_log.write(json.dumps([url, record_id]).encode("utf-8") + b"\n")
+                self._urls_log.flush()
+        return new
+
+    def get(self, url):
+        """
+            Returns the (source_type, content) stored for a URL, or None.
+
+            Raises:
+                ValueError: If the record is corrupt.
+        """
+        with self._lock:
+            _, record_id = self._find(url_hash(normalize_url(url)))
+            if record_id is None:
+                return None
+            return self._read_page(record_id)
+
+    def __contains__(self, url):
+        with self._lock:
+            return self._find(url_hash(normalize_url(url)))[1] is not None
+
+    def items(self):
+        """
+            Yields every stored page as a record like those of a JSONL corpus: a dict with its "url",
+            "source_type" and "content".
+        """
+        with self._lock:
+            urls = self._latest_urls()
+        for url, record_id in urls.items():
+            with self._lock:
+                source_type, content = self._read_page(record_id)
+            yield {"url": url, "source_type": source_type, "content": list(content)}
+
+    def stats(self):
+        """
+            Returns the size of the store.
+
+            Returns:
+                dict: The number of URLs, of distinct records (pages and their parts) and of the records still
+                    referenced by a URL, the number of segments, and the bytes of the segments and of the two index
+                    files.
+        """
+        with self._lock:
+            pages = {record_id for _, record_id in self._slots()}
+            live = pages.union(*(self._read(record_id)[1] for record_id in pages))
+            segment_bytes = sum(os.path.getsize(self._file(segment_name(segment))) for segment in self._segments)
+            return {
+                "urls": len(self),
+                "records": self._record_count,
+                "live_records": len(live),
+                "segments": len(self._segments),
+                "segment_bytes": segment_bytes,
+                "index_bytes": os.path.getsize(self._file("records.idx")) + os.path.getsize(self._file("urls.idx")),
+            }
+
+    def compact(self):
+        """
+            Rewrites the records still referenced by a URL into a new generation and deletes the old one.
+
+            Returns:
+                dict: The stats before and after.
+        """
+        with self._lock:
+            before = self.stats()
+            self._flush()
+            old_directory = self._path
+            old = CorpusStore(self.directory, max_segment_bytes=self.max_segment_bytes)
+            try:
+                generation = f"generation-{int(self.generation.split('-')[1]) + 1:06d}"
+                shutil.rmtree(os.path.join(self.directory, generation), ignore_errors=True)
+                self._close()
+                self._open(generation)
+                # Copy the compressed parts as they are and rewrite the pages with their new ids, in the order
+                # of their URLs
+                copied = {}
+                pages = {}
+                for url, old_id in old._latest_urls().items():
+                    if old_id not in pages:
+                        source_type, part_ids = old._read(old_id)
+                        for part_id in part_ids:
+                            if part_id not in copied:
+                                copied[part_id] = self._copy(old, part_id)
+                        pages[old_id] = self._store([source_type, [copied[part_id] for part_id in part_ids]])[0]
+                    self._set_url(url_hash(normalize_url(url)), pages[old_id])
+                    self._urls_log.write(json.dumps([url, pages[old_id]]).encode("utf-8") + b"\n")
+                self._flush(sync=True)
+            finally:
+                old.close()
+            self._set_current(generation)
+            shutil.rmtree(old_directory, ignore_errors=True)
+            return {"before": before, "after": self.stats()}
+
+    def refresh(self):
+        """
+            Picks up the records added and the compactions done by another process since the store was opened.
+        """
+        with self._lock:
+            with open(os.path.join(self.directory, "CURRENT"), encoding="utf-8") as file:
+                generation = file.read().strip()
+            self._close()
+            self._open(generation)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self, generation):
+        self.generation = generation
+        self._path = os.path.join(self.directory, generation)
+        os.makedirs(self._path, exist_ok=True)
+        self._segments = sorted(int(name[8:-4]) for name in os.listdir(self._path)
+                                if name.startswith("segment-") and name.endswith(".log")) or [0]
+        self._recover()
+        self._segment_file = open(self._file(segment_name(self._segments[-1])), "ab")
+        self._index_file = open(self._file("records.idx"), "ab")
+        self._record_count = self._index_file.tell() // INDEX_ENTRY.size
+        # Mapped now, so readers keep their generation after a compaction deletes its files
+        self._index_map = map_file(self._file("records.idx"))
+        self._segment_maps = {segment: map_file(self._file(segment_name(segment))) for segment in self._segments}
+        self._digests = None
+        if not os.path.exists(self._file("urls.idx")):
+            write_table(self._file("urls.idx"), MIN_SLOTS, [])
+        self._table_file = open(self._file("urls.idx"), "r+b")
+        self._table = mmap.mmap(self._table_file.fileno(), 0)
+        self._urls_log = open(self._file("urls.log"), "ab")
+
+    def _recover(self):
+        """
+            Drops the index entries of records that did not fully reach their segment before a crash.
+        """
+        path = self._file("records.idx")
+        with open(path, "a+b") as file:
+            count = file.seek(0, os.SEEK_END) // INDEX_ENTRY.size
+            while count:
+                file.seek((count - 1) * INDEX_ENTRY.size)
+                segment, offset, length, _ = INDEX_ENTRY.unpack(file.read(INDEX_ENTRY.size))
+                segment_path = self._file(segment_name(segment))
+                if os.path.exists(segment_path) and offset + length <= os.path.getsize(segment_path):
+                    break
+                count -= 1
+            file.truncate(count * INDEX_ENTRY.size)
+
+    def _close(self):
+        for resource in [self._table, self._index_map, *self._segment_maps.values()]:
+            if resource is not None:
+                resource.close()
+        self._segment_maps = {}
+        self._index_map = None
+        for file in (self._segment_file, self._index_file, self._table_file, self._urls_log):
+            file.close()
+
+    def _flush(self, sync=False):
+        for file in (self._segment_file, self._index_file, self._urls_log):
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+        self._table.flush()
+
+    def _file(self, name):
+        return os.path.join(self._path, name)
+
+    def _set_current(self, generation):
+        path = os.path.join(self.directory, "CURRENT")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(generation)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _append(self, frame, digest):
+        """
+            Appends a frame to the current segment and indexes it.
+
+            Returns:
+                int: The id of the new record.
+        """
+        if self._segment_file.tell() and self._segment_file.tell() + len(frame) > self.max_segment_bytes:
+            self._segment_file.close()
+            self._segments.append(self._segments[-1] + 1)
+            self._segment_file = open(self._file(segment_name(self._segments[-1])), "ab")
+        offset = self._segment_file.tell()
+        self._segment_file.write(frame)
+        self._segment_file.flush()
+        # The entry is written after its record, so a crash in between leaves no entry pointing to nothing
+        self._index_file.write(INDEX_ENTRY.pack(self._segments[-1], offset, len(frame), digest))
+        self._index_file.flush()
+        record_id = self._record_count
+        self._record_count += 1
+        if self._digests is not None:
+            self._digests[digest] = record_id
+        return record_id
+
+    def _store(self, value):
+        """
+            Stores a JSON value unless the same value is already stored.
+
+            Returns:
+                tuple: The record id of the value, and whether it was new.
+        """
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha1(data).digest()
+        record_id = self._load_digests().get(digest)
+        if record_id is not None:
+            return record_id, False
+        compressed = zlib.compress(data, self.compression_level)
+        return self._append(FRAME_HEADER.pack(len(compressed), zlib.crc32(compressed)) + compressed, digest), True
+
+    def _copy(self, other, record_id):
+        """
+            Copies a compressed record of another store, unless the same value is already stored.
+
+            Returns:
+                int: The record id of the value in this store.
+        """
+        digest = other._entry(record_id)[3]
+        existing = self._load_digests().get(digest)
+        return existing if existing is not None else self._append(other._frame(record_id), digest)
+
+    def _load_digests(self):
+        """
+            Returns the record id of every content hash, read from the index on the first write.
+        """
+        if self._digests is None:
+            self._digests = {}
+            for record_id in range(self._record_count):
+                self._digests.setdefault(self._entry(record_id)[3], record_id)
+        return self._digests
+
+    def _entry(self, record_id):
+        end = (record_id + 1) * INDEX_ENTRY.size
+        if self._index_map is None or len(self._index_map) < end:
+            if self._index_map is not None:
+                self._index_map.close()
+            self._index_map = map_file(self._file("records.idx"))
+        return INDEX_ENTRY.unpack_from(self._index_map, record_id * INDEX_ENTRY.size)
+
+    def _frame(self, record_id):
+        segment, offset, length, _ = self._entry(record_id)
+        segment_map = self._segment_maps.get(segment)
+        if segment_map is None or len(segment_map) < offset + length:
+            if segment_map is not None:
+                segment_map.close()
+            segment_map = self._segment_maps[segment] = map_file(self._file(segment_name(segment)))
+        return segment_map[offset:offset + length]
+
+    def _read(self, record_id):
+        frame = self._frame(record_id)
+        length, crc = FRAME_HEADER.unpack_from(frame, 0)
+        compressed = frame[FRAME_HEADER.size:FRAME_HEADER.size + length]
+        if len(compressed) != length or zlib.crc32(compressed) != crc:
+            raise ValueError(f"Record {record_id} of {self._path} is corrupt")
+        return json.loads(zlib.decompress(compressed))
+
+    def _read_page(self, record_id):
+        source_type, part_ids = self._read(record_id)
+        return source_type, tuple(self._read(part_id) for part_id in part_ids)
+
+    def _find(self, key):
+        """
+            Returns the slot of a URL hash and its record id, or the empty slot it would go into and None.
+        """
+        slots = TABLE_HEADER.unpack_from(self._table, 0)[1]
+        slot = key & (slots - 1)
+        while True:
+            stored_key, record_id = SLOT.unpack_from(self._table, TABLE_HEADER.size + slot * SLOT.size)
+            if stored_key == key:
+                # Ignore a record lost in a crash after the table was updated
+                return slot, record_id if record_id < self._record_count else None
+            if stored_key == 0:
+                return slot, None
+            slot = (slot + 1) & (slots - 1)
+
+    def _set_url(self, key, record_id):
+        """
+            Points a URL hash to a record.
+
+            Returns:
+                bool: Whether the URL pointed to another record, or to none.
+        """
+        slot, current = self._find(key)
+        if current == record_id:
+            return False
+        magic, slots, used = TABLE_HEADER.unpack_from(self._table, 0)
+        if SLOT.unpack_from(self._table, TABLE_HEADER.size + slot * SLOT.size)[0] == 0:
+            if used + 1 > slots * MAX_LOAD:
+                self._grow(slots * 2)
+                return self._set_url(key, record_id)
+            TABLE_HEADER.pack_into(self._table, 0, magic, slots, used + 1)
+        SLOT.pack_into(self._table, TABLE_HEADER.size + slot * SLOT.size, key, record_id)
+        return True
+
+    def _slots(self):
+        slots = TABLE_HEADER.unpack_from(self._table, 0)[1]
+        for slot in range(slots):
+            key, record_id = SLOT.unpack_from(self._table, TABLE_HEADER.size + slot * SLOT.size)
+            if key and record_id < self._record_count:
+                yield key, record_id
+
+    def _grow(self, slots):
+        path = self._file("urls.idx")
+        write_table(path + ".tmp", slots, list(self._slots()))
+        self._table.close()
+        self._table_file.close()
+        os.replace(path + ".tmp", path)
+        self._table_file = open(path, "r+b")
+        self._table = mmap.mmap(self._table_file.fileno(), 0)
+
+    def _latest_urls(self):
+        """
+            Returns the record id of every URL, from the log checked against the table. Of trivially different
+            URLs, the last one stored is returned.
+        """
+        self._urls_log.flush()
+        urls = {}
+        with open(self._file("urls.log"), "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                url, record_id = json.loads(line)
+                urls[normalize_url(url)] = (url, record_id)
+        return {url: record_id for key, (url, record_id) in urls.items() if self._find(url_hash(key))[1] == record_id}
+
+
+def url_hash(url):
+    """
+        Returns the non-zero 64-bit hash of a normalized URL.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def segment_name(segment):
+    return f"segment-{segment:06d}.log"
+
+
+def map_file(path):
+    """
+        Maps a file read-only, or returns None if it is empty.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_table(path, slots, entries):
+    """
+        Writes a URL table with a number of slots (a power of 2) and the given (url hash, record id) entries.
+    """
+    table = bytearray(TABLE_HEADER.size + slots * SLOT.size)
+    TABLE_HEADER.pack_into(table, 0, TABLE_MAGIC, slots, len(entries))
+    for key, record_id in entries:
+        slot = key & (slots - 1)
+        while SLOT.unpack_from(table, TABLE_HEADER.size + slot * SLOT.size)[0]:
+            slot = (slot + 1) & (slots - 1)
+        SLOT.pack_into(table, TABLE_HEADER.size + slot * SLOT.size, key, record_id)
+    with open(path, "wb") as file:
+        file.write(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Add the records of a JSONL corpus file to a store")
+    convert_parser.add_argument("corpus", help="The JSONL corpus file, see search_index.py ingest")
+    convert_parser.add_argument("store", help="The store directory")
+    stats_parser = subparsers.add_parser("stats", help="Print the size of a store")
+    stats_parser.add_argument("store", help="The store directory")
+    compact_parser = subparsers.add_parser("compact", help="Drop the records no URL points to any more")
+    compact_parser.add_argument("store", help="The store directory")
+    args = parser.parse_args(argv)
+
+    with CorpusStore(args.store) as store:
+        if args.command == "convert":
+            new = 0
+            with open(args.corpus, encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        new += store.put(record["url"], record["source_type"], record["content"])
+            print(f"Stored {new} new records")
+        elif args.command == "compact":
+            result = store.compact()
+            print(json.dumps(result, indent=2))
+            return
+        print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
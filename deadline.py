@@ -0,0 +1,86 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+class Deadline:
+    """
+        A point in time by which an operation must be done.
+
+        Args:
+            seconds (float): The number of seconds from now.
+            parent (Deadline): An enclosing deadline this one never extends past.
+    """
+
+    def __init__(self, seconds, parent=None):
+        self.expires_at = time.monotonic() + max(0.0, seconds)
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+
+    def remaining(self):
+        """
+            Returns the number of seconds left, 0 once the deadline has passed.
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def share(self, fraction):
+        """
+            Returns a deadline for a stage that may use a fraction of the time left.
+        """
+        return Deadline(self.remaining() * fraction, parent=self)
+
+
+def current_deadline():
+    """
+        Returns the deadline of the current context, or None.
+    """
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """
+        Context manager making a deadline the current one for the enclosed code, including the threads started with
+        a copy of the context.
+
+        Args:
+            deadline (Deadline or float): The deadline, or its number of seconds from now. It never extends past
+                the enclosing deadline.
+
+        Yields:
+            Deadline: The current deadline.
+    """
+    parent = _current_deadline.get()
+    if not isinstance(deadline, Deadline):
+        deadline = Deadline(deadline, parent=parent)
+    elif parent is not None:
+        deadline = Deadline(deadline.remaining(), parent=parent)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def time_left(default=None):
+    """
+        Bounds a wait or timeout by the current deadline.
+
+        Args:
+            default (float): The wait without a deadline, None for no limit.
+
+        Returns:
+            float: The default, or the seconds left before the current deadline if that is shorter. None if there is
+                neither a default nor a deadline.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    if default is None:
+        return deadline.remaining()
+    return min(default, deadline.remaining())
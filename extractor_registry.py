@@ -0,0 +1,187 @@
+import logging
+import threading
+from urllib.parse import urlparse
+
+
+class ExtractorRoute:
+    """
+        A registered extractor and the URLs it handles.
+
+        Attributes:
+            name (str): The route name.
+            extractor (callable): Takes a URL and returns the extracted content.
+            hosts (tuple of str): The hosts the route handles. Subdomains match too. Empty for the default route.
+            path_prefixes (tuple of str): If not empty, the URL path must start with one of these prefixes.
+            is_failure (callable): Takes the extracted content and returns True if the extraction failed.
+            fallback (str): The name of the route to try when this route's extraction fails, if any.
+            source_type (str): The type of the content the extractor returns (e.g. "forum" or "help").
+    """
+
+    def __init__(self, name, extractor, hosts=(), path_prefixes=(), is_failure=None, fallback=None,
+                 source_type=None):
+        self.name = name
+        self.source_type = source_type or name
+        self.extractor = extractor
+        self.hosts = tuple(host.lower() for host in hosts)
+        self.path_prefixes = tuple(path_prefixes)
+        self.is_failure = is_failure or (lambda content: False)
+        self.fallback = fallback
+
+    def matches(self, host, path):
+        """
+            Checks whether the route handles a URL.
+
+            Args:
+                host (str): The lower-cased host of the URL.
+                path (str): The path of the URL.
+
+            Returns:
+                bool: True if the host (or one of its parent domains) and the path prefix match.
+        """
+        if not any(host == h or host.endswith("." + h) for h in self.hosts):
+            return False
+        return not self.path_prefixes or path.startswith(self.path_prefixes)
+
+
+class ExtractorRegistry:
+    """
+        Routes URLs to the extractor registered for their host and path, and counts per-route hits and misses.
+
+        A miss is an extraction that ran on the route but failed, which usually means the page was misrouted.
+        URLs that match no route go to the default route.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._default = None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, extractor, hosts=(), path_prefixes=(), is_failure=None, fallback=None,
+                 source_type=None, default=False):
+        """
+            Registers an extractor, replacing any route with the same name but keeping its statistics.
+
+            Routes are matched in registration order.
+
+            Args:
+                name (str): The route name.
+                extractor (callable): Takes a URL and returns the extracted content.
+                hosts (iterable of str): The hosts the route handles.
+                path_prefixes (iterable of str): Optional URL path prefixes the route is restricted to.
+                is_failure (callable): Takes the extracted content and returns True if the extraction failed.
+                fallback (str): The route to try when the extraction fails.
+                source_type (str): The type of the content the extractor returns. Defaults to the route name.
+                default (bool): Whether the route handles the URLs no other route matches.
+        """
+        route = ExtractorRoute(name, extractor, hosts, path_prefixes, is_failure, fallback, source_type)
+        with self._lock:
+            self._routes[name] = route
+            self._stats.setdefault(name, {"hits": 0, "misses": 0, "fallbacks": 0})
+            if default:
+                self._default = name
+
+    def unregister(self, name):
+        """
+            Removes a route and its statistics. URLs it handled go to the other routes or the default route.
+        """
+        with self._lock:
+            self._routes.pop(name, None)
+            self._stats.pop(name, None)
+            if self._default == name:
+                self._default = None
+
+    def route(self, url):
+        """
+            Finds the route of a URL.
+
+            Args:
+                url (str): The URL to route.
+
+            Returns:
+                ExtractorRoute: The matching route, or the default route.
+
+            Raises:
+                LookupError: If no route matches and there is no default route.
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").lower()
+        with self._lock:
+            routes = list(self._routes.values())
+            default = self._routes.get(self._default)
+        for route in routes:
+            if route.hosts and route.matches(host, parsed.path):
+                return route
+        if default is None:
+            raise LookupError(f"No extractor is registered for {url}")
+        return default
+
+    def extract(self, url):
+        """
+            Extracts a URL with its route's extractor, following the route's fallback when the extraction fails.
+
+            Args:
+                url (str): The URL to extract.
+
+            An extractor raising an exception counts as a failed extraction, e.g. the forum extractor raises an HTTP
+            error on a page of another site.
+
+            Returns:
+                tuple: A tuple containing:
+                    - source_type (str): The source type of the route that produced the content.
+                    - content: The extracted content. If every route failed, the failed content of the last one.
+
+            Raises:
+                Exception: The exception of the last route's extractor, if every route failed and the last one
+                    raised.
+        """
+        route = self.route(url)
+        visited = set()
+        while True:
+            visited.add(route.name)
+            error = None
+            try:
+                content = route.extractor(url)
+                failed = route.is_failure(content)
+            except Exception as e:
+                error, failed = e, True
+            self._record(route.name, "misses" if failed else "hits")
+            if not failed:
+                return route.source_type, content
+
+            if error is not None:
+                logging.info(f"The {route.name} extractor failed on {url}: {error}")
+            else:
+                logging.info(f"The {route.name} extractor found nothing on {url}")
+            with self._lock:
+                fallback = self._routes.get(route.fallback)
+            if fallback is None or fallback.name in visited:
+                if error is not None:
+                    raise error
+                return route.source_type, content
+            self._record(route.name, "fallbacks")
+            route = fallback
+
+    def stats(self):
+        """
+            Returns a snapshot of the per-route statistics.
+
+            Returns:
+                dict: Maps each route name to its hits, misses, fallbacks and hit rate.
+        """
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+        for counts in stats.values():
+            total = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = counts["hits"] / total if total else 0.0
+        return stats
+
+    def _record(self, name, counter):
+        with self._lock:
+            # The route may have been unregistered during the extraction
+            if name in self._stats:
+                self._stats[name][counter] += 1
+
+
+# Process-wide registry, shared across Streamlit reruns so the route statistics accumulate
+extractor_registry = ExtractorRegistry()
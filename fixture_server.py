@@ -0,0 +1,221 @@
+import html
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes concurrent clients wait for a SYN retransmit, i.e. one second
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a slow response, e.g. at their deadline, are expected
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FixtureServer:
+    """
+        A local HTTP server that replays recorded pages, used as a stand-in for the Autodesk sites in tests.
+
+        Args:
+            routes (dict): Maps a request path (including the query string, if any) to either a response body
+                (str or bytes), a tuple (status, content_type, body), or a callable taking the request handler
+                and writing the response itself. A path without a query string also matches requests for that
+                path with any query string.
+            latency (float): The number of seconds every request waits before it is answered.
+
+        Example:
+            with FixtureServer({"/page.htm": "<html>...</html>"}) as server:
+                requests.get(server.url("/page.htm"))
+    """
+
+    def __init__(self, routes=None, latency=0.0):
+        self.routes = dict(routes or {})
+        self.latency = latency
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                if server.latency:
+                    time.sleep(server.latency)
+                route = server.routes.get(self.path)
+                if route is None:
+                    route = server.routes.get(self.path.split("?", 1)[0])
+                if callable(route):
+                    route(self)
+                    return
+                if route is None:
+                    route = (404, "text/plain", "Not found")
+                elif not isinstance(route, tuple):
+                    route = (200, "text/html; charset=utf-8", route)
+                status, content_type, body = route
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.do_GET()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = _Server(("127.0.0.1", 0), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        """
+            Returns the absolute URL of a path on the server.
+        """
+        return self.base_url + path
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeOpenAIServer(FixtureServer):
+    """
+        A local stand-in for the OpenAI chat completions API, streaming or not, with configurable latency.
+
+        Point the OpenAI client at it with base_url=server.url("/v1").
+
+        Args:
+            answer (str): The completion returned for every request.
+            first_token_delay (float): The number of seconds before the first token is sent.
+            token_delay (float): The number of seconds between two streamed tokens.
+    """
+
+    def __init__(self, answer="This is a fake answer.", first_token_delay=0.0, token_delay=0.0):
+        super().__init__({"/v1/chat/completions": self._chat_completions})
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.payloads = []
+
+    def _chat_completions(self, handler):
+        length = int(handler.headers.get("Content-Length", 0))
+        payload = json.loads(handler.rfile.read(length) or b"{}")
+        self.payloads.append(payload)
+        model = payload.get("model", "gpt-4o")
+        time.sleep(self.first_token_delay)
+
+        if not payload.get("stream"):
+            body = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode("utf-8")
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+
+        # Server-sent events, one chunk per word, terminated by [DONE]. The connection is closed at the end.
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.end_headers()
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_delay)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                             "finish_reason": None}],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+
+class AutodeskReplayServer(FixtureServer):
+    """
+        A local stand-in for the Autodesk forum, documentation and search, replaying recorded or generated pages.
+
+        Forum threads are served under /t5/, documentation article files under /cloudhelp/ (the layout the help
+        fast path downloads) and a search results page, with the markup of the help.autodesk.com results, under
+        /search?query=<query>. Every query returns `results_per_query` of the pages, chosen from the query so that
+        different questions hit different pages.
+
+        Args:
+            forum_pages (list of str): The HTML of the forum threads.
+            help_pages (list of str): The HTML of the documentation article files.
+            latency (float): The number of seconds every request waits before it is answered.
+            results_per_query (int): The number of links on a search results page.
+    """
+
+    def __init__(self, forum_pages, help_pages, latency=0.0, results_per_query=5):
+        routes = {}
+        self.page_paths = []
+        for i, page in enumerate(forum_pages):
+            path = f"/t5/civil-3d-forum/thread/td-p/{i}"
+            routes[path] = page
+            self.page_paths.append(path)
+        for i, page in enumerate(help_pages):
+            path = f"/cloudhelp/2024/ENU/Civil3D-UserGuide/files/GUID-{i}.htm"
+            routes[path] = page
+            self.page_paths.append(path)
+        routes["/search"] = self._search
+        super().__init__(routes, latency=latency)
+        self.results_per_query = results_per_query
+
+    def search_results(self, query):
+        """
+            Returns the absolute URLs of the pages listed for a query, in rank order.
+        """
+        start = sum(query.encode("utf-8")) % len(self.page_paths)
+        count = min(self.results_per_query, len(self.page_paths))
+        return [self.url(self.page_paths[(start + i) % len(self.page_paths)]) for i in range(count)]
+
+    def _search(self, handler):
+        query = parse_qs(urlparse(handler.path).query).get("query", [""])[0]
+        items = "".join(
+            f"<div class='results-item'><div class='results-item-title'><a href='{html.escape(url)}'>Result {i}</a>"
+            f"</div></div>" for i, url in enumerate(self.search_results(query))
+        )
+        body = f"<html><body><div class='results'>{items}</div></body></html>".encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
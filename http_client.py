@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+from deadline import time_left
+
+# Like the WebDriver pool, the session lives outside Streamlit_app.py so its connections survive Streamlit reruns
+_session = None
+_session_lock = threading.Lock()
+
+DEFAULT_TIMEOUT = (5, 15)
+# Transient statuses worth retrying. Retries back off exponentially and honour Retry-After.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ValidatorCache:
+    """
+        Remembers the ETag and Last-Modified validators and the body of downloaded pages, so that a page can be
+        downloaded again with a conditional request and a 304 Not Modified answer reuses the remembered body.
+
+        Args:
+            max_bytes (int): The total size of the bodies kept, least recently used first out.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def headers(self, url):
+        """
+            Returns the If-None-Match and If-Modified-Since headers for a URL, empty if nothing is remembered.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def body(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            self._entries.move_to_end(url)
+            return entry[2]
+
+    def store(self, url, response):
+        """
+            Remembers the successful response to a URL if it has a validator and is small enough.
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        content = response.content
+        if not (etag or last_modified) or len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._bytes -= len(previous[2])
+            self._entries[url] = (etag, last_modified, content)
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class HostStats:
+    """
+        Request, latency and connection statistics per host.
+
+        Args:
+            window (int): The number of recent request durations kept per host for the latency quantiles.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds, status=None, received_bytes=0, error=False):
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = {"requests": 0, "errors": 0, "not_modified": 0, "bytes": 0,
+                                             "seconds": 0.0, "recent": deque(maxlen=self.window)}
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["not_modified"] += int(status == 304)
+            stats["bytes"] += received_bytes
+            stats["seconds"] += seconds
+            stats["recent"].append(seconds)
+
+    def snapshot(self, connections=None):
+        """
+            Returns the statistics of every host.
+
+            Args:
+                connections (dict): The number of connections opened per host, merged into the result.
+
+            Returns:
+                dict: Maps each host to its requests, errors, 304 answers, bytes received, mean, p50, p95 and
+                    maximum latency in seconds, and connections opened.
+        """
+        with self._lock:
+            hosts = {host: dict(stats, recent=sorted(stats["recent"])) for host, stats in self._hosts.items()}
+        snapshot = {}
+        for host, stats in hosts.items():
+            recent = stats.pop("recent")
+            total = stats.pop("seconds")
+            stats["mean_seconds"] = total / stats["requests"] if stats["requests"] else 0.0
+            stats["p50_seconds"] = recent[int(0.5 * len(recent))] if recent else 0.0
+            stats["p95_seconds"] = recent[min(len(recent) - 1, int(0.95 * len(recent)))] if recent else 0.0
+            stats["max_seconds"] = recent[-1] if recent else 0.0
+            stats["connections"] = (connections or {}).get(host, 0)
+            snapshot[host] = stats
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+validator_cache = ValidatorCache(max_bytes=int(os.getenv("HTTP_VALIDATOR_CACHE_BYTES", str(32 * 1024 * 1024))))
+host_stats = HostStats()
+
+
+def get_session():
+    """
+        Returns the process-wide requests session, creating it on first use.
+
+        The session keeps up to HTTP_POOL_SIZE (default 10) keep-alive connections per host, so consecutive
+        requests to the same site skip the TCP and TLS handshakes. Connection errors and transient error statuses
+        are retried up to HTTP_RETRIES (default 2) times, waiting HTTP_RETRY_BACKOFF (default 0.5) seconds
+        times 2 to the power of the retry in between, and compressed responses are requested.
+
+        Returns:
+            requests.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(os.getenv("HTTP_POOL_SIZE", "10"))
+            retries = Retry(
+                total=int(os.getenv("HTTP_RETRIES", "2")),
+                backoff_factor=float(os.getenv("HTTP_RETRY_BACKOFF", "0.5")),
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=("GET", "HEAD"),
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            # gzip and deflate, plus br or zstd when the decoders are installed
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def fetch(url, timeout=DEFAULT_TIMEOUT, conditional=False):
+    """
+        Downloads a URL with the shared session.
+
+        Args:
+            url (str): The URL to download.
+            timeout (float or tuple): The connect and read timeouts in seconds, shortened to the time left before
+                the current deadline, if any.
+            conditional (bool): Whether to revalidate a page downloaded before with its ETag or Last-Modified
+                validator. When the server answers 304 Not Modified, the returned response has status 200, the
+                remembered body and a `revalidated` attribute set to True.
+
+        Returns:
+            requests.Response: The response.
+
+        Raises:
+            requests.RequestException: If the request fails or the server returns an error status, or the current
+                deadline has passed.
+    """
+    host = urlparse(url).hostname or ""
+    remaining = time_left()
+    if remaining is not None:
+        if remaining <= 0:
+            raise requests.Timeout(f"The deadline passed before {url} was requested")
+        timeout = tuple(min(part, remaining) for part in timeout) if isinstance(timeout, tuple) \
+            else min(timeout, remaining)
+    headers = validator_cache.headers(url) if conditional else {}
+    started = time.monotonic()
+    try:
+        response = get_session().get(url, timeout=timeout, headers=headers)
+    except requests.RequestException:
+        host_stats.record(host, time.monotonic() - started, error=True)
+        raise
+    host_stats.record(host, time.monotonic() - started, status=response.status_code,
+                      received_bytes=len(response.content), error=response.status_code >= 400)
+
+    response.revalidated = False
+    if conditional and response.status_code == 304:
+        body = validator_cache.body(url)
+        if body is None:
+            # Forgotten in the meantime, download the page unconditionally
+            return fetch(url, timeout=timeout)
+        response.status_code = 200
+        response._content = body
+        response.revalidated = True
+        return response
+
+    response.raise_for_status()
+    if conditional:
+        validator_cache.store(url, response)
+    return response
+
+
+def stats():
+    """
+        Returns the per-host statistics of the shared session, see HostStats.snapshot.
+    """
+    connections = {}
+    with _session_lock:
+        session = _session
+    if session is not None:
+        # The same adapter is mounted for http:// and https://
+        for adapter in {id(adapter): adapter for adapter in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections[pool.host] = connections.get(pool.host, 0) + pool.num_connections
+    return host_stats.snapshot(connections)
+
+
+def close_session():
+    """
+        Closes the process-wide session, if any, so the next get_session() call starts a fresh one.
+    """
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
@@ -0,0 +1,306 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Query parameters that never change the content of a page
+TRACKING_PARAMETERS = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "sf", "mkt_tok"}
+
+# Default time to live in seconds per source type. Forum threads get new replies, while the documentation of a
+# released Civil 3D version rarely changes.
+DEFAULT_TTLS = {
+    "forum": 24 * 3600,
+    "help": 30 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+_cache = None
+_cache_lock = threading.Lock()
+_refreshing = contextvars.ContextVar("refreshing", default=False)
+
+
+def normalize_url(url):
+    """
+        Normalizes a URL so that trivially different links to the same page share a cache entry.
+
+        The scheme and host are lower-cased, default ports, fragments, tracking parameters and trailing slashes
+        are removed and the remaining query parameters are sorted.
+
+        Args:
+            url (str): The URL to normalize.
+
+        Returns:
+            str: The normalized URL.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port and (scheme, parsed.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parsed.port}"
+    path = parsed.path.rstrip("/") or "/"
+    query = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMETERS)
+    return urlunparse((scheme, host, path, "", urlencode(query), ""))
+
+
+class DiskCache:
+    """
+        A size-bounded key-value cache stored in SQLite, safe to share between threads and processes.
+
+        Values are stored as JSON. Entries expire after their time to live, and the least recently used entries
+        are evicted once the total size of the values exceeds max_bytes. Hit and miss counters are stored in the
+        database as well, so the statistics cover every process using the file.
+
+        Args:
+            path (str): The SQLite database file. Its directory is created if needed.
+            max_bytes (int): The maximum total size of the stored values.
+            default_ttl (float): The time to live in seconds of entries stored without an explicit one.
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, default_ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, so every thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, connection, name, amount=1):
+        connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def get(self, key, allow_expired=False):
+        """
+            Looks a key up and marks it as recently used.
+
+            Args:
+                key (str): The key to look up.
+                allow_expired (bool): Whether to return an expired entry instead of treating it as a miss.
+
+            Returns:
+                The stored value, or None if the key is missing or expired.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(connection, "misses")
+                return None
+            value, expires_at = row
+            if expires_at <= now and not allow_expired:
+                self._count(connection, "misses")
+                self._count(connection, "expired")
+                return None
+            connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(connection, "hits")
+        return json.loads(value)
+
+    def get_entry(self, key):
+        """
+            Looks a key up without touching the statistics, including expired entries.
+
+            Args:
+                key (str): The key to look up.
+
+            Returns:
+                tuple: The (value, created_at, expires_at) of the entry, or None if the key is missing.
+        """
+        row = self._connect().execute(
+            "SELECT value, created_at, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, value, ttl=None):
+        """
+            Stores a value and evicts the least recently used entries if the cache grew too large.
+
+            Args:
+                key (str): The key to store the value under.
+                value: The JSON-serializable value.
+                ttl (float): The time to live in seconds. Defaults to default_ttl.
+        """
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, size, now, now, now + ttl),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count(connection, "evictions", evicted)
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        """
+            Removes every entry and resets the statistics.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM counters")
+
+    def stats(self):
+        """
+            Returns the statistics of the cache, shared by every process using the same file.
+
+            Returns:
+                dict: The hits, misses, expired lookups, evictions, hit rate, number of entries and total bytes.
+        """
+        connection = self._connect()
+        stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        stats.update(dict(connection.execute("SELECT name, value FROM counters").fetchall()))
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        stats["entries"] = entries
+        stats["bytes"] = size
+        stats["max_bytes"] = self.max_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def get_page_cache():
+    """
+        Returns the process-wide cache of extracted pages, creating it on first use.
+
+        The cache is configured through the PAGE_CACHE_ENABLED (default 1), PAGE_CACHE_PATH (default
+        ~/.cache/civil3d_assistant/pages.sqlite3) and PAGE_CACHE_MAX_BYTES (default 100 MB) environment variables.
+
+        Returns:
+            DiskCache: The shared cache, or None if caching is disabled.
+    """
+    global _cache
+    if os.getenv("PAGE_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("PAGE_CACHE_PATH",
+                             os.path.join(os.path.expanduser("~"), ".cache", "civil3d_assistant", "pages.sqlite3"))
+            _cache = DiskCache(path, max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(100 * 1024 * 1024))))
+        return _cache
+
+
+def reset_page_cache():
+    """
+        Forgets the process-wide cache so the next get_page_cache() call reads the configuration again.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def get_ttl(source_type):
+    """
+        Returns the time to live of a source type, overridable with PAGE_CACHE_TTL_<SOURCE_TYPE> (in seconds).
+    """
+    default = DEFAULT_TTLS.get(source_type, DEFAULT_TTL)
+    return float(os.getenv(f"PAGE_CACHE_TTL_{source_type.upper()}", str(default)))
+
+
+@contextmanager
+def refreshing():
+    """
+        Context manager making the page and search caches fetch again and store the fresh result, instead of
+        answering from the cached one. Used by the pre-warm crawler to refresh entries before they expire.
+    """
+    token = _refreshing.set(True)
+    try:
+        yield
+    finally:
+        _refreshing.reset(token)
+
+
+def is_refreshing():
+    """
+        Returns True inside refreshing().
+    """
+    return _refreshing.get()
+
+
+def cached_page(source_type, is_failure):
+    """
+        Decorator caching the result of a page extractor in the process-wide page cache.
+
+        Results are stored under the normalized URL with the time to live of the source type. Failed
+        extractions are not cached. Inside refreshing() the page is always extracted again.
+
+        Args:
+            source_type (str): The type of the pages the extractor handles, e.g. "forum" or "help".
+            is_failure (callable): Takes the extractor's result and returns True if the extraction failed.
+
+        Returns:
+            callable: The decorator.
+    """
+    def decorator(extractor):
+        @functools.wraps(extractor)
+        def wrapper(url):
+            cache = get_page_cache()
+            if cache is None:
+                return extractor(url)
+
+            key = f"{source_type}:{normalize_url(url)}"
+            try:
+                cached = None if is_refreshing() else cache.get(key)
+            except sqlite3.Error as e:
+                logging.info(f"Page cache lookup failed: {e}")
+                cached = None
+            if cached is not None:
+                return tuple(cached)
+
+            result = extractor(url)
+            if not is_failure(result):
+                try:
+                    cache.set(key, result, ttl=get_ttl(source_type))
+                except sqlite3.Error as e:
+                    logging.info(f"Page cache update failed: {e}")
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,12 @@
+# Placeholder results returned by the extractors and the search when a page could not be extracted or searched.
+# Kept apart from the app, so the modules it imports can recognize failed results without importing it.
+FORUM_FAILURE = "Failed to retrieve the original question."
+HELP_FAILURE = "Failed to extract text from the page."
+SEARCH_FAILURE = "Failed to retrieve the top 5 links."
+
+
+def is_failed_extraction(content):
+    """
+        Returns True if the content returned by a forum or help extractor is its failure placeholder.
+    """
+    return content[0] in (FORUM_FAILURE, HELP_FAILURE)
@@ -0,0 +1,442 @@
+"""
+    Pre-warms the search and page caches in the background, so that popular questions are answered from them
+    instead of waiting for the Autodesk sites.
+
+    The crawler runs in its own process, next to the Streamlit app, and shares the SQLite page and search caches
+    with it. It keeps a queue of topics in another SQLite file: the queries and URLs of a seed file, and the
+    questions asked in the app (which records them there). Every query is searched for each supported Civil 3D
+    version and the links found are queued as well. Topics are crawled again before their cache entry expires,
+    the most popular and stalest first, and requests to the same host are spaced out.
+
+    Usage:
+        python prewarm.py run --seeds seeds.txt --workers 2 --min-interval 2
+        python prewarm.py stats
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from page_cache import get_ttl, refreshing
+from placeholders import SEARCH_FAILURE, is_failed_extraction
+from search_cache import normalize_query
+from search_index import SUPPORTED_YEARS
+
+# The live search runs on the documentation site
+SEARCH_HOST = "help.autodesk.com"
+# Popularity halves every week without the topic being asked again
+POPULARITY_HALF_LIFE = 7 * 24 * 3600
+# A question counts fully for the version it was asked for and half for the other versions
+OTHER_YEAR_WEIGHT = 0.5
+# Topics are crawled again once they have used this share of their time to live, before the app finds them expired
+REFRESH_AT = 0.8
+# Seconds before a failed topic is tried again, doubled for every further failure up to its time to live
+FAILURE_BACKOFF = 60
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class HostRateLimiter:
+    """
+        Spaces out the requests to every host by at least min_interval seconds.
+
+        Args:
+            min_interval (float): The minimum number of seconds between two requests to the same host.
+    """
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host, now=None):
+        """
+            Reserves the next free slot of a host.
+
+            Returns:
+                float: The number of seconds to wait before the request.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.min_interval
+        return slot - now
+
+    def wait(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CrawlQueue:
+    """
+        The topics to keep warm, stored in SQLite so the app and the crawler process can share them.
+
+        A topic is either a query, searched for one Civil 3D version, or a URL. It is due if it was never crawled,
+        or once it has used REFRESH_AT of its time to live. Due topics are crawled in order of priority: their
+        popularity, which decays with POPULARITY_HALF_LIFE, times their staleness (age divided by time to live).
+
+        Args:
+            path (str): The SQLite database file. Its directory is created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS topics ("
+                "kind TEXT NOT NULL, target TEXT NOT NULL, year INTEGER NOT NULL, "
+                "popularity REAL NOT NULL, last_seen REAL NOT NULL, fetched_at REAL, ttl REAL, "
+                "failures INTEGER NOT NULL DEFAULT 0, retry_at REAL, PRIMARY KEY (kind, target, year))"
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def add(self, kind, target, year=0, popularity=1.0, seed=False):
+        """
+            Queues a topic, or makes an already queued one more popular.
+
+            Args:
+                kind (str): "query" or "url".
+                target (str): The query or the URL.
+                year (int): The Civil 3D version a query is searched for, 0 for URLs.
+                popularity (float): The popularity added.
+                seed (bool): Whether the topic comes from the seed list. Seeds are only added once, so reading
+                    the seed list again does not make them more popular.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            if seed:
+                connection.execute(
+                    "INSERT OR IGNORE INTO topics (kind, target, year, popularity, last_seen) VALUES (?, ?, ?, ?, ?)",
+                    (kind, target, year, popularity, now),
+                )
+                return
+            row = connection.execute(
+                "SELECT popularity, last_seen FROM topics WHERE kind = ? AND target = ? AND year = ?",
+                (kind, target, year),
+            ).fetchone()
+            if row is None:
+                connection.execute(
+                    "INSERT INTO topics (kind, target, year, popularity, last_seen) VALUES (?, ?, ?, ?, ?)",
+                    (kind, target, year, popularity, now),
+                )
+            else:
+                connection.execute(
+                    "UPDATE topics SET popularity = ?, last_seen = ? WHERE kind = ? AND target = ? AND year = ?",
+                    (decayed(row[0], now - row[1]) + popularity, now, kind, target, year),
+                )
+
+    def due(self, limit=None, now=None):
+        """
+            Returns the topics to crawl now, highest priority first.
+
+            Returns:
+                list of dict: The kind, target, year, popularity, ttl and priority of every due topic.
+        """
+        now = time.time() if now is None else now
+        rows = self._connect().execute(
+            "SELECT kind, target, year, popularity, last_seen, fetched_at, ttl FROM topics "
+            "WHERE (retry_at IS NULL OR retry_at <= ?) AND (fetched_at IS NULL OR fetched_at + ttl * ? <= ?)",
+            (now, REFRESH_AT, now),
+        ).fetchall()
+        topics = []
+        for kind, target, year, popularity, last_seen, fetched_at, ttl in rows:
+            popularity = decayed(popularity, now - last_seen)
+            # Never crawled topics come first, by popularity
+            priority = math.inf if fetched_at is None else popularity * (now - fetched_at) / ttl
+            topics.append({"kind": kind, "target": target, "year": year, "popularity": popularity, "ttl": ttl,
+                           "priority": priority})
+        topics.sort(key=lambda topic: (topic["priority"], topic["popularity"]), reverse=True)
+        return topics[:limit] if limit else topics
+
+    def record_success(self, topic, ttl):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE topics SET fetched_at = ?, ttl = ?, failures = 0, retry_at = NULL "
+                "WHERE kind = ? AND target = ? AND year = ?",
+                (time.time(), ttl, topic["kind"], topic["target"], topic["year"]),
+            )
+
+    def record_failure(self, topic):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT failures FROM topics WHERE kind = ? AND target = ? AND year = ?",
+                (topic["kind"], topic["target"], topic["year"]),
+            ).fetchone()
+            failures = (row[0] if row else 0) + 1
+            backoff = FAILURE_BACKOFF * 2 ** (failures - 1)
+            if topic.get("ttl"):
+                backoff = min(backoff, topic["ttl"])
+            connection.execute(
+                "UPDATE topics SET failures = ?, retry_at = ? WHERE kind = ? AND target = ? AND year = ?",
+                (failures, time.time() + backoff, topic["kind"], topic["target"], topic["year"]),
+            )
+
+    def stats(self, now=None):
+        """
+            Returns the progress and freshness of the queue.
+
+            Returns:
+                dict: Per kind of topic, the number of topics, of topics never crawled, of fresh ones (crawled
+                    within their time to live), of stale ones, of failing ones, and the age in seconds of the
+                    oldest and the median crawled topic.
+        """
+        now = time.time() if now is None else now
+        rows = self._connect().execute("SELECT kind, fetched_at, ttl, failures FROM topics").fetchall()
+        stats = {}
+        ages = {}
+        for kind, fetched_at, ttl, failures in rows:
+            kind_stats = stats.setdefault(kind, {"topics": 0, "never_crawled": 0, "fresh": 0, "stale": 0,
+                                                 "failing": 0})
+            kind_stats["topics"] += 1
+            kind_stats["failing"] += int(failures > 0)
+            if fetched_at is None:
+                kind_stats["never_crawled"] += 1
+                continue
+            age = now - fetched_at
+            kind_stats["fresh" if age < ttl else "stale"] += 1
+            ages.setdefault(kind, []).append(age)
+        for kind, kind_ages in ages.items():
+            kind_ages.sort()
+            stats[kind]["oldest_seconds"] = round(kind_ages[-1], 1)
+            stats[kind]["median_age_seconds"] = round(kind_ages[len(kind_ages) // 2], 1)
+        return stats
+
+
+def decayed(popularity, seconds):
+    return popularity * 0.5 ** (max(0.0, seconds) / POPULARITY_HALF_LIFE)
+
+
+def read_seeds(path):
+    """
+        Reads a seed file: one query or URL (starting with http:// or https://) per line. Lines starting with #
+        are comments.
+
+        Returns:
+            tuple: The list of queries and the list of URLs.
+    """
+    queries, urls = [], []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            (urls if line.startswith(("http://", "https://")) else queries).append(line)
+    return queries, urls
+
+
+def seed(queue, queries=(), urls=(), years=SUPPORTED_YEARS):
+    """
+        Queues the seed queries for every version and the seed URLs.
+    """
+    for query in queries:
+        for year in years:
+            queue.add("query", normalize_query(query), year, seed=True)
+    for url in urls:
+        queue.add("url", url, seed=True)
+
+
+class Prewarmer:
+    """
+        Crawls the due topics of a queue with the app's search and extraction functions.
+
+        Searching a query queues the links found, with the popularity of the query, so their pages are extracted
+        and kept warm as well.
+
+        Args:
+            queue (CrawlQueue): The topics.
+            workers (int): The number of topics crawled at the same time.
+            min_interval (float): The minimum number of seconds between two requests to the same host.
+    """
+
+    def __init__(self, queue, workers=2, min_interval=1.0):
+        self.queue = queue
+        self.workers = workers
+        self.rate_limiter = HostRateLimiter(min_interval)
+        self._lock = threading.Lock()
+        self._stats = {"rounds": 0, "crawled": 0, "failed": 0, "links_found": 0}
+
+    def crawl(self, topic):
+        """
+            Crawls one topic and records the result in the queue.
+
+            Returns:
+                bool: Whether the crawl succeeded.
+        """
+        # Imported here, since the app imports this module to record the questions
+        import Streamlit_app
+
+        try:
+            if topic["kind"] == "query":
+                self.rate_limiter.wait(SEARCH_HOST)
+                with refreshing():
+                    links = Streamlit_app.get_top_5_links(topic["target"], year=topic["year"])
+                if not links or links == [SEARCH_FAILURE]:
+                    raise Exception("No search results")
+                for link in links:
+                    self.queue.add("url", link, popularity=topic["popularity"])
+                self._count("links_found", len(links))
+                ttl = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+            else:
+                self.rate_limiter.wait(urlparse(topic["target"]).hostname or "")
+                with refreshing():
+                    source_type, content = Streamlit_app.extract_source(topic["target"])
+                if is_failed_extraction(content):
+                    raise Exception("Extraction failed")
+                ttl = get_ttl(source_type)
+        except Exception as e:
+            logging.info(f"Pre-warming {topic['kind']} {topic['target']} ({topic['year']}) failed: {e}")
+            self.queue.record_failure(topic)
+            self._count("failed")
+            return False
+        self.queue.record_success(topic, ttl)
+        self._count("crawled")
+        return True
+
+    def run_round(self, limit=None):
+        """
+            Crawls the topics due now.
+
+            Args:
+                limit (int): The maximum number of topics crawled, None for all.
+
+            Returns:
+                int: The number of topics crawled.
+        """
+        topics = self.queue.due(limit=limit)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prewarm") as executor:
+            list(executor.map(self.crawl, topics))
+        self._count("rounds")
+        return len(topics)
+
+    def run(self, idle_seconds=60, round_size=50, once=False, stats_path=None):
+        """
+            Crawls due topics until interrupted, waiting idle_seconds whenever none is due.
+
+            Args:
+                idle_seconds (float): The number of seconds to wait when no topic is due.
+                round_size (int): The number of topics crawled before the priorities are computed again.
+                once (bool): Whether to stop as soon as no topic is due.
+                stats_path (str): A JSON file rewritten with the statistics after every round.
+        """
+        while True:
+            crawled = self.run_round(limit=round_size)
+            stats = self.stats()
+            logging.info(f"Pre-warm round: {json.dumps(stats)}")
+            if stats_path:
+                with open(stats_path + ".tmp", "w", encoding="utf-8") as file:
+                    json.dump(stats, file, indent=2)
+                os.replace(stats_path + ".tmp", stats_path)
+            if not crawled:
+                if once:
+                    return
+                time.sleep(idle_seconds)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        """
+            Returns the crawler statistics of this process and the freshness of the queue, see CrawlQueue.stats.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue"] = self.queue.stats()
+        return stats
+
+
+def get_crawl_queue():
+    """
+        Returns the process-wide crawl queue in PREWARM_QUEUE_PATH (default
+        ~/.cache/civil3d_assistant/prewarm.sqlite3), creating it on first use.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            path = os.getenv("PREWARM_QUEUE_PATH",
+                             os.path.join(os.path.expanduser("~"), ".cache", "civil3d_assistant", "prewarm.sqlite3"))
+            _queue = CrawlQueue(path)
+        return _queue
+
+
+def reset_crawl_queue():
+    """
+        Forgets the process-wide queue so the next get_crawl_queue() call reads the configuration again.
+    """
+    global _queue
+    with _queue_lock:
+        _queue = None
+
+
+def record_question(question, year, years=SUPPORTED_YEARS):
+    """
+        Queues a question asked in the app, unless PREWARM_RECORD_QUESTIONS is set to 0. It counts fully for its
+        version and OTHER_YEAR_WEIGHT for the other supported versions.
+    """
+    if os.getenv("PREWARM_RECORD_QUESTIONS", "1") == "0":
+        return
+    query = normalize_query(question)
+    if not query:
+        return
+    try:
+        queue = get_crawl_queue()
+        for other_year in years:
+            queue.add("query", query, other_year, popularity=1.0 if other_year == int(year) else OTHER_YEAR_WEIGHT)
+    except (OSError, sqlite3.Error) as e:
+        logging.info(f"Failed to record the question for pre-warming: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Crawl the due topics until interrupted")
+    run_parser.add_argument("--seeds", help="A text file with one query or URL per line")
+    run_parser.add_argument("--years", type=int, nargs="+", default=list(SUPPORTED_YEARS),
+                            help="Civil 3D versions the queries are searched for")
+    run_parser.add_argument("--workers", type=int, default=2, help="Topics crawled at the same time")
+    run_parser.add_argument("--min-interval", type=float, default=2.0,
+                            help="Minimum seconds between two requests to the same host")
+    run_parser.add_argument("--idle", type=float, default=60, help="Seconds to wait when no topic is due")
+    run_parser.add_argument("--once", action="store_true", help="Stop as soon as no topic is due")
+    run_parser.add_argument("--stats", help="JSON file rewritten with the statistics after every round")
+
+    subparsers.add_parser("stats", help="Print the progress and freshness of the queue")
+    args = parser.parse_args(argv)
+
+    queue = get_crawl_queue()
+    if args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+        return
+
+    if os.getenv("PAGE_CACHE_ENABLED", "1") == "0" or os.getenv("SEARCH_CACHE_ENABLED", "1") == "0":
+        logging.warning("The page or search cache is disabled, the app will not benefit from the crawl")
+    if args.seeds:
+        queries, urls = read_seeds(args.seeds)
+        seed(queue, queries, urls, years=args.years)
+    prewarmer = Prewarmer(queue, workers=args.workers, min_interval=args.min_interval)
+    prewarmer.run(idle_seconds=args.idle, once=args.once, stats_path=args.stats)
+    print(json.dumps(prewarmer.stats()))
+
+
+if __name__ == "__main__":
+    main()
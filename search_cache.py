@@ -0,0 +1,230 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from page_cache import DiskCache, is_refreshing
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """
+        Normalizes a search query so that questions differing only in case, whitespace or punctuation share
+        their search results.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            str: The lower-cased query with punctuation removed and whitespace collapsed.
+    """
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class SearchCache:
+    """
+        Memoizes search results per (year, normalized query) in memory and on disk.
+
+        A result is fresh for `ttl` seconds. Once it is older, but not older than ttl + max_stale, it is still
+        returned immediately while a background thread fetches a fresh result (stale-while-revalidate). Inside
+        page_cache.refreshing() the search always runs again.
+
+        Args:
+            disk_cache (DiskCache): The on-disk tier, or None to only cache in memory.
+            ttl (float): The number of seconds a result is fresh.
+            max_stale (float): The number of seconds after expiry during which a stale result is still served.
+            memory_size (int): The number of results kept in the in-memory tier.
+            is_failure (callable): Takes a fetched result and returns True if it must not be cached.
+    """
+
+    def __init__(self, disk_cache=None, ttl=6 * 3600, max_stale=7 * 24 * 3600, memory_size=256, is_failure=None):
+        self.disk_cache = disk_cache
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.memory_size = memory_size
+        self.is_failure = is_failure or (lambda result: not result)
+
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    @staticmethod
+    def key(query, year):
+        return f"{year}:{normalize_query(query)}"
+
+    def get_or_fetch(self, query, year, fetch):
+        """
+            Returns the cached result of a search, fetching it on a miss.
+
+            Args:
+                query (str): The search query.
+                year (int): The Civil 3D version searched.
+                fetch (callable): A zero-argument callable running the search.
+
+            Returns:
+                The search result.
+        """
+        key = self.key(query, year)
+        if is_refreshing():
+            result = fetch()
+            self._store(key, result)
+            self._count("refresh_failures" if self.is_failure(result) else "refreshes")
+            return result
+
+        entry = self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            result, fetched_at = entry
+            if now - fetched_at < self.ttl:
+                return result
+            if now - fetched_at < self.ttl + self.max_stale:
+                self._count("stale_served")
+                self._refresh_in_background(key, fetch)
+                return result
+
+        self._count("misses")
+        result = fetch()
+        self._store(key, result)
+        return result
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                # An expired entry may have been refreshed on disk by another process, e.g. the pre-warm crawler
+                if self.disk_cache is None or time.time() - entry[1] < self.ttl:
+                    self._stats["memory_hits"] += 1
+                    return entry
+        memory_entry = entry
+
+        if self.disk_cache is None:
+            return None
+        try:
+            stored = self.disk_cache.get(key)
+        except sqlite3.Error as e:
+            logging.info(f"Search cache lookup failed: {e}")
+            stored = None
+        if stored is None or (memory_entry is not None and stored["fetched_at"] <= memory_entry[1]):
+            if memory_entry is not None:
+                self._count("memory_hits")
+            return memory_entry
+
+        entry = (stored["result"], stored["fetched_at"])
+        self._remember(key, entry)
+        self._count("disk_hits")
+        return entry
+
+    def _store(self, key, result):
+        if self.is_failure(result):
+            return
+        entry = (result, time.time())
+        self._remember(key, entry)
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.set(key, {"result": result, "fetched_at": entry[1]}, ttl=self.ttl + self.max_stale)
+            except sqlite3.Error as e:
+                logging.info(f"Search cache update failed: {e}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            # Only one refresh per key at a time
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                result = fetch()
+                if self.is_failure(result):
+                    self._count("refresh_failures")
+                else:
+                    self._store(key, result)
+                    self._count("refreshes")
+            except Exception as e:
+                self._count("refresh_failures")
+                logging.info(f"Background refresh of search '{key}' failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="search-cache-refresh", daemon=True).start()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """
+            Returns a snapshot of the cache statistics of this process.
+
+            Returns:
+                dict: The memory and disk hits, misses, stale results served and background refreshes.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def get_search_cache(is_failure=None):
+    """
+        Returns the process-wide search cache, creating it on first use.
+
+        The cache is configured through the SEARCH_CACHE_ENABLED (default 1), SEARCH_CACHE_PATH (default
+        ~/.cache/civil3d_assistant/search.sqlite3), SEARCH_CACHE_TTL (default 6 hours), SEARCH_CACHE_MAX_STALE
+        (default 7 days) and SEARCH_CACHE_MEMORY_SIZE (default 256) environment variables.
+
+        Args:
+            is_failure (callable): Takes a search result and returns True if it must not be cached.
+
+        Returns:
+            SearchCache: The shared cache, or None if caching is disabled.
+    """
+    global _cache
+    if os.getenv("SEARCH_CACHE_ENABLED", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("SEARCH_CACHE_PATH",
+                             os.path.join(os.path.expanduser("~"), ".cache", "civil3d_assistant", "search.sqlite3"))
+            _cache = SearchCache(
+                disk_cache=DiskCache(path, max_bytes=10 * 1024 * 1024),
+                ttl=float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600))),
+                max_stale=float(os.getenv("SEARCH_CACHE_MAX_STALE", str(7 * 24 * 3600))),
+                memory_size=int(os.getenv("SEARCH_CACHE_MEMORY_SIZE", "256")),
+                is_failure=is_failure,
+            )
+        return _cache
+
+
+def reset_search_cache():
+    """
+        Forgets the process-wide cache so the next get_search_cache() call reads the configuration again.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,346 @@
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from corpus_store import CorpusStore
+from placeholders import is_failed_extraction
+
+# The product years offered by the version selectbox of the app
+SUPPORTED_YEARS = (2022, 2023, 2024, 2025)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "my", "of", "on", "or", "that", "the", "this", "to", "what", "when", "where", "which", "why", "with",
+    "you", "your",
+}
+
+_local_search = None
+_local_search_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+        Splits text into lower-cased search terms, without stopwords and with plural "s" endings removed.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            list of str: The terms, in order of appearance.
+    """
+    terms = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def document_text(source_type, content):
+    """
+        Returns the searchable text of a source extracted by extract_forum_info or extract_content_from_autodesk_help.
+
+        Args:
+            source_type (str): Either "forum" or "help".
+            content (list or tuple): The extracted content.
+
+        Returns:
+            str: The text to index.
+    """
+    if source_type == "forum":
+        original_question, accepted_solutions = content
+        return original_question + " " + " ".join(accepted_solutions)
+    return content[0]
+
+
+def url_year(url):
+    """
+        Returns the product year a documentation URL belongs to, or None for year-independent pages such as forum
+        threads.
+    """
+    match = re.search(r"/(?:view/[^/]+|cloudhelp)/(\d{4})/", url)
+    return int(match.group(1)) if match else None
+
+
+class SearchIndex:
+    """
+        An in-memory inverted index ranking documents with Okapi BM25.
+
+        Args:
+            k1 (float): The BM25 term frequency saturation parameter.
+            b (float): The BM25 document length normalization parameter.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.urls = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        self._url_ids = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add_document(self, url, text):
+        """
+            Indexes a document. A URL that is already indexed is ignored.
+
+            Args:
+                url (str): The URL returned by search().
+                text (str): The text of the document.
+        """
+        self.add_terms(url, tokenize(text))
+
+    def add_terms(self, url, terms):
+        """
+            Indexes a document that is already tokenized, see add_document.
+        """
+        if url in self._url_ids:
+            return
+        doc_id = len(self.urls)
+        self._url_ids[url] = doc_id
+        self.urls.append(url)
+        self.doc_lengths.append(len(terms))
+        self._total_length += len(terms)
+        for term, frequency in Counter(terms).items():
+            self.postings[term].append((doc_id, frequency))
+
+    def search(self, query, k=5):
+        """
+            Ranks the indexed documents for a query.
+
+            Args:
+                query (str): The search query.
+                k (int): The number of results to return.
+
+            Returns:
+                list of tuple: The (url, score) of the k best matching documents, best first.
+        """
+        if not self.urls:
+            return []
+        count = len(self.urls)
+        average_length = self._total_length / count or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.urls[doc_id], score) for doc_id, score in best]
+
+    def save(self, path):
+        """
+            Writes the index to a JSON file.
+        """
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "urls": self.urls,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+            Reads an index written by save().
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.urls = data["urls"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = defaultdict(list, {term: [tuple(posting) for posting in postings]
+                                            for term, postings in data["postings"].items()})
+        index._url_ids = {url: doc_id for doc_id, url in enumerate(index.urls)}
+        index._total_length = sum(index.doc_lengths)
+        return index
+
+
+def build_indexes(records, years=SUPPORTED_YEARS):
+    """
+        Builds one index per product year from corpus records.
+
+        Documentation pages go into the index of their year, year-independent pages such as forum threads go
+        into every index.
+
+        Args:
+            records (iterable of dict): Records with the "url", "source_type" and "content" of a page, as written
+                by ingest().
+            years (iterable of int): The years to build indexes for.
+
+        Returns:
+            dict: Maps each year to its SearchIndex.
+    """
+    indexes = {year: SearchIndex() for year in years}
+    for record in records:
+        terms = tokenize(document_text(record["source_type"], record["content"]))
+        year = record.get("year") or url_year(record["url"])
+        for index_year, index in indexes.items():
+            if year is None or year == index_year:
+                index.add_terms(record["url"], terms)
+    return indexes
+
+
+def read_corpus(path):
+    """
+        Reads the records of a JSONL corpus file or a corpus store directory written by ingest().
+    """
+    if os.path.isdir(path):
+        with CorpusStore(path) as store:
+            yield from store.items()
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def ingest(urls, corpus_path, extract):
+    """
+        Extracts pages with the app's extractors and appends them to a JSONL corpus file, or adds them to a corpus
+        store if the path is a directory (see corpus_store.py).
+
+        Pages the extractor failed on, i.e. whose content is the app's failure placeholder, are left out.
+
+        Args:
+            urls (iterable of str): The pages to ingest.
+            corpus_path (str): The corpus file to append to, or the corpus store directory.
+            extract (callable): Takes a URL and returns (source_type, content), e.g. Streamlit_app.extract_source.
+
+        Returns:
+            int: The number of pages written.
+    """
+    written = 0
+    store = CorpusStore(corpus_path) if os.path.isdir(corpus_path) else None
+    with store if store is not None else open(corpus_path, "a", encoding="utf-8") as file:
+        for url in urls:
+            try:
+                source_type, content = extract(url)
+            except Exception as e:
+                logging.info(f"Failed to ingest {url}: {e}")
+                continue
+            if is_failed_extraction(content):
+                logging.info(f"Failed to ingest {url}: nothing could be extracted")
+                continue
+            if store is not None:
+                store.put(url, source_type, content)
+            else:
+                file.write(json.dumps({"url": url, "source_type": source_type, "content": content}) + "\n")
+            written += 1
+    return written
+
+
+class LocalSearch:
+    """
+        Searches the per-year indexes stored in a directory as <directory>/<year>.json.
+
+        Indexes are loaded lazily on the first search for their year.
+
+        Args:
+            directory (str): The directory holding the index files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index_path(self, year):
+        return os.path.join(self.directory, f"{year}.json")
+
+    def get_index(self, year):
+        """
+            Returns the index of a year, or None if it was not built.
+        """
+        with self._lock:
+            if year not in self._indexes:
+                path = self.index_path(year)
+                self._indexes[year] = SearchIndex.load(path) if os.path.exists(path) else None
+            return self._indexes[year]
+
+    def search(self, query, year, k=5):
+        """
+            Returns the URLs of the k best matching pages for a query, or an empty list if the year has no index.
+        """
+        index = self.get_index(int(year))
+        if index is None:
+            return []
+        return [url for url, _ in index.search(query, k=k)]
+
+
+def get_local_search():
+    """
+        Returns the process-wide local search over the indexes in SEARCH_INDEX_DIR (default
+        ~/.cache/civil3d_assistant/search_index), or None if SEARCH_INDEX_ENABLED is set to 0.
+    """
+    global _local_search
+    if os.getenv("SEARCH_INDEX_ENABLED", "1") == "0":
+        return None
+    with _local_search_lock:
+        if _local_search is None:
+            directory = os.getenv("SEARCH_INDEX_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "civil3d_assistant", "search_index"))
+            _local_search = LocalSearch(directory)
+        return _local_search
+
+
+def reset_local_search():
+    """
+        Forgets the process-wide local search so indexes are loaded again on the next search.
+    """
+    global _local_search
+    with _local_search_lock:
+        _local_search = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the local search indexes of the Civil 3D AI Assistant.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Extract pages and append them to a corpus file")
+    ingest_parser.add_argument("urls", help="A text file with one URL per line")
+    ingest_parser.add_argument("corpus", help="The JSONL corpus file to append to, or a corpus store directory")
+
+    build_parser = subparsers.add_parser("build", help="Build the per-year indexes from a corpus file")
+    build_parser.add_argument("corpus", help="The JSONL corpus file or corpus store directory")
+    build_parser.add_argument("--output", default=None, help="The index directory (default: SEARCH_INDEX_DIR)")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        # Imported here so building indexes does not need the app's dependencies
+        from Streamlit_app import extract_source
+        with open(args.urls, "r", encoding="utf-8") as file:
+            urls = [line.strip() for line in file if line.strip()]
+        print(f"Ingested {ingest(urls, args.corpus, extract_source)} of {len(urls)} pages")
+        return
+
+    local_search = get_local_search() if args.output is None else LocalSearch(args.output)
+    if local_search is None:
+        parser.error("SEARCH_INDEX_ENABLED is 0, pass --output")
+    for year, index in build_indexes(read_corpus(args.corpus)).items():
+        index.save(local_search.index_path(year))
+        print(f"{year}: {len(index)} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import contextvars
+import threading
+from collections import OrderedDict
+
+# Named process-wide instances, shared by every Streamlit session like the WebDriver pool
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.interrupted = False
+        self.waiters = 0
+
+
+class Progress:
+    """
+        The progress of a call started with SingleFlight.start: the values it published, in order, then its end.
+        Any number of readers can follow it from the first value, each at its own pace.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._values = []
+        self._finished = False
+        self._error = None
+
+    def publish(self, value):
+        with self._condition:
+            self._values.append(value)
+            self._condition.notify_all()
+
+    def finished(self):
+        with self._condition:
+            return self._finished
+
+    def __iter__(self):
+        """
+            Yields every value published, waiting for the next ones until the call ends.
+
+            Raises:
+                Exception: The exception raised by the call, after the values it published.
+        """
+        position = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: position < len(self._values) or self._finished)
+                values = self._values[position:]
+                finished, error = self._finished, self._error
+            for value in values:
+                yield value
+            position += len(values)
+            if finished and not values:
+                if error is not None:
+                    raise error
+                return
+
+    def _finish(self, error=None):
+        with self._condition:
+            self._finished = True
+            self._error = error
+            self._condition.notify_all()
+
+
+class SingleFlight:
+    """
+        Runs at most one call per key at a time. Callers asking for a key that is already being computed wait for
+        that call and share its result, or its exception.
+
+        Only exceptions derived from Exception are shared. A call interrupted by anything else (e.g. the
+        KeyboardInterrupt or the rerun of a Streamlit script raising in the caller that runs it) belongs to that
+        caller alone, so one of the waiting callers runs the call again.
+
+        With memo_size, the results of the last memo_size successful calls are also kept, so later callers of the
+        same key do not run it again. Exceptions are never remembered.
+
+        Args:
+            memo_size (int): The number of completed results kept, least recently used first out. 0 keeps none.
+    """
+
+    def __init__(self, memo_size=0):
+        self.memo_size = memo_size
+        self._calls = {}
+        self._started = {}
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0, "memo_hits": 0}
+
+    def do(self, key, function):
+        """
+            Returns the result of function() for a key, running it only if no call for the key is in flight.
+
+            Args:
+                key (hashable): The key identifying the computation.
+                function (callable): Computes the result, called without arguments.
+
+            Returns:
+                The result of the call for the key.
+
+            Raises:
+                Exception: The exception raised by the call for the key.
+        """
+        while True:
+            with self._lock:
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    self._stats["memo_hits"] += 1
+                    return self._memo[key]
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._stats["calls"] += 1
+                else:
+                    call.waiters += 1
+                    self._stats["shared"] += 1
+
+            if leader:
+                break
+            call.done.wait()
+            if call.interrupted:
+                # Run the call again, here, unless another waiting caller already does
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.interrupted = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and not call.interrupted and self.memo_size > 0:
+                    self._memo[key] = call.result
+                    while len(self._memo) > self.memo_size:
+                        self._memo.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def start(self, key, function):
+        """
+            Starts function(progress) on a thread of its own unless a call for the key is already running, and
+            returns the Progress of the call for the key.
+
+            Unlike with do(), the call does not run in any of the callers, so a caller that stops following it
+            does not affect the others. The thread runs in a copy of the context of the caller that started it.
+
+            Args:
+                key (hashable): The key identifying the computation.
+                function (callable): Computes the result, publishing it with progress.publish(value).
+
+            Returns:
+                tuple: A tuple containing:
+                    - progress (Progress): The progress of the call for the key.
+                    - started (bool): Whether this caller started the call.
+        """
+        with self._lock:
+            progress = self._started.get(key)
+            if progress is not None:
+                self._stats["shared"] += 1
+                return progress, False
+            progress = self._started[key] = Progress()
+            self._stats["calls"] += 1
+
+        def run():
+            error = None
+            try:
+                function(progress)
+            except Exception as e:
+                error = e
+            finally:
+                with self._lock:
+                    del self._started[key]
+                progress._finish(error)
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name="single-flight", daemon=True).start()
+        return progress, True
+
+    def in_flight(self, key):
+        """
+            Returns True if a call for the key is running.
+        """
+        with self._lock:
+            return key in self._calls or key in self._started
+
+    def forget(self, key):
+        """
+            Drops the remembered result of a key, if any.
+        """
+        with self._lock:
+            self._memo.pop(key, None)
+
+    def stats(self):
+        """
+            Returns a snapshot of the statistics.
+
+            Returns:
+                dict: The number of calls run, of callers that shared an in-flight call, of callers answered from
+                    the remembered results, and of remembered results.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memo_entries"] = len(self._memo)
+        return stats
+
+
+def get_single_flight(name, memo_size=0):
+    """
+        Returns the process-wide SingleFlight registered under a name, creating it on first use.
+
+        Args:
+            name (str): The name of the instance, e.g. "questions".
+            memo_size (int): The memo_size of the instance if it is created.
+
+        Returns:
+            SingleFlight: The shared instance.
+    """
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(memo_size=memo_size)
+        return _flights[name]
@@ -1,23 +1,62 @@
 import unittest
 from unittest.mock import patch, Mock, MagicMock
 import Streamlit_app
+import webdriver_pool
+import answer_cache
+import bench_forum_parser
+import bench_pipeline
+import page_cache
+import search_cache
+import search_index
+import single_flight
+import tracing
+from deadline import deadline_scope
+from fixture_server import AutodeskReplayServer, FakeOpenAIServer, FixtureServer
+import os
 import re
+import requests
+import tempfile
+import threading
+import time
 
 # Assuming 'test_forum_page.txt' contains the HTML content of a forum page for testing
 with open("test_forum_page.txt", 'r', encoding='utf-8') as file:
     test_forum_page = file.read()
 
+# 'test_help_page.txt' contains the HTML of a help article file as served by help.autodesk.com/cloudhelp
+with open("test_help_page.txt", 'r', encoding='utf-8') as file:
+    test_help_page = file.read()
+
 class TestStreamlitApp(unittest.TestCase):
 
-    @patch('Streamlit_app.requests.get')
-    def test_extract_forum_info(self, mock_get):
+    def setUp(self):
+        # Keep every test away from the page, search and answer caches, the local search indexes and the pre-warm queue
+        self.env = patch.dict('os.environ', {"PAGE_CACHE_ENABLED": "0", "SEARCH_CACHE_ENABLED": "0",
+                                             "SEARCH_INDEX_ENABLED": "0", "ANSWER_CACHE_ENABLED": "0",
+                                             "PREWARM_RECORD_QUESTIONS": "0"})
+        self.env.start()
+        # Extraction times recorded by one test must not make another hedge its extractions
+        metrics = tracing.StageMetrics()
+        self.metrics = [patch('tracing.stage_metrics', metrics), patch('Streamlit_app.stage_metrics', metrics)]
+        for patcher in self.metrics:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.metrics:
+            patcher.stop()
+        self.env.stop()
+        # Drop the pooled (mocked) drivers so every test starts with an empty WebDriver pool
+        webdriver_pool.shutdown_driver_pool()
+
+    @patch('Streamlit_app.http_client.fetch')
+    def test_extract_forum_info(self, mock_fetch):
         self.maxDiff = None  # Show the full diff in case of assertion failure
 
         # Mocking the response content with HTML example of the forum page
         mock_response = Mock()
         mock_response.content = test_forum_page
-        mock_response.raise_for_status = Mock()
-        mock_get.return_value = mock_response
+        mock_response.revalidated = False
+        mock_fetch.return_value = mock_response
 
         url = "http://example.com"
         original_question, accepted_solutions = Streamlit_app.extract_forum_info(url)
@@ -83,6 +122,92 @@ class TestStreamlitApp(unittest.TestCase):
 
         expected_links = [f"http://example.com/link{i}" for i in range(5)]
         self.assertEqual(top_5_links, expected_links)
+        # Browsers must not share a fixed DevTools port
+        arguments = [call.args[0] for call in mock_options.return_value.add_argument.call_args_list]
+        self.assertFalse([argument for argument in arguments if argument.startswith("--remote-debugging-port")])
+
+    @patch('Streamlit_app.st')
+    def test_main_when_browsers_are_busy(self, mock_st):
+        mock_st.container.return_value.__enter__.return_value = mock_st
+        mock_st.text_input.return_value = 'Test question'
+        mock_st.button.return_value = True
+        mock_st.selectbox.return_value = "2024"
+        pool = webdriver_pool.get_driver_pool(MagicMock)
+        pool.max_queue = 0
+        pooled = [pool.acquire() for _ in range(pool.size)]
+
+        with patch('Streamlit_app.stream_gpt_4o') as mock_stream_gpt_4o:
+            Streamlit_app.main()
+
+        mock_st.warning.assert_called_once_with(Streamlit_app.BUSY_MESSAGE)
+        mock_stream_gpt_4o.assert_not_called()
+        self.assertEqual(pool.stats()["shed"], 1)
+        for driver in pooled:
+            pool.release(driver)
+
+    @patch('Streamlit_app.webdriver.Chrome')
+    @patch('Streamlit_app.ChromeDriverManager')
+    @patch('Streamlit_app.Options')
+    @patch('Streamlit_app.Service')
+    def test_lean_browser_mode(self, mock_service, mock_options, mock_chromedriver_manager, mock_chrome):
+        driver = Streamlit_app.create_chrome_driver(lean=True)
+
+        self.assertEqual(mock_options.return_value.page_load_strategy, "eager")
+        driver.execute_cdp_cmd.assert_any_call("Network.setBlockedURLs", {"urls": Streamlit_app.LEAN_BLOCKED_URLS})
+
+        mock_chrome.reset_mock()
+        with patch.dict('os.environ', {"BROWSER_LEAN": "0"}):
+            driver = Streamlit_app.create_chrome_driver()
+        driver.execute_cdp_cmd.assert_not_called()
+
+    def test_page_weight(self):
+        driver = MagicMock()
+        driver.execute_script.return_value = {"bytes": 2048.0, "requests": 3}
+        self.assertEqual(Streamlit_app.page_weight(driver), {"bytes": 2048, "requests": 3})
+        driver.execute_script.side_effect = Exception("no page")
+        self.assertEqual(Streamlit_app.page_weight(driver), {})
+
+    @patch('Streamlit_app.search_autodesk_help')
+    def test_get_top_5_links_is_cached(self, mock_search):
+        mock_search.return_value = ["http://example.com/link0"]
+
+        with tempfile.TemporaryDirectory() as directory:
+            with patch.dict('os.environ', {"SEARCH_CACHE_ENABLED": "1",
+                                           "SEARCH_CACHE_PATH": os.path.join(directory, "search.sqlite3")}):
+                search_cache.reset_search_cache()
+                try:
+                    first = Streamlit_app.get_top_5_links("How do I create a corridor?", 2024)
+                    second = Streamlit_app.get_top_5_links("how do i  create a corridor", 2024)
+                    Streamlit_app.get_top_5_links("How do I create a corridor?", 2023)
+                finally:
+                    search_cache.reset_search_cache()
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_search.call_count, 2)
+
+    @patch('Streamlit_app.search_autodesk_help')
+    def test_get_top_5_links_uses_local_index(self, mock_search):
+        mock_search.return_value = ["http://example.com/live"]
+        index = search_index.SearchIndex()
+        index.add_document("https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-1", "Create a corridor")
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(os.path.join(directory, "2024.json"))
+            with patch.dict('os.environ', {"SEARCH_INDEX_ENABLED": "1", "SEARCH_INDEX_DIR": directory}):
+                search_index.reset_local_search()
+                try:
+                    local_links = Streamlit_app.get_top_5_links("corridor", 2024)
+                    # No match in the index falls back to the live search
+                    fallback_links = Streamlit_app.get_top_5_links("pipe network", 2024)
+                    # A version without an index uses the live search
+                    other_version_links = Streamlit_app.get_top_5_links("corridor", 2023)
+                finally:
+                    search_index.reset_local_search()
+
+        self.assertEqual(local_links, ["https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-1"])
+        self.assertEqual(fallback_links, ["http://example.com/live"])
+        self.assertEqual(other_version_links, ["http://example.com/live"])
+        self.assertEqual(mock_search.call_count, 2)
 
     @patch('Streamlit_app.webdriver.Chrome')
     @patch('Streamlit_app.ChromeDriverManager')
@@ -119,11 +244,599 @@ class TestStreamlitApp(unittest.TestCase):
         self.assertEqual(image_urls, ["http://example.com/image1.jpg", "http://example.com/image2.jpg"])
         self.assertEqual(video_urls, ["http://example.com/video1.mp4"])
 
-        # Ensure WebDriver was called correctly
+        # Ensure WebDriver was called correctly and returned to the pool instead of being quit
+        mock_chrome.assert_called_once()
+        mock_driver.get.assert_any_call(url)
+        mock_driver.quit.assert_not_called()
+
+        # A second page reuses the running driver
+        Streamlit_app.extract_content_from_autodesk_help(url)
         mock_chrome.assert_called_once()
-        mock_driver.get.assert_called_once_with(url)
+
+        # Shutting the pool down quits the driver
+        webdriver_pool.shutdown_driver_pool()
         mock_driver.quit.assert_called_once()
 
+    def test_parse_forum_page_matches_previous_parser(self):
+        pages = [test_forum_page, bench_forum_parser.synthetic_thread(60, accepted_every=20)]
+        for page in pages:
+            expected = bench_forum_parser.legacy_parse_forum_page(page)
+            for parser in bench_forum_parser.available_parsers():
+                with self.subTest(parser=parser):
+                    self.assertEqual(Streamlit_app.parse_forum_page(page, parser=parser), expected)
+
+        original_question, accepted_solutions = Streamlit_app.parse_forum_page(pages[1])
+        self.assertEqual(len(accepted_solutions), 3)
+        self.assertIn("Link: https://example.com/video20.mp4", accepted_solutions[0])
+
+    @patch('Streamlit_app.http_client.fetch')
+    def test_extract_forum_info_is_cached(self, mock_fetch):
+        mock_response = Mock()
+        mock_response.content = test_forum_page
+        mock_fetch.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            with patch.dict('os.environ', {"PAGE_CACHE_ENABLED": "1",
+                                           "PAGE_CACHE_PATH": os.path.join(directory, "pages.sqlite3")}):
+                page_cache.reset_page_cache()
+                try:
+                    first = Streamlit_app.extract_forum_info("https://forums.autodesk.com/t5/thread/#reply")
+                    second = Streamlit_app.extract_forum_info("HTTPS://forums.autodesk.com/t5/thread/")
+                    stats = page_cache.get_page_cache().stats()
+                finally:
+                    page_cache.reset_page_cache()
+
+        self.assertEqual(second, first)
+        self.assertIsInstance(second, tuple)
+        mock_fetch.assert_called_once()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_get_help_content_urls(self):
+        view_url = "https://help.autodesk.com/view/CIV3D/2023/ENU/?guid=GUID-1234"
+        self.assertEqual(
+            Streamlit_app.get_help_content_urls(view_url),
+            ["https://help.autodesk.com/cloudhelp/2023/ENU/Civil3D-UserGuide/files/GUID-1234.htm"]
+        )
+        article_url = "https://help.autodesk.com/cloudhelp/2023/ENU/Civil3D-UserGuide/files/GUID-1234.htm"
+        self.assertEqual(Streamlit_app.get_help_content_urls(article_url), [article_url])
+        self.assertEqual(Streamlit_app.get_help_content_urls("http://example.com"), [])
+
+    @patch('Streamlit_app.webdriver.Chrome')
+    def test_extract_content_from_autodesk_help_fast_path(self, mock_chrome):
+        article_path = "/cloudhelp/2024/ENU/Civil3D-UserGuide/files/GUID-1234.htm"
+        with FixtureServer({article_path: test_help_page}) as server:
+            with patch.dict('os.environ', {"HELP_CONTENT_BASE_URL": server.url("/cloudhelp")}):
+                extracted_text, image_urls, video_urls = Streamlit_app.extract_content_from_autodesk_help(
+                    "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-1234"
+                )
+
+        self.assertIn("Click Home tab > Create Design panel > Corridor.", extracted_text)
+        self.assertIn("Click OK to create the corridor.", extracted_text)
+        self.assertEqual(image_urls, [
+            server.url("/cloudhelp/2024/ENU/Civil3D-UserGuide/images/GUID-CORRIDOR-DIALOG.png"),
+            "https://help.autodesk.com/cloudhelp/2024/ENU/Civil3D-UserGuide/images/GUID-CORRIDOR-MODEL.png",
+        ])
+        self.assertEqual(video_urls, ["https://help.autodesk.com/videos/create-corridor.mp4"])
+        # No browser is started when the fast path succeeds
+        mock_chrome.assert_not_called()
+
+    @patch('Streamlit_app.webdriver.Chrome')
+    @patch('Streamlit_app.ChromeDriverManager')
+    @patch('Streamlit_app.Options')
+    @patch('Streamlit_app.Service')
+    def test_extract_content_from_autodesk_help_falls_back_to_browser(self, mock_service, mock_options,
+                                                                       mock_chromedriver_manager, mock_chrome):
+        mock_driver = MagicMock()
+        mock_chrome.return_value = mock_driver
+        mock_driver.page_source = test_help_page
+
+        # The fixture server has no article file, so the fast path finds nothing
+        with FixtureServer() as server:
+            with patch.dict('os.environ', {"HELP_CONTENT_BASE_URL": server.url("/cloudhelp")}):
+                url = "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-MISSING"
+                extracted_text, image_urls, video_urls = Streamlit_app.extract_content_from_autodesk_help(url)
+
+        self.assertEqual(server.requests, ["/cloudhelp/2024/ENU/Civil3D-UserGuide/files/GUID-MISSING.htm"])
+        mock_driver.get.assert_any_call(url)
+        self.assertIn("Click OK to create the corridor.", extracted_text)
+        self.assertEqual(image_urls[0], "../images/GUID-CORRIDOR-DIALOG.png")
+        self.assertEqual(video_urls, ["https://help.autodesk.com/videos/create-corridor.mp4"])
+
+    @patch('Streamlit_app.extract_content_from_autodesk_help')
+    @patch('Streamlit_app.extract_forum_info')
+    @patch('Streamlit_app.get_top_5_links')
+    def test_concurrent_prompt_matches_sequential(self, mock_get_top_5_links, mock_extract_forum_info,
+                                                  mock_extract_content):
+        links = [f"http://example.com/link{i}" for i in range(5)]
+        mock_get_top_5_links.return_value = links
+
+        def fake_forum_info(url):
+            # Later links finish first so completion order differs from search-rank order
+            index = int(url[-1])
+            time.sleep(0.01 * (5 - index))
+            if index % 2:
+                return "Failed to retrieve the original question.", ["No accepted solutions found."]
+            return f"Question {index}", [f"Solution {index}"]
+
+        mock_extract_forum_info.side_effect = fake_forum_info
+        mock_extract_content.side_effect = lambda url: (f"Article {url[-1]}", [f"img{url[-1]}.png"], [])
+
+        sequential_prompt, _ = Streamlit_app.ask_question_on_autodesk_and_generate_prompt("question", max_workers=1)
+        concurrent_prompt, top_5_links = Streamlit_app.ask_question_on_autodesk_and_generate_prompt("question")
+
+        self.assertEqual(concurrent_prompt, sequential_prompt)
+        self.assertEqual(top_5_links, links)
+        positions = [concurrent_prompt.index(f"{kind} {i}")
+                     for i, kind in enumerate(["Question", "Article", "Question", "Article", "Question"])]
+        self.assertEqual(positions, sorted(positions))
+
+    @patch('Streamlit_app.extract_content_from_autodesk_help')
+    @patch('Streamlit_app.extract_forum_info')
+    def test_extract_source_routes_by_host(self, mock_extract_forum_info, mock_extract_content):
+        mock_extract_forum_info.return_value = ("Question", ["Solution"])
+        mock_extract_content.return_value = ("Article", [], [])
+
+        help_url = "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-1"
+        self.assertEqual(Streamlit_app.extract_source(help_url), ("help", ("Article", [], [])))
+        mock_extract_forum_info.assert_not_called()
+
+        forum_url = "https://forums.autodesk.com/t5/civil-3d-forum/thread/td-p/1"
+        self.assertEqual(Streamlit_app.extract_source(forum_url), ("forum", ("Question", ["Solution"])))
+        mock_extract_content.assert_called_once_with(help_url)
+
+    @patch('Streamlit_app.extract_source')
+    def test_extract_sources_concurrently_drops_slow_links(self, mock_extract_source):
+        def fake_extract_source(url):
+            if url.endswith("slow"):
+                time.sleep(0.5)
+            return "help", (url, [], [])
+
+        mock_extract_source.side_effect = fake_extract_source
+        links = ["http://example.com/fast", "http://example.com/slow", "http://example.com/fast2"]
+
+        started = time.monotonic()
+        results = Streamlit_app.extract_sources_concurrently(links, link_timeout=0.1, deadline=1)
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, [("help", (links[0], [], [])), None, ("help", (links[2], [], []))])
+
+    @patch('Streamlit_app.extract_source')
+    def test_extract_sources_concurrently_times_links_from_their_start(self, mock_extract_source):
+        def fake_extract_source(url):
+            time.sleep(0.15)
+            return "help", (url, [], [])
+
+        mock_extract_source.side_effect = fake_extract_source
+        links = [f"http://example.com/link{i}" for i in range(4)]
+
+        # Extracted one after the other, every link takes less than its timeout even though they all take longer
+        results = Streamlit_app.extract_sources_concurrently(links, max_workers=1, link_timeout=0.3, deadline=2,
+                                                             hedge=False)
+
+        self.assertEqual(results, [("help", (url, [], [])) for url in links])
+
+    @patch('Streamlit_app.extract_source')
+    def test_extract_sources_concurrently_hedges_slow_links(self, mock_extract_source):
+        calls = []
+
+        def fake_extract_source(url):
+            calls.append(url)
+            # Only the first run of the slow link is slow, its hedge answers right away
+            if url.endswith("slow") and calls.count(url) == 1:
+                time.sleep(1)
+            return "help", (url, [], [])
+
+        mock_extract_source.side_effect = fake_extract_source
+        links = ["http://example.com/fast", "http://example.com/slow"]
+        metrics = tracing.StageMetrics()
+        for _ in range(Streamlit_app.HEDGE_MIN_SAMPLES):
+            metrics.observe(Streamlit_app.HEDGE_STAGE, 0.05)
+
+        with patch('Streamlit_app.stage_metrics', metrics):
+            started = time.monotonic()
+            results = Streamlit_app.extract_sources_concurrently(links, link_timeout=2, deadline=2)
+            elapsed = time.monotonic() - started
+            self.assertEqual(results, [("help", (url, [], [])) for url in links])
+            self.assertLess(elapsed, 0.5)
+            self.assertEqual(calls.count("http://example.com/slow"), 2)
+            self.assertEqual(calls.count("http://example.com/fast"), 1)
+
+            # Too few recorded extraction times, or hedging turned off: no duplicate is started
+            calls.clear()
+            Streamlit_app.extract_sources_concurrently(links, link_timeout=2, deadline=2, hedge=False)
+            self.assertEqual(calls.count("http://example.com/slow"), 1)
+
+        # Cache hits and failures are not extraction times, only the successful runs of the extractors count
+        metrics = tracing.StageMetrics()
+        for _ in range(Streamlit_app.HEDGE_MIN_SAMPLES):
+            metrics.observe("extract_source", 0.001)
+        extractor = Streamlit_app.timed_extraction(lambda content: content[0] == "failed")(lambda url: (url, []))
+        with patch('Streamlit_app.stage_metrics', metrics):
+            extractor("page")
+            extractor("failed")
+            calls.clear()
+            Streamlit_app.extract_sources_concurrently(links, link_timeout=2, deadline=2)
+        self.assertEqual(calls.count("http://example.com/slow"), 1)
+        self.assertEqual(metrics.summary()[Streamlit_app.HEDGE_STAGE]["count"], 1)
+
+    @patch('Streamlit_app.extract_source')
+    @patch('Streamlit_app.get_top_5_links')
+    def test_retrieve_sources_within_the_deadline(self, mock_get_top_5_links, mock_extract_source):
+        links = ["http://example.com/fast", "http://example.com/slow", "http://example.com/missing"]
+        mock_get_top_5_links.side_effect = [Exception("Search failed"), links]
+
+        def fake_extract_source(url):
+            if url.endswith("slow"):
+                time.sleep(1)
+            if url.endswith("missing"):
+                raise requests.HTTPError("404 Client Error")
+            return "help", (f"Article {url[-4:]}", [], [])
+
+        mock_extract_source.side_effect = fake_extract_source
+        started = time.monotonic()
+        timed_out = []
+        with patch.dict('os.environ', {"HEDGE_REQUESTS": "0"}):
+            sources, top_5_links = Streamlit_app.retrieve_sources("question", deadline=0.4, timed_out=timed_out)
+
+        # The failed search is retried right away, and the slow link is left out when the deadline is near
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(mock_get_top_5_links.call_count, 2)
+        self.assertEqual(top_5_links, links)
+        self.assertEqual(sources, [("help", ("Article fast", [], [])), None, None])
+        self.assertEqual(timed_out, ["http://example.com/slow"])
+
+        # Only the link that ran out of time is named as such, not the one that failed
+        prompt = Streamlit_app.build_prompt("question", sources, token_budget=0, timed_out=timed_out)
+        self.assertIn("Article fast", prompt)
+        self.assertIn("could not be retrieved in time and were left out: http://example.com/slow", prompt)
+        self.assertNotIn("missing", prompt)
+        self.assertNotIn("left out", Streamlit_app.build_prompt("question", sources, token_budget=0))
+
+    def test_build_prompt_leaves_failed_extractions_out(self):
+        sources = [("help", ("Corridor article", [], [])), ("help", (Streamlit_app.HELP_FAILURE, [], [])),
+                   ("forum", (Streamlit_app.FORUM_FAILURE, []))]
+
+        for token_budget in (0, 6000):
+            prompt = Streamlit_app.build_prompt("question", sources, token_budget=token_budget)
+            self.assertIn("Corridor article", prompt)
+            self.assertNotIn(Streamlit_app.HELP_FAILURE, prompt)
+            self.assertNotIn(Streamlit_app.FORUM_FAILURE, prompt)
+
+    @patch('Streamlit_app.extract_source')
+    @patch('Streamlit_app.get_top_5_links')
+    def test_retrieve_sources_retries_failed_searches(self, mock_get_top_5_links, mock_extract_source):
+        links = ["http://example.com/page"]
+        mock_get_top_5_links.side_effect = [[Streamlit_app.SEARCH_FAILURE], links]
+        mock_extract_source.return_value = ("help", ("Article", [], []))
+
+        sources, top_5_links = Streamlit_app.retrieve_sources("question", deadline=2)
+
+        self.assertEqual(mock_get_top_5_links.call_count, 2)
+        self.assertEqual((sources, top_5_links), ([("help", ("Article", [], []))], links))
+
+        # Once the attempts are used up, the failure is returned and nothing is extracted
+        mock_get_top_5_links.side_effect = None
+        mock_get_top_5_links.return_value = [Streamlit_app.SEARCH_FAILURE]
+        mock_extract_source.reset_mock()
+
+        sources, top_5_links = Streamlit_app.retrieve_sources("question", deadline=2)
+
+        self.assertEqual((sources, top_5_links), ([], [Streamlit_app.SEARCH_FAILURE]))
+        mock_extract_source.assert_not_called()
+
+    def test_stream_gpt_4o(self):
+        with FakeOpenAIServer(answer="Use the Corridor command.", first_token_delay=0.1, token_delay=0.05) as server:
+            with patch.dict('os.environ', {"OPENAI_BASE_URL": server.url("/v1"), "OPENAI_API_KEY": "test"}):
+                timings = {}
+                chunks = list(Streamlit_app.stream_gpt_4o("prompt", timings))
+
+        self.assertEqual("".join(chunks), "Use the Corridor command.")
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(server.payloads[0]["stream"])
+        self.assertEqual(server.payloads[0]["messages"], [{"role": "user", "content": "prompt"}])
+        self.assertGreaterEqual(timings["time_to_first_token"], 0.1)
+        self.assertGreater(timings["generation_time"], timings["time_to_first_token"])
+
+    def test_gpt_4o_answers_within_the_deadline(self):
+        with FakeOpenAIServer(answer="Use the Corridor command.", first_token_delay=2) as server, \
+                patch.dict('os.environ', {"OPENAI_BASE_URL": server.url("/v1"), "OPENAI_API_KEY": "test"}):
+            started = time.monotonic()
+            with deadline_scope(0.3):
+                response = Streamlit_app.generate_answer("prompt")
+            self.assertEqual(response.choices[0].message.content, Streamlit_app.ANSWER_TIMEOUT)
+            # Not retried after the timeout
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(len(server.payloads), 1)
+
+        # A stream is cut short at the deadline, even while tokens keep coming
+        with FakeOpenAIServer(answer="Use the Corridor command.", token_delay=0.3) as server, \
+                patch.dict('os.environ', {"OPENAI_BASE_URL": server.url("/v1"), "OPENAI_API_KEY": "test"}):
+            timings = {}
+            with deadline_scope(0.45):
+                chunks = list(Streamlit_app.stream_gpt_4o("prompt", timings))
+
+        self.assertEqual(chunks[-1], "\n\n" + Streamlit_app.ANSWER_TIMEOUT)
+        self.assertTrue("".join(chunks[:-1]) and "Use the Corridor command.".startswith("".join(chunks[:-1])))
+        self.assertTrue(timings["timed_out"])
+        self.assertLess(timings["generation_time"], 0.9)
+
+    @patch('Streamlit_app.retrieve_sources')
+    def test_ask_gpt_4o_answer_cache(self, mock_retrieve_sources):
+        links = ["http://example.com/link1"]
+        mock_retrieve_sources.return_value = ([("help", ("Corridor article", [], []))], links)
+
+        with FakeOpenAIServer(answer="Use the Corridor command.") as server:
+            with patch.dict('os.environ', {"OPENAI_BASE_URL": server.url("/v1"), "OPENAI_API_KEY": "test",
+                                           "ANSWER_CACHE_ENABLED": "1"}):
+                answer_cache.reset_answer_cache()
+                try:
+                    first, _ = Streamlit_app.ask_gpt_4o("How do I create a corridor?", 2024)
+                    second, second_links = Streamlit_app.ask_gpt_4o("how do I create a corridor", 2024)
+                    # A changed source invalidates the cached answer
+                    mock_retrieve_sources.return_value = ([("help", ("Updated article", [], []))], links)
+                    Streamlit_app.ask_gpt_4o("How do I create a corridor?", 2024)
+                    stats = answer_cache.get_answer_cache().stats()
+                finally:
+                    answer_cache.reset_answer_cache()
+
+        self.assertEqual(second.choices[0].message.content, first.choices[0].message.content)
+        self.assertEqual(second_links, links)
+        self.assertEqual(len(server.payloads), 2)
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertGreater(stats["tokens_saved"], 0)
+
+    def test_bench_pipeline_runs_offline(self):
+        report = bench_pipeline.run_benchmark(questions=3, concurrency=(1, 2), forum_pages=2, help_pages=2,
+                                              site_latency=0, first_token_delay=0, token_delay=0)
+
+        for scenario in ("prompt", "answer"):
+            for level in ("1", "2"):
+                result = report["results"][scenario][level]
+                self.assertEqual((result["requests"], result["errors"]), (3, 0))
+                self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+                self.assertGreater(result["throughput_per_second"], 0)
+        # The routes of the replay server do not outlive the benchmark
+        self.assertFalse([name for name in Streamlit_app.extractor_registry.stats() if name.startswith("replay-")])
+
+    def test_autodesk_replay_server(self):
+        with AutodeskReplayServer([test_forum_page], [test_help_page], results_per_query=5) as server:
+            links = bench_pipeline.search_replay(server)("corridor targets")
+            forum_link = next(link for link in links if "/t5/" in link)
+            help_link = next(link for link in links if "/cloudhelp/" in link)
+            original_question, _ = Streamlit_app.extract_forum_info(forum_link)
+            extracted_text, _, _ = Streamlit_app.extract_help_content_http(help_link)
+
+        # Two pages, listed in a query-dependent order
+        self.assertEqual(len(links), 2)
+        self.assertTrue(original_question.startswith("Dynamic Block Stretch and Rotate Actions"))
+        self.assertTrue(extracted_text)
+
+    @patch('Streamlit_app.stream_gpt_4o')
+    @patch('Streamlit_app.build_prompt')
+    @patch('Streamlit_app.retrieve_sources')
+    @patch('Streamlit_app.st')
+    def test_main_streaming(self, mock_st, mock_retrieve_sources, mock_build_prompt, mock_stream_gpt_4o):
+        mock_retrieve_sources.return_value = ([("help", ("Article", [], []))], ["http://example.com/link1"])
+        mock_build_prompt.return_value = "prompt"
+
+        def fake_stream(prompt, timings):
+            yield "Streamed "
+            yield "answer"
+            timings.update(time_to_first_token=0.5, generation_time=2.0)
+
+        mock_stream_gpt_4o.side_effect = fake_stream
+
+        # The sources must already be on the page when the answer starts streaming
+        def fake_write_stream(stream):
+            mock_st.write.assert_any_call("http://example.com/link1")
+            return "".join(stream)
+
+        answer_container = mock_st.container.return_value
+        answer_container.write_stream.side_effect = fake_write_stream
+        mock_st.container.return_value.__enter__.return_value = mock_st
+        mock_st.text_input.return_value = 'Test question'
+        mock_st.button.return_value = True
+        mock_st.selectbox.return_value = "2023"
+
+        Streamlit_app.main()
+
+        mock_retrieve_sources.assert_called_once_with('Test question', year=2023, timed_out=[])
+        mock_stream_gpt_4o.assert_called_once_with("prompt", {"time_to_first_token": 0.5, "generation_time": 2.0})
+        answer_container.write_stream.assert_called_once()
+        answer_container.caption.assert_called_once_with("First words after 0.5s, answer generated in 2.0s")
+
+    @patch('Streamlit_app.stream_gpt_4o')
+    @patch('Streamlit_app.build_prompt')
+    @patch('Streamlit_app.retrieve_sources')
+    @patch('Streamlit_app.st')
+    def test_main_streaming_an_empty_answer(self, mock_st, mock_retrieve_sources, mock_build_prompt,
+                                            mock_stream_gpt_4o):
+        mock_retrieve_sources.return_value = ([("help", ("Article", [], []))], ["http://example.com/link1"])
+        mock_build_prompt.return_value = "prompt"
+
+        def empty_stream(prompt, timings):
+            timings.update(time_to_first_token=None, generation_time=1.0)
+            yield from ()
+
+        mock_stream_gpt_4o.side_effect = empty_stream
+        answer_container = mock_st.container.return_value
+        answer_container.write_stream.side_effect = lambda stream: list(stream)
+        mock_st.container.return_value.__enter__.return_value = mock_st
+        mock_st.session_state = {}
+        mock_st.text_input.return_value = 'Test question'
+        mock_st.button.return_value = True
+        mock_st.selectbox.return_value = "2024"
+
+        Streamlit_app.main()
+
+        # Nothing but text is streamed into the page, and there is no first token to report
+        self.assertEqual(mock_st.session_state["answers"][("test question", 2024)]["answer"], [])
+        answer_container.caption.assert_not_called()
+
+    @patch('Streamlit_app.stream_gpt_4o')
+    @patch('Streamlit_app.build_prompt')
+    @patch('Streamlit_app.retrieve_sources')
+    @patch('Streamlit_app.st')
+    def test_main_reruns_reuse_the_session_answer(self, mock_st, mock_retrieve_sources, mock_build_prompt,
+                                                   mock_stream_gpt_4o):
+        mock_retrieve_sources.return_value = ([("help", ("Article", [], []))], ["http://example.com/link1"])
+        mock_stream_gpt_4o.return_value = iter(["Streamed answer"])
+        mock_st.container.return_value.write_stream.side_effect = lambda stream: "".join(stream)
+        mock_st.container.return_value.__enter__.return_value = mock_st
+        mock_st.session_state = {}
+        mock_st.text_input.return_value = 'Test question'
+        mock_st.button.return_value = False
+        mock_st.selectbox.return_value = "2024"
+
+        Streamlit_app.main()
+        # A rerun, e.g. after another widget changed, with a trivially different spelling of the question
+        mock_st.text_input.return_value = 'test  QUESTION'
+        mock_st.write.reset_mock()
+        Streamlit_app.main()
+
+        mock_retrieve_sources.assert_called_once()
+        mock_stream_gpt_4o.assert_called_once()
+        mock_st.write.assert_any_call("Streamed answer")
+        mock_st.write.assert_any_call("http://example.com/link1")
+
+        # Another version is another question
+        mock_st.selectbox.return_value = "2023"
+        mock_stream_gpt_4o.return_value = iter(["Answer for 2023"])
+        Streamlit_app.main()
+        self.assertEqual(mock_retrieve_sources.call_count, 2)
+        self.assertEqual(set(mock_st.session_state["answers"]), {("test question", 2024), ("test question", 2023)})
+
+    @patch.dict('os.environ', {"STREAM_RESPONSES": "0"})
+    @patch('Streamlit_app.ask_gpt_4o')
+    @patch('Streamlit_app.st')
+    def test_concurrent_sessions_share_one_pipeline(self, mock_st, mock_ask_gpt_4o):
+        started = threading.Event()
+        release = threading.Event()
+        response = Mock()
+        response.choices = [Mock(message=Mock(content="Shared answer"))]
+
+        def slow_ask_gpt_4o(question, year):
+            started.set()
+            release.wait(5)
+            return response, ["http://example.com/link1"]
+
+        mock_ask_gpt_4o.side_effect = slow_ask_gpt_4o
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(Streamlit_app.answer_question("How do I add a target?", 2024)))
+        leader.start()
+        started.wait(5)
+        flight = single_flight.get_single_flight("questions")
+        shared = flight.stats()["shared"]
+        follower = threading.Thread(
+            target=lambda: results.append(Streamlit_app.answer_question("how do I add a target", 2024)))
+        follower.start()
+        while flight.stats()["shared"] == shared:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        mock_ask_gpt_4o.assert_called_once()
+        self.assertEqual(results, [{"answer": "Shared answer", "top_5_links": ["http://example.com/link1"]}] * 2)
+        # The pipeline runs apart from both sessions, and each of them shows the answer it publishes on its own page
+        self.assertEqual(len([c for c in mock_st.write.call_args_list if c.args == ("Shared answer",)]), 2)
+
+    @patch.dict('os.environ', {"STREAM_RESPONSES": "0"})
+    @patch('Streamlit_app.ask_gpt_4o')
+    @patch('Streamlit_app.st')
+    def test_a_session_rerunning_does_not_affect_the_others(self, mock_st, mock_ask_gpt_4o):
+        class RerunException(BaseException):
+            pass
+
+        started = threading.Event()
+        release = threading.Event()
+        response = Mock()
+        response.choices = [Mock(message=Mock(content="Shared answer"))]
+
+        def slow_ask_gpt_4o(question, year):
+            started.set()
+            release.wait(5)
+            return response, ["http://example.com/link1"]
+
+        def spinner(text):
+            # Streamlit interrupts the script of a session that reruns at its next call, like st.spinner
+            if threading.current_thread().name == "leader":
+                raise RerunException("leader session rerun data")
+            return MagicMock()
+
+        mock_ask_gpt_4o.side_effect = slow_ask_gpt_4o
+        mock_st.spinner.side_effect = spinner
+        outcomes = {}
+
+        def ask(name):
+            try:
+                outcomes[name] = Streamlit_app.answer_question("How do I add a target?", 2024)
+            except RerunException as e:
+                outcomes[name] = e
+
+        leader = threading.Thread(target=ask, args=("leader",), name="leader")
+        leader.start()
+        started.wait(5)
+        leader.join()
+        flight = single_flight.get_single_flight("questions")
+        shared = flight.stats()["shared"]
+        follower = threading.Thread(target=ask, args=("follower",), name="follower")
+        follower.start()
+        while flight.stats()["shared"] == shared:
+            time.sleep(0.01)
+        release.set()
+        follower.join()
+
+        # The follower gets its own answer on its own page, and the pipeline ran once for both
+        self.assertIsInstance(outcomes["leader"], RerunException)
+        self.assertEqual(outcomes["follower"], {"answer": "Shared answer", "top_5_links": ["http://example.com/link1"]})
+        mock_ask_gpt_4o.assert_called_once()
+        mock_st.write.assert_any_call("Shared answer")
+
+    @patch.dict('os.environ', {"STREAM_RESPONSES": "0", "DEBUG_PANEL": "1"})
+    @patch('Streamlit_app.create_openai_client')
+    @patch('Streamlit_app.extract_content_from_autodesk_help')
+    @patch('Streamlit_app.get_top_5_links')
+    @patch('Streamlit_app.st')
+    def test_main_traces_every_stage(self, mock_st, mock_get_top_5_links, mock_extract_help, mock_client):
+        links = ["https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=A",
+                 "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=B"]
+        mock_get_top_5_links.return_value = links
+        mock_extract_help.return_value = ("Article about corridors", [], [])
+        mock_client.return_value.chat.completions.create.return_value.choices = [
+            Mock(message=Mock(content="Answer"))]
+        mock_st.container.return_value.__enter__.return_value = mock_st
+        mock_st.text_input.return_value = 'Test question'
+        mock_st.button.return_value = True
+        mock_st.selectbox.return_value = "2024"
+
+        with patch('Streamlit_app.show_trace') as mock_show_trace:
+            Streamlit_app.main()
+
+        # The extractions run on worker threads but still belong to the trace of the question
+        trace = mock_show_trace.call_args[0][0]
+        records = trace.to_records()
+        names = [record["name"] for record in records]
+        self.assertEqual(names.count("extract_source"), 2)
+        self.assertEqual({record["attributes"]["url"] for record in records if record["name"] == "extract_source"},
+                         set(links))
+        for name in ("get_top_5_links", "prompt_assembly", "gpt_4o"):
+            self.assertIn(name, names)
+
+    @patch('Streamlit_app.st')
+    def test_show_trace(self, mock_st):
+        with tracing.start_trace("question") as trace:
+            with tracing.span("extract_source", url="http://example.com"):
+                pass
+
+        Streamlit_app.show_trace(trace)
+
+        mock_st.expander.assert_called_once_with("Request timings")
+        mock_st.altair_chart.assert_called_once()
+        self.assertIn("extract_source", mock_st.dataframe.call_args[0][0])
+
+    @patch.dict('os.environ', {"STREAM_RESPONSES": "0"})
     @patch('Streamlit_app.ask_gpt_4o')
     @patch('Streamlit_app.st')
     def test_main(self, mock_st, mock_ask_gpt_4o):
@@ -0,0 +1,55 @@
+import unittest
+
+from answer_cache import AnswerCache, question_similarity, source_fingerprint
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.sources = [("help", ("Corridor article", ["a.png"], [])), None]
+        self.fingerprint = source_fingerprint(self.sources)
+
+    def test_source_fingerprint(self):
+        self.assertEqual(source_fingerprint([("help", ["Corridor article", ["a.png"], []]), None]), self.fingerprint)
+        self.assertNotEqual(source_fingerprint([("help", ("Other article", ["a.png"], [])), None]), self.fingerprint)
+
+    def test_exact_hits_need_same_question_year_and_sources(self):
+        cache = AnswerCache()
+        cache.put("How do I create a corridor?", 2024, self.fingerprint, "Answer", tokens=1500)
+
+        self.assertEqual(cache.get("how do I create a CORRIDOR", 2024, self.fingerprint), "Answer")
+        self.assertIsNone(cache.get("How do I create a corridor?", 2023, self.fingerprint))
+        self.assertIsNone(cache.get("How do I create a corridor?", 2024, "other sources"))
+        self.assertIsNone(cache.get("How do I create a corridor surface?", 2024, self.fingerprint))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["tokens_saved"]), (1, 3, 1500))
+        self.assertEqual(stats["hit_rate"], 0.25)
+
+    def test_near_duplicate_questions(self):
+        self.assertEqual(question_similarity("create corridor surface", "corridor surface create"), 1.0)
+        self.assertEqual(question_similarity("the", "corridor"), 0.0)
+
+        cache = AnswerCache(similarity_threshold=0.6)
+        cache.put("How do I create a corridor surface?", 2024, self.fingerprint, "Answer")
+
+        self.assertEqual(cache.get("Creating the corridor surface", 2024, self.fingerprint), None)
+        self.assertEqual(cache.get("How can I create corridor surfaces", 2024, self.fingerprint), "Answer")
+        self.assertIsNone(cache.get("How can I create corridor surfaces", 2024, "other sources"))
+        self.assertEqual(cache.stats()["near_duplicate_hits"], 1)
+
+    def test_least_recently_used_answers_are_evicted(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("first", 2024, self.fingerprint, "1")
+        cache.put("second", 2024, self.fingerprint, "2")
+        cache.get("first", 2024, self.fingerprint)
+        cache.put("third", 2024, self.fingerprint, "3")
+
+        self.assertIsNone(cache.get("second", 2024, self.fingerprint))
+        self.assertEqual(cache.get("first", 2024, self.fingerprint), "1")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
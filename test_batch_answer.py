@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import batch_answer
+import Streamlit_app
+from fixture_server import FakeOpenAIServer
+
+LINKS = {
+    "corridor": ["https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=CORRIDOR",
+                 "https://forums.autodesk.com/t5/civil-3d-forum/targets/td-p/1"],
+    "profile": ["https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=CORRIDOR",
+                "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=PROFILE"],
+}
+
+
+def fake_top_5_links(search_query, year=2024):
+    return LINKS["corridor" if "corridor" in search_query else "profile"]
+
+
+class TestBatchAnswer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.input_path = os.path.join(self.directory.name, "questions.jsonl")
+        self.output_path = os.path.join(self.directory.name, "answers.jsonl")
+        with open(self.input_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"id": "q1", "question": "How do I add a corridor target?", "year": 2024}) + "\n")
+            file.write(json.dumps({"id": "q2", "question": "How do I label a profile?"}) + "\n")
+            file.write("\n")
+            file.write(json.dumps({"question": "Why is my corridor not rebuilding?", "year": 2023}) + "\n")
+
+        env = patch.dict('os.environ', {"PAGE_CACHE_ENABLED": "0", "SEARCH_CACHE_ENABLED": "0",
+                                        "SEARCH_INDEX_ENABLED": "0", "ANSWER_CACHE_ENABLED": "0"})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.extracted = []
+        self.lock = threading.Lock()
+
+        def fake_extract_source(link):
+            with self.lock:
+                self.extracted.append(link)
+            return "help", (f"Article at {link}", [], [])
+
+        for target, replacement in (("Streamlit_app.get_top_5_links", fake_top_5_links),
+                                    ("Streamlit_app.extract_source", fake_extract_source)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_output(self):
+        with open(self.output_path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_read_questions(self):
+        questions = list(batch_answer.read_questions(self.input_path, default_year=2025))
+        self.assertEqual([(q["id"], q["year"]) for q in questions], [("q1", 2024), ("q2", 2025), ("4", 2023)])
+
+    def test_shared_links_are_extracted_once(self):
+        with FakeOpenAIServer("Use the corridor properties.") as server, \
+                patch.dict('os.environ', {"OPENAI_BASE_URL": server.url("/v1"), "OPENAI_API_KEY": "test"}):
+            summary = batch_answer.run_batch(self.input_path, self.output_path, concurrency=3)
+
+        results = {result["id"]: result for result in self.read_output()}
+        self.assertEqual(set(results), {"q1", "q2", "4"})
+        self.assertEqual(results["q1"]["answer"], "Use the corridor properties.")
+        self.assertEqual(results["q2"]["sources"], LINKS["profile"])
+        self.assertEqual(sorted(self.extracted), sorted(set(LINKS["corridor"] + LINKS["profile"])))
+        self.assertEqual(summary["answered"], 3)
+        self.assertEqual((summary["links_extracted"], summary["links_reused"]), (3, 3))
+        self.assertEqual(len(server.payloads), 3)
+
+    def test_resume_skips_answered_questions(self):
+        # A crash left one answered question and half of a second line behind
+        with open(self.output_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"id": "q1", "question": "How do I add a corridor target?", "answer": "A"}) + "\n")
+            file.write('{"id": "q2", "quest')
+
+        summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+
+        results = self.read_output()
+        self.assertEqual([result["id"] for result in results][0], "q1")
+        self.assertEqual(sorted(result["id"] for result in results), ["4", "q1", "q2"])
+        self.assertIn("prompt", results[1])
+        self.assertEqual((summary["answered"], summary["skipped"]), (2, 1))
+
+        # Nothing is left to answer on the next run
+        summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+        self.assertEqual((summary["answered"], summary["skipped"]), (0, 3))
+        self.assertEqual(len(self.read_output()), 3)
+
+    def test_failed_questions_are_retried_on_request(self):
+        with patch("Streamlit_app.build_prompt", side_effect=RuntimeError("no sources")):
+            summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+        self.assertEqual(summary["failed"], 3)
+        self.assertEqual({result["error"] for result in self.read_output()}, {"no sources"})
+
+        summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+        self.assertEqual(summary["skipped"], 3)
+        summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False, retry_failed=True)
+        self.assertEqual(summary["answered"], 3)
+
+    def test_failed_searches_are_recorded_as_errors(self):
+        with patch("Streamlit_app.get_top_5_links", return_value=[Streamlit_app.SEARCH_FAILURE]):
+            summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+
+        self.assertEqual(summary["failed"], 3)
+        self.assertEqual({result["error"] for result in self.read_output()}, {Streamlit_app.SEARCH_FAILURE})
+        self.assertEqual(self.extracted, [])
+
+    def test_waiting_for_a_fetch_slot_does_not_drop_links(self):
+        def slow_extract_source(link):
+            time.sleep(0.2)
+            return "help", (f"Article at {link}", [], [])
+
+        # The two links take longer than the link timeout together, but only one is extracted at a time
+        with patch("Streamlit_app.extract_source", slow_extract_source), \
+                patch.dict('os.environ', {"EXTRACTION_LINK_TIMEOUT": "0.3", "HEDGE_REQUESTS": "0"}):
+            answerer = batch_answer.BatchAnswerer(max_fetches=1, answer=False)
+            result = answerer.answer_question({"id": "q2", "question": "How do I label a profile?", "year": 2024})
+
+        self.assertEqual(result["dropped"], [])
+        for link in LINKS["profile"]:
+            self.assertIn(f"Article at {link}", result["prompt"])
+
+    def test_failed_extractions_are_not_shared_with_later_questions(self):
+        shared_link = LINKS["corridor"][0]
+        failures = [True]
+
+        def flaky_extract_source(link):
+            with self.lock:
+                self.extracted.append(link)
+                if link == shared_link and failures:
+                    failures.pop()
+                    return "help", (Streamlit_app.HELP_FAILURE, [], [])
+            return "help", (f"Article at {link}", [], [])
+
+        with patch("Streamlit_app.extract_source", flaky_extract_source):
+            answerer = batch_answer.BatchAnswerer(answer=False)
+            first = answerer.answer_question({"id": "q1", "question": "How do I add a corridor target?",
+                                              "year": 2024})
+            second = answerer.answer_question({"id": "q2", "question": "How do I label a profile?", "year": 2024})
+
+        self.assertEqual(first["dropped"], [shared_link])
+        self.assertEqual(second["dropped"], [])
+        self.assertIn(f"Article at {shared_link}", second["prompt"])
+        self.assertEqual(self.extracted.count(shared_link), 2)
+
+    def test_questions_with_dropped_links_are_retried_on_request(self):
+        broken_link = LINKS["profile"][1]
+
+        def flaky_extract_source(link):
+            if link == broken_link:
+                return "help", (Streamlit_app.HELP_FAILURE, [], [])
+            return "help", (f"Article at {link}", [], [])
+
+        with patch("Streamlit_app.extract_source", flaky_extract_source):
+            summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False)
+        results = {result["id"]: result for result in self.read_output()}
+        self.assertEqual(results["q2"]["dropped"], [broken_link])
+        self.assertEqual(results["q1"]["dropped"], [])
+        self.assertEqual((summary["answered"], summary["partial"]), (3, 1))
+
+        summary = batch_answer.run_batch(self.input_path, self.output_path, answer=False, retry_failed=True)
+        self.assertEqual((summary["answered"], summary["partial"], summary["skipped"]), (1, 0, 2))
+        self.assertEqual(self.read_output()[-1]["id"], "q2")
+
+
+if __name__ == "__main__":
+    unittest.main()
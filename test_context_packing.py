@@ -0,0 +1,76 @@
+import unittest
+
+from context_packing import pack_sources, score_passages, split_passages
+
+
+def sentences(topic, count):
+    return " ".join(f"Sentence {i} talks about {topic} settings in detail." for i in range(count))
+
+
+class TestContextPacking(unittest.TestCase):
+
+    def test_split_passages(self):
+        text = "One two three. Four five. Six seven eight nine! Ten?"
+        self.assertEqual(split_passages(text, max_words=5), ["One two three. Four five.", "Six seven eight nine! Ten?"])
+        self.assertEqual(split_passages(""), [])
+
+    def test_score_passages(self):
+        scores = score_passages("corridor targets", [
+            "Set the corridor targets in the target mapping dialog.",
+            "Pipe networks use parts lists.",
+            "Corridor regions follow the baseline.",
+        ])
+        self.assertEqual(list(scores.argsort()[::-1]), [0, 2, 1])
+        self.assertEqual(scores[1], 0)
+        self.assertEqual(list(score_passages("the a of", ["Corridor"])), [0])
+
+    def test_sources_under_budget_are_unchanged(self):
+        sources = [
+            ("help", ("Corridor article.", ["image.png"], ["video.mp4"])),
+            None,
+            ("forum", ("Question", ["Solution one.", "Solution two."])),
+        ]
+        packed, stats = pack_sources("corridor", sources, token_budget=10000)
+        self.assertEqual(packed, sources)
+        self.assertEqual(stats["passages_before"], stats["passages_after"])
+        self.assertEqual(stats["passage_tokens_before"], stats["passage_tokens_after"])
+
+    def test_budget_keeps_relevant_passages_and_links(self):
+        sources = [
+            ("help", (sentences("pipe network", 40), ["pipes.png"], ["pipes.mp4"])),
+            ("help", (sentences("corridor target", 40), ["corridor.png"], [])),
+            ("forum", ("How do I map corridor targets?", [sentences("corridor target", 5), sentences("label", 5)])),
+        ]
+        budget = 300
+        packed, stats = pack_sources("corridor target mapping", sources, token_budget=budget, max_words=40)
+
+        self.assertLessEqual(stats["passage_tokens_after"], budget)
+        self.assertLess(stats["passages_after"], stats["passages_before"])
+
+        # The pipe network article is irrelevant and dropped, the others keep their attribution and links
+        self.assertIsNone(packed[0])
+        self.assertEqual(packed[1][0], "help")
+        self.assertIn("corridor target", packed[1][1][0])
+        self.assertEqual(packed[1][1][1:], (["corridor.png"], []))
+        self.assertEqual(packed[2][1][0], "How do I map corridor targets?")
+        self.assertEqual(len(packed[2][1][1]), 1)
+        self.assertIn("corridor target", packed[2][1][1][0])
+
+    def test_threads_without_a_fitting_solution_are_dropped_with_their_question(self):
+        sources = [
+            ("help", (sentences("corridor target", 20), [], [])),
+            ("forum", ("How do I label pipes?", [sentences("pipe label", 20)])),
+        ]
+        packed, _ = pack_sources("corridor target", sources, token_budget=200, max_words=40)
+
+        self.assertEqual(packed[0][0], "help")
+        self.assertIsNone(packed[1])
+
+    def test_kept_passages_stay_in_order(self):
+        text = "Corridor one is here. Unrelated pipes. Corridor two is here."
+        packed, _ = pack_sources("corridor", [("help", (text, [], []))], token_budget=12, max_words=4)
+        self.assertEqual(packed[0][1][0], "Corridor one is here. Corridor two is here.")
+
+
+if __name__ == "__main__":
+    unittest.main()
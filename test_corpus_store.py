@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+import unittest
+
+import bench_corpus_store
+import search_index
+from Streamlit_app import parse_help_content
+from corpus_store import INDEX_ENTRY, CorpusStore
+
+ARTICLE = (["Create a corridor from an alignment and a profile. " * 40], ["https://help.autodesk.com/a.png"], [])
+
+
+def help_url(year, guid="GUID-1"):
+    return f"https://help.autodesk.com/view/CIV3D/{year}/ENU/?guid={guid}"
+
+
+class TestCorpusStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "store")
+
+    def test_identical_pages_are_stored_once(self):
+        thread = ("How do I add a target?", ["Use the Target Mapping dialog."])
+        with CorpusStore(self.path) as store:
+            new = [store.put(help_url(year), "help", ARTICLE) for year in search_index.SUPPORTED_YEARS]
+            store.put("https://forums.autodesk.com/t5/thread/1", "forum", thread)
+
+            self.assertEqual(new, [True, False, False, False])
+            self.assertEqual(store.get(help_url(2023)), ("help", ARTICLE))
+            self.assertEqual(store.get("https://forums.autodesk.com/t5/thread/1/?utm_source=x"), ("forum", thread))
+            self.assertIsNone(store.get(help_url(2024, "GUID-2")))
+            stats = store.stats()
+
+        # The article's text, image and video URLs and page, and the thread's question, solutions and page
+        self.assertEqual((stats["urls"], stats["records"], stats["live_records"]), (5, 7, 7))
+        # Compressed, the repeated article takes a fraction of its text
+        self.assertLess(stats["segment_bytes"], len(ARTICLE[0][0]))
+
+        with CorpusStore(self.path) as store:
+            self.assertEqual(store.get(help_url(2025)), ("help", ARTICLE))
+            self.assertEqual(len(store), 5)
+            self.assertTrue(store.put(help_url(2025), "help", ("Updated article", [], [])))
+            self.assertEqual(sorted(record["url"] for record in store.items()),
+                             sorted([help_url(year) for year in search_index.SUPPORTED_YEARS]
+                                    + ["https://forums.autodesk.com/t5/thread/1"]))
+
+    def test_text_is_shared_by_years_with_different_images(self):
+        with open("test_help_page.txt", "r", encoding="utf-8") as file:
+            page_source = file.read()
+        pages = {year: parse_help_content(
+            page_source, base_url=f"https://help.autodesk.com/cloudhelp/{year}/ENU/Civil3D-UserGuide/files/GUID-1.htm")
+            for year in (2023, 2024)}
+        self.assertNotEqual(pages[2023][1], pages[2024][1])
+
+        with CorpusStore(self.path) as store:
+            store.put(help_url(2023), "help", pages[2023])
+            before = store.stats()
+            self.assertTrue(store.put(help_url(2024), "help", pages[2024]))
+            after = store.stats()
+
+            self.assertEqual(store.get(help_url(2023)), ("help", pages[2023]))
+            self.assertEqual(store.get(help_url(2024)), ("help", pages[2024]))
+        # Only the image URLs and the page itself are new, the text and video URLs are shared
+        self.assertEqual(after["records"] - before["records"], 2)
+        self.assertLess(after["segment_bytes"] - before["segment_bytes"], before["segment_bytes"] / 2)
+
+    def test_many_urls_and_segments(self):
+        with CorpusStore(self.path, max_segment_bytes=4096) as store:
+            for i in range(3000):
+                store.put(help_url(2024, f"GUID-{i}"), "help", (f"Article {i}", [], []))
+            self.assertEqual(store.get(help_url(2024, "GUID-2999")), ("help", ("Article 2999", [], [])))
+            stats = store.stats()
+        # A text and a page per article, and the empty URL list they all share
+        self.assertEqual((stats["urls"], stats["records"]), (3000, 6001))
+        self.assertGreater(stats["segments"], 1)
+
+    def test_compaction_drops_replaced_records(self):
+        with CorpusStore(self.path) as store:
+            for i in range(20):
+                store.put(help_url(2024, f"GUID-{i}"), "help", (f"Old article {i} " * 50, [], []))
+            for i in range(10):
+                store.put(help_url(2024, f"GUID-{i}"), "help", (f"New article {i}", [], []))
+            reader = CorpusStore(self.path)
+
+            result = store.compact()
+
+            self.assertEqual(store.get(help_url(2024, "GUID-3")), ("help", ("New article 3", [], [])))
+            self.assertEqual(store.get(help_url(2024, "GUID-13")), ("help", ("Old article 13 " * 50, [], [])))
+            # Readers keep working on the old generation until they refresh
+            self.assertEqual(reader.get(help_url(2024, "GUID-3")), ("help", ("New article 3", [], [])))
+            reader.refresh()
+            self.assertEqual(reader.generation, store.generation)
+            reader.close()
+            # Still deduplicated after the compaction
+            self.assertFalse(store.put(help_url(2025, "GUID-3"), "help", ("New article 3", [], [])))
+
+        # 30 texts and pages and the shared empty URL list, of which the 10 replaced texts and pages are dead
+        self.assertEqual((result["before"]["records"], result["before"]["live_records"]), (61, 41))
+        self.assertEqual(result["after"]["records"], 41)
+        self.assertLess(result["after"]["segment_bytes"], result["before"]["segment_bytes"])
+        self.assertEqual(sorted(os.listdir(self.path)), ["CURRENT", "generation-000001"])
+
+    def test_torn_write_is_recovered(self):
+        with CorpusStore(self.path) as store:
+            store.put(help_url(2024, "GUID-1"), "help", ("First", [], []))
+            store.put(help_url(2024, "GUID-2"), "help", ("Second", [], []))
+            generation = os.path.join(self.path, store.generation)
+
+        # A crash in the middle of the second page: its record, written after its text, is cut short
+        segment = os.path.join(generation, "segment-000000.log")
+        with open(segment, "r+b") as file:
+            file.truncate(os.path.getsize(segment) - 3)
+
+        with CorpusStore(self.path) as store:
+            self.assertEqual(store.get(help_url(2024, "GUID-1")), ("help", ("First", [], [])))
+            self.assertIsNone(store.get(help_url(2024, "GUID-2")))
+            self.assertEqual(os.path.getsize(os.path.join(generation, "records.idx")), 4 * INDEX_ENTRY.size)
+            # The page can be stored again
+            store.put(help_url(2024, "GUID-2"), "help", ("Second", [], []))
+            self.assertEqual(store.get(help_url(2024, "GUID-2")), ("help", ("Second", [], [])))
+
+    def test_search_index_reads_and_ingests_stores(self):
+        os.makedirs(self.path)
+        urls = [help_url(2024), "https://forums.autodesk.com/t5/thread/1"]
+        contents = {urls[0]: ("help", ("Create a corridor", [], [])),
+                    urls[1]: ("forum", ("Corridor targets", ["Use the Target Mapping dialog."]))}
+
+        self.assertEqual(search_index.ingest(urls, self.path, contents.get), 2)
+        records = list(search_index.read_corpus(self.path))
+        indexes = search_index.build_indexes(records)
+
+        self.assertEqual({record["url"]: (record["source_type"], tuple(record["content"])) for record in records},
+                         contents)
+        self.assertEqual({url for url, _ in indexes[2024].search("corridor")}, set(urls))
+        self.assertEqual([url for url, _ in indexes[2023].search("corridor")], [urls[1]])
+
+    def test_benchmark(self):
+        report = bench_corpus_store.run_benchmark(documents=40, lookups=20, directory=self.directory.name)
+
+        for storage in ("json", "pickle", "store"):
+            result = report["results"][storage]
+            self.assertGreater(result["disk_bytes"], 0)
+            self.assertEqual(result["found"], 20)
+        self.assertLess(report["results"]["store"]["disk_bytes"], report["results"]["json"]["disk_bytes"])
+        json.dumps(report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import contextvars
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from deadline import Deadline, current_deadline, deadline_scope, time_left
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_share_of_the_time_left(self):
+        deadline = Deadline(10)
+        share = deadline.share(0.25)
+
+        self.assertAlmostEqual(share.remaining(), 2.5, delta=0.1)
+        self.assertFalse(share.expired())
+        self.assertTrue(Deadline(-1).expired())
+        self.assertEqual(Deadline(-1).remaining(), 0)
+
+    def test_scopes_never_extend_the_enclosing_deadline(self):
+        self.assertIsNone(current_deadline())
+        self.assertEqual(time_left(10), 10)
+        self.assertIsNone(time_left())
+
+        with deadline_scope(1) as outer:
+            self.assertIs(current_deadline(), outer)
+            with deadline_scope(60) as inner:
+                self.assertLessEqual(inner.remaining(), 1)
+            with deadline_scope(Deadline(60)) as inner:
+                self.assertLessEqual(inner.remaining(), 1)
+            self.assertLessEqual(time_left(10), 1)
+            self.assertEqual(time_left(0.001), 0.001)
+        self.assertIsNone(current_deadline())
+
+    def test_deadline_is_carried_into_copied_contexts(self):
+        with deadline_scope(5), ThreadPoolExecutor(max_workers=1) as executor:
+            remaining = executor.submit(contextvars.copy_context().run, time_left).result()
+        self.assertLessEqual(remaining, 5)
+        self.assertGreater(remaining, 4)
+
+    def test_expired_deadline(self):
+        with deadline_scope(0.01):
+            time.sleep(0.02)
+            self.assertEqual(time_left(10), 0)
+            self.assertTrue(current_deadline().expired())
+
+
+if __name__ == "__main__":
+    unittest.main()
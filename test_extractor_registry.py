@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+from extractor_registry import ExtractorRegistry
+
+
+class TestExtractorRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.forum = Mock(return_value=("Question", ["Solution"]))
+        self.help = Mock(return_value=("Article", [], []))
+        self.registry = ExtractorRegistry()
+        self.registry.register("forum", self.forum, hosts=["forums.autodesk.com"],
+                               is_failure=lambda content: content[0] == "failed")
+        self.registry.register("help", self.help, hosts=["help.autodesk.com"], path_prefixes=["/view/", "/cloudhelp/"],
+                               is_failure=lambda content: content[0] == "failed")
+        self.registry.register("unknown", self.forum, source_type="forum", fallback="help",
+                               is_failure=lambda content: content[0] == "failed", default=True)
+
+    def test_links_go_straight_to_their_extractor(self):
+        forum_url = "https://forums.autodesk.com/t5/civil-3d-forum/corridor/td-p/123"
+        help_url = "https://help.autodesk.com/view/CIV3D/2024/ENU/?guid=GUID-1"
+
+        self.assertEqual(self.registry.extract(forum_url), ("forum", ("Question", ["Solution"])))
+        self.assertEqual(self.registry.extract(help_url), ("help", ("Article", [], [])))
+        self.forum.assert_called_once_with(forum_url)
+        self.help.assert_called_once_with(help_url)
+
+    def test_route_matching(self):
+        self.assertEqual(self.registry.route("https://FORUMS.autodesk.com/t5/x").name, "forum")
+        self.assertEqual(self.registry.route("https://help.autodesk.com/cloudhelp/2024/ENU/a.htm").name, "help")
+        # Wrong path prefix and unrelated hosts fall through to the default route
+        self.assertEqual(self.registry.route("https://help.autodesk.com/other").name, "unknown")
+        self.assertEqual(self.registry.route("https://example.com/forums.autodesk.com").name, "unknown")
+
+    def test_unknown_hosts_fall_back_and_misses_are_counted(self):
+        self.forum.return_value = ("failed", [])
+        url = "https://knowledge.autodesk.com/support/article"
+
+        self.assertEqual(self.registry.extract(url), ("help", ("Article", [], [])))
+        self.registry.extract("https://forums.autodesk.com/t5/thread")
+
+        stats = self.registry.stats()
+        self.assertEqual(stats["unknown"]["misses"], 1)
+        self.assertEqual(stats["unknown"]["fallbacks"], 1)
+        self.assertEqual(stats["help"]["hits"], 1)
+        self.assertEqual(stats["forum"]["misses"], 1)
+        self.assertEqual(stats["forum"]["hit_rate"], 0.0)
+        # A failed route without a fallback does not try the other extractors
+        self.assertEqual(self.help.call_count, 1)
+
+    def test_extractor_errors_count_as_misses(self):
+        self.forum.side_effect = requests.HTTPError("404 Client Error")
+        url = "https://knowledge.autodesk.com/support/article"
+
+        # An unknown host still falls through to the documentation extractor when the forum extractor raises
+        self.assertEqual(self.registry.extract(url), ("help", ("Article", [], [])))
+        stats = self.registry.stats()
+        self.assertEqual((stats["unknown"]["misses"], stats["unknown"]["fallbacks"]), (1, 1))
+
+        # Without a fallback the error is raised, after being counted
+        with self.assertRaises(requests.HTTPError):
+            self.registry.extract("https://forums.autodesk.com/t5/thread")
+        self.assertEqual(self.registry.stats()["forum"]["misses"], 1)
+
+    def test_reregistering_keeps_statistics(self):
+        self.registry.extract("https://help.autodesk.com/view/CIV3D/2024/ENU/")
+        replacement = Mock(return_value=("New article", [], []))
+        self.registry.register("help", replacement, hosts=["help.autodesk.com"])
+
+        self.assertEqual(self.registry.extract("https://help.autodesk.com/x")[1][0], "New article")
+        self.assertEqual(self.registry.stats()["help"]["hits"], 2)
+
+    def test_unregistered_routes_are_forgotten(self):
+        self.registry.extract("https://help.autodesk.com/view/CIV3D/2024/ENU/")
+        self.registry.unregister("help")
+
+        self.assertEqual(self.registry.route("https://help.autodesk.com/x").name, "unknown")
+        self.assertNotIn("help", self.registry.stats())
+
+    def test_no_default_route(self):
+        registry = ExtractorRegistry()
+        with self.assertRaises(LookupError):
+            registry.route("https://example.com")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import gzip
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import http_client
+from deadline import deadline_scope
+from fixture_server import FixtureServer
+
+
+def respond(handler, status, body=b"", headers=None):
+    handler.send_response(status)
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        env = patch.dict('os.environ', {"HTTP_RETRY_BACKOFF": "0"})
+        env.start()
+        self.addCleanup(env.stop)
+        for reset in (http_client.close_session, http_client.validator_cache.clear, http_client.host_stats.clear):
+            reset()
+            self.addCleanup(reset)
+
+    def test_unchanged_page_is_revalidated(self):
+        def thread(handler):
+            if handler.headers.get("If-None-Match") == '"v1"':
+                respond(handler, 304, headers={"ETag": '"v1"'})
+            else:
+                respond(handler, 200, b"<html>thread</html>", {"ETag": '"v1"', "Content-Type": "text/html"})
+
+        with FixtureServer({"/t5/thread": thread}) as server:
+            first = http_client.fetch(server.url("/t5/thread"), conditional=True)
+            second = http_client.fetch(server.url("/t5/thread"), conditional=True)
+            # Unconditional requests neither send nor use the validators
+            third = http_client.fetch(server.url("/t5/thread"))
+
+        self.assertEqual((first.content, first.revalidated), (b"<html>thread</html>", False))
+        self.assertEqual((second.status_code, second.content, second.revalidated), (200, b"<html>thread</html>", True))
+        self.assertFalse(third.revalidated)
+        stats = http_client.stats()["127.0.0.1"]
+        self.assertEqual((stats["requests"], stats["not_modified"], stats["errors"]), (3, 1, 0))
+        self.assertEqual(stats["bytes"], 2 * len(b"<html>thread</html>"))
+        self.assertGreaterEqual(stats["connections"], 1)
+
+    def test_transient_errors_are_retried(self):
+        attempts = []
+
+        def flaky(handler):
+            attempts.append(1)
+            if len(attempts) < 3:
+                respond(handler, 503)
+            else:
+                respond(handler, 200, b"ok")
+
+        with FixtureServer({"/flaky": flaky, "/missing": (404, "text/plain", "Not found")}) as server:
+            self.assertEqual(http_client.fetch(server.url("/flaky")).content, b"ok")
+            with self.assertRaises(requests.HTTPError):
+                http_client.fetch(server.url("/missing"))
+
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(server.requests.count("/missing"), 1)
+
+    def test_slow_server_times_out(self):
+        with patch.dict('os.environ', {"HTTP_RETRIES": "0"}), \
+                FixtureServer({"/slow": lambda handler: (time.sleep(0.5), respond(handler, 200, b"late"))}) as server:
+            started = time.monotonic()
+            # A read timeout surfaces as a ConnectionError once the retries are used up
+            with self.assertRaises(requests.RequestException):
+                http_client.fetch(server.url("/slow"), timeout=(1, 0.1))
+            self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(http_client.stats()["127.0.0.1"]["errors"], 1)
+
+    def test_deadline_shortens_the_timeout(self):
+        with patch.dict('os.environ', {"HTTP_RETRIES": "0"}), \
+                FixtureServer({"/slow": lambda handler: (time.sleep(0.5), respond(handler, 200, b"late"))}) as server:
+            started = time.monotonic()
+            with deadline_scope(0.1), self.assertRaises(requests.RequestException):
+                http_client.fetch(server.url("/slow"))
+            self.assertLess(time.monotonic() - started, 0.5)
+
+            # Once the deadline has passed, nothing is requested
+            with deadline_scope(0), self.assertRaises(requests.Timeout):
+                http_client.fetch(server.url("/slow"))
+        self.assertEqual(server.requests.count("/slow"), 1)
+
+    def test_compressed_responses(self):
+        body = b"<html>" + b"corridor " * 1000 + b"</html>"
+
+        def compressed(handler):
+            self.assertIn("gzip", handler.headers.get("Accept-Encoding"))
+            respond(handler, 200, gzip.compress(body), {"Content-Encoding": "gzip"})
+
+        with FixtureServer({"/article.htm": compressed}) as server:
+            self.assertEqual(http_client.fetch(server.url("/article.htm")).content, body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import time
+import unittest
+from multiprocessing import Pool
+
+from page_cache import DiskCache, normalize_url
+
+
+def _write_entries(path, worker):
+    cache = DiskCache(path)
+    for i in range(20):
+        cache.set(f"{worker}:{i}", {"worker": worker, "i": i})
+        cache.get(f"{worker}:{i}")
+    return worker
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache", "pages.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url("HTTPS://Help.Autodesk.com:443/view/CIV3D/2024/ENU/?query=a&guid=GUID-1&utm_source=x#top"),
+            "https://help.autodesk.com/view/CIV3D/2024/ENU?guid=GUID-1&query=a"
+        )
+        self.assertEqual(normalize_url("http://localhost:8000/"), "http://localhost:8000/")
+
+    def test_round_trip_and_statistics(self):
+        cache = DiskCache(self.path)
+        self.assertIsNone(cache.get("missing"))
+        cache.set("page", ["text", ["a.png"], []])
+
+        self.assertEqual(cache.get("page"), ["text", ["a.png"], []])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_expired_entries_are_misses(self):
+        cache = DiskCache(self.path)
+        cache.set("page", "value", ttl=0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("page"))
+        self.assertEqual(cache.get("page", allow_expired=True), "value")
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DiskCache(self.path, max_bytes=250)
+        for key in ("a", "b", "c"):
+            cache.set(key, "x" * 100)
+            time.sleep(0.01)
+        # "a" was evicted to make room for "c"
+        self.assertIsNone(cache.get("a"))
+
+        cache.get("b")
+        time.sleep(0.01)
+        cache.set("d", "x" * 100)
+
+        # "c" is now the least recently used entry
+        self.assertIsNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("d"))
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_concurrent_processes(self):
+        DiskCache(self.path)
+        with Pool(4) as pool:
+            pool.starmap(_write_entries, [(self.path, worker) for worker in range(4)])
+
+        stats = DiskCache(self.path).stats()
+        self.assertEqual(stats["entries"], 80)
+        self.assertEqual(stats["hits"], 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import bench_pipeline
+import page_cache
+import prewarm
+import search_cache
+import Streamlit_app
+from fixture_server import AutodeskReplayServer
+
+
+class TestPrewarm(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.queue = prewarm.CrawlQueue(os.path.join(self.directory.name, "prewarm.sqlite3"))
+
+    def test_rate_limiter_spaces_requests_per_host(self):
+        limiter = prewarm.HostRateLimiter(min_interval=2)
+
+        self.assertEqual(limiter.reserve("forums.autodesk.com", now=100), 0)
+        self.assertEqual(limiter.reserve("forums.autodesk.com", now=100), 2)
+        self.assertEqual(limiter.reserve("forums.autodesk.com", now=101), 3)
+        # Other hosts are not slowed down
+        self.assertEqual(limiter.reserve("help.autodesk.com", now=101), 0)
+        self.assertEqual(limiter.reserve("forums.autodesk.com", now=110), 0)
+
+    def test_popular_and_stale_topics_first(self):
+        for _ in range(3):
+            self.queue.add("query", "create a corridor", 2024)
+        self.queue.add("query", "label alignment stations", 2024)
+        prewarm.seed(self.queue, queries=["export a surface"], urls=["http://example.com/t5/thread"], years=[2024])
+        # Seeds are only added once
+        prewarm.seed(self.queue, queries=["export a surface"], years=[2024])
+
+        due = self.queue.due()
+        self.assertEqual(due[0]["target"], "create a corridor")
+        self.assertAlmostEqual(due[0]["popularity"], 3, places=3)
+        self.assertEqual(len(due), 4)
+
+        for topic in due:
+            self.queue.record_success(topic, ttl=100)
+        now = time.time()
+        self.assertEqual(self.queue.due(now=now + 50), [])
+        # Refreshed before they expire, the most popular first
+        self.assertEqual(self.queue.due(now=now + 90)[0]["target"], "create a corridor")
+
+        # Failing topics are retried after a backoff, doubled for every failure up to their time to live
+        failing = next(topic for topic in self.queue.due(now=now + 90) if topic["target"] == "label alignment stations")
+        self.queue.record_failure(failing)
+        self.queue.record_failure(failing)
+        self.assertNotIn("label alignment stations", [topic["target"] for topic in self.queue.due(now=now + 90)])
+        self.assertIn("label alignment stations", [topic["target"] for topic in self.queue.due(now=now + 200)])
+
+        stats = self.queue.stats(now=now + 90)
+        self.assertEqual(stats["query"]["topics"], 3)
+        self.assertEqual((stats["query"]["fresh"], stats["query"]["failing"]), (3, 1))
+        self.assertEqual(self.queue.stats(now=now + 150)["url"]["stale"], 1)
+
+    def test_record_question(self):
+        with patch.dict('os.environ', {"PREWARM_QUEUE_PATH": self.queue.path}):
+            prewarm.reset_crawl_queue()
+            try:
+                prewarm.record_question("How do I create a corridor?", 2023)
+                with patch.dict('os.environ', {"PREWARM_RECORD_QUESTIONS": "0"}):
+                    prewarm.record_question("How do I label stations?", 2023)
+            finally:
+                prewarm.reset_crawl_queue()
+
+        due = {topic["year"]: topic for topic in self.queue.due()}
+        self.assertEqual(sorted(due), list(prewarm.SUPPORTED_YEARS))
+        self.assertEqual({topic["target"] for topic in due.values()}, {"how do i create a corridor"})
+        self.assertAlmostEqual(due[2023]["popularity"], due[2024]["popularity"] * 2, places=6)
+
+    def test_crawl_warms_the_app_caches(self):
+        forums, helps = bench_pipeline.build_pages(3, 3)
+        environment = {
+            "PAGE_CACHE_ENABLED": "1", "PAGE_CACHE_PATH": os.path.join(self.directory.name, "pages.sqlite3"),
+            "SEARCH_CACHE_ENABLED": "1", "SEARCH_CACHE_PATH": os.path.join(self.directory.name, "search.sqlite3"),
+            "SEARCH_INDEX_ENABLED": "0",
+        }
+        with AutodeskReplayServer(forums, helps) as site, bench_pipeline.replay_routes(), \
+                patch.dict('os.environ', environment), \
+                patch("Streamlit_app.search_autodesk_help", bench_pipeline.search_replay(site)):
+            page_cache.reset_page_cache()
+            search_cache.reset_search_cache()
+            try:
+                prewarm.seed(self.queue, queries=["How do I create a corridor?"], years=[2024])
+                prewarmer = prewarm.Prewarmer(self.queue, workers=2, min_interval=0)
+                prewarmer.run(once=True)
+                crawled_requests = len(site.requests)
+                stats = prewarmer.stats()
+
+                # The app now answers from the caches without reaching the site
+                links = Streamlit_app.get_top_5_links("how do I create a corridor", 2024)
+                sources = [Streamlit_app.extract_source(link) for link in links]
+                self.assertEqual(len(site.requests), crawled_requests)
+
+                # A refresh reaches the site even though the entries are fresh
+                prewarmer.crawl(self.queue.due(now=time.time() + 30 * 24 * 3600)[0])
+                self.assertGreater(len(site.requests), crawled_requests)
+            finally:
+                page_cache.reset_page_cache()
+                search_cache.reset_search_cache()
+
+        self.assertEqual(len(links), 5)
+        self.assertTrue(all(source[1][0] not in (Streamlit_app.FORUM_FAILURE, Streamlit_app.HELP_FAILURE)
+                            for source in sources))
+        self.assertEqual((stats["crawled"], stats["failed"], stats["links_found"]), (6, 0, 5))
+        self.assertEqual(stats["queue"]["query"]["fresh"], 1)
+        self.assertEqual(stats["queue"]["url"]["fresh"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from page_cache import DiskCache, refreshing
+from search_cache import SearchCache, normalize_query
+
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "search.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  How do I create a CORRIDOR?! "), "how do i create a corridor")
+        self.assertEqual(normalize_query("label-style\tproblem"), "label style problem")
+
+    def test_memory_and_disk_tiers(self):
+        fetch = Mock(return_value=["http://example.com/a"])
+        cache = SearchCache(DiskCache(self.path))
+        self.assertEqual(cache.get_or_fetch("Corridor", 2024, fetch), ["http://example.com/a"])
+        self.assertEqual(cache.get_or_fetch("corridor.", 2024, fetch), ["http://example.com/a"])
+
+        # A new process only has the disk tier
+        other_process = SearchCache(DiskCache(self.path))
+        self.assertEqual(other_process.get_or_fetch("CORRIDOR", 2024, fetch), ["http://example.com/a"])
+
+        fetch.assert_called_once()
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+        self.assertEqual(other_process.stats()["disk_hits"], 1)
+
+    def test_failures_are_not_cached(self):
+        fetch = Mock(return_value=["failed"])
+        cache = SearchCache(is_failure=lambda links: links == ["failed"])
+        cache.get_or_fetch("corridor", 2024, fetch)
+        cache.get_or_fetch("corridor", 2024, fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_expired_results_are_refetched(self):
+        cache = SearchCache(ttl=0.01, max_stale=0)
+        cache.get_or_fetch("corridor", 2024, lambda: ["old"])
+        time.sleep(0.02)
+        self.assertEqual(cache.get_or_fetch("corridor", 2024, lambda: ["new"]), ["new"])
+
+    def test_stale_while_revalidate(self):
+        cache = SearchCache(ttl=0.01, max_stale=60)
+        cache.get_or_fetch("corridor", 2024, lambda: ["old"])
+        time.sleep(0.02)
+
+        refreshed = threading.Event()
+
+        def slow_fetch():
+            time.sleep(0.05)
+            refreshed.set()
+            return ["new"]
+
+        started = time.monotonic()
+        self.assertEqual(cache.get_or_fetch("corridor", 2024, slow_fetch), ["old"])
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        self.assertTrue(refreshed.wait(1))
+        for _ in range(100):
+            if cache.stats()["refreshes"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get_or_fetch("corridor", 2024, Mock()), ["new"])
+        self.assertEqual(cache.stats()["stale_served"], 1)
+
+    def test_refresh_by_another_process(self):
+        cache = SearchCache(DiskCache(self.path), ttl=0.05)
+        cache.get_or_fetch("corridor", 2024, lambda: ["old"])
+
+        # The crawler process searches again even though the result is fresh
+        crawler = SearchCache(DiskCache(self.path), ttl=0.05)
+        with refreshing():
+            self.assertEqual(crawler.get_or_fetch("corridor", 2024, lambda: ["new"]), ["new"])
+        self.assertEqual(crawler.stats()["refreshes"], 1)
+
+        # Once its own copy expires, the app picks the refreshed result up from disk
+        self.assertEqual(cache.get_or_fetch("corridor", 2024, Mock()), ["old"])
+        time.sleep(0.06)
+        with refreshing():
+            crawler.get_or_fetch("corridor", 2024, lambda: ["newer"])
+        self.assertEqual(cache.get_or_fetch("corridor", 2024, Mock()), ["newer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import Streamlit_app
+from search_index import LocalSearch, SearchIndex, build_indexes, ingest, read_corpus, tokenize, url_year
+
+
+def help_url(year, guid):
+    return f"https://help.autodesk.com/view/CIV3D/{year}/ENU/?guid={guid}"
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("How do I create Corridor-Surfaces?"), ["create", "corridor", "surface"])
+        self.assertEqual(tokenize("class gas"), ["class", "gas"])
+
+    def test_url_year(self):
+        self.assertEqual(url_year(help_url(2023, "GUID-1")), 2023)
+        self.assertEqual(url_year("https://help.autodesk.com/cloudhelp/2025/ENU/Civil3D-UserGuide/files/a.htm"), 2025)
+        self.assertIsNone(url_year("https://forums.autodesk.com/t5/civil-3d-forum/thread/td-p/1"))
+
+    def test_bm25_ranking(self):
+        index = SearchIndex()
+        index.add_document("corridor", "Corridor corridor baseline assembly region")
+        index.add_document("surface", "Create a surface from a corridor")
+        index.add_document("pipes", "Pipe network parts list and rules")
+
+        results = index.search("corridor baseline", k=5)
+        self.assertEqual([url for url, _ in results], ["corridor", "surface"])
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual(index.search("pipe rules", k=1)[0][0], "pipes")
+        self.assertEqual(index.search("alignment"), [])
+
+    def test_per_year_indexes_and_persistence(self):
+        records = [
+            {"url": help_url(2024, "GUID-1"), "source_type": "help", "content": ["Corridor targets", [], []]},
+            {"url": help_url(2023, "GUID-1"), "source_type": "help", "content": ["Corridor targets", [], []]},
+            {"url": "https://forums.autodesk.com/t5/thread", "source_type": "forum",
+             "content": ["Corridor target question", ["Set the width target"]]},
+        ]
+        indexes = build_indexes(records)
+        self.assertEqual(len(indexes[2024]), 2)
+        self.assertEqual(len(indexes[2022]), 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            local_search = LocalSearch(directory)
+            for year, index in indexes.items():
+                index.save(local_search.index_path(year))
+
+            loaded = LocalSearch(directory)
+            self.assertEqual(loaded.search("width target", 2024),
+                             ["https://forums.autodesk.com/t5/thread", help_url(2024, "GUID-1")])
+            self.assertEqual(loaded.search("corridor", "2023", k=1), [help_url(2023, "GUID-1")])
+            self.assertEqual(LocalSearch(os.path.join(directory, "missing")).search("corridor", 2024), [])
+
+    def test_ingest(self):
+        def extract(url):
+            if url.endswith("broken"):
+                raise Exception("Failed")
+            return "help", ("Article", [], [])
+
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = os.path.join(directory, "corpus.jsonl")
+            written = ingest([help_url(2024, "GUID-1"), help_url(2024, "broken")], corpus, extract)
+            records = list(read_corpus(corpus))
+
+        self.assertEqual(written, 1)
+        self.assertEqual(records, [{"url": help_url(2024, "GUID-1"), "source_type": "help",
+                                    "content": ["Article", [], []]}])
+
+    @patch.dict('os.environ', {"PAGE_CACHE_ENABLED": "0"})
+    @patch('Streamlit_app.get_driver_pool')
+    @patch('Streamlit_app.http_client.fetch')
+    def test_ingest_skips_failed_extractions(self, mock_fetch, mock_get_driver_pool):
+        # The article file cannot be downloaded and no browser is available: the extractor returns its placeholder
+        mock_fetch.side_effect = requests.ConnectionError("Connection refused")
+        mock_get_driver_pool.side_effect = Exception("Chrome is not installed")
+
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = os.path.join(directory, "corpus.jsonl")
+            written = ingest([help_url(2024, "GUID-1")], corpus, Streamlit_app.extract_source)
+            records = list(read_corpus(corpus))
+
+        self.assertEqual(written, 0)
+        self.assertEqual(records, [])
+        self.assertEqual(build_indexes(records)[2024].search("failed to extract text from the page"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
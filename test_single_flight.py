@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+
+from single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flight.stats()["shared"] < 4:
+            time.sleep(0.01)
+        self.assertTrue(flight.in_flight("key"))
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 5)
+        self.assertFalse(flight.in_flight("key"))
+        # Without memo_size, a later call runs again
+        flight.do("key", compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_exceptions_are_shared_but_not_remembered(self):
+        flight = SingleFlight(memo_size=10)
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError("page not found")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("key", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flight.stats()["shared"] < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+    def test_memo_keeps_the_most_recent_results(self):
+        flight = SingleFlight(memo_size=2)
+        for key in ("a", "b", "c"):
+            flight.do(key, lambda key=key: key.upper())
+
+        self.assertEqual(flight.do("c", lambda: "recomputed"), "C")
+        self.assertEqual(flight.do("a", lambda: "recomputed"), "recomputed")
+        flight.forget("a")
+        self.assertEqual(flight.do("a", lambda: "again"), "again")
+        stats = flight.stats()
+        self.assertEqual((stats["calls"], stats["memo_hits"], stats["memo_entries"]), (5, 1, 2))
+
+    def test_an_interrupted_call_is_run_again_by_a_waiting_caller(self):
+        class Rerun(BaseException):
+            pass
+
+        flight = SingleFlight(memo_size=10)
+        started = threading.Event()
+        release = threading.Event()
+
+        def interrupted():
+            started.set()
+            release.wait(5)
+            raise Rerun("rerun of the leader's script")
+
+        outcomes = []
+
+        def lead():
+            try:
+                flight.do("key", interrupted)
+            except Rerun as e:
+                outcomes.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: outcomes.append(flight.do("key", lambda: "result")))
+        follower.start()
+        while flight.stats()["shared"] < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        # Only the leader sees its interruption, the follower runs the call itself
+        self.assertEqual(len(outcomes), 2)
+        self.assertIsInstance(outcomes[0], Rerun)
+        self.assertEqual(outcomes[1], "result")
+        self.assertEqual(flight.stats()["calls"], 2)
+        self.assertEqual(flight.do("key", lambda: "recomputed"), "result")
+
+    def test_started_calls_are_followed_by_every_caller(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def produce(progress):
+            progress.publish("first")
+            release.wait(5)
+            progress.publish("second")
+
+        progress, started = flight.start("key", produce)
+        shared, shared_started = flight.start("key", produce)
+        self.assertEqual((started, shared_started), (True, False))
+        self.assertIs(shared, progress)
+        self.assertEqual(next(iter(shared)), "first")
+        self.assertTrue(flight.in_flight("key"))
+        release.set()
+
+        # Every reader gets all the values, however late it starts reading
+        self.assertEqual(list(progress), ["first", "second"])
+        self.assertEqual(list(shared), ["first", "second"])
+        self.assertTrue(progress.finished())
+        self.assertFalse(flight.in_flight("key"))
+
+        failed, _ = flight.start("key", lambda progress: progress.publish(1) or 1 / 0)
+        values = []
+        with self.assertRaises(ZeroDivisionError):
+            for value in failed:
+                values.append(value)
+        self.assertEqual(values, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
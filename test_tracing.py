@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = tracing.StageMetrics(window=100)
+        patcher = patch('tracing.stage_metrics', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_spans_are_recorded_in_the_current_trace(self):
+        with tracing.start_trace("question") as trace:
+            with tracing.span("get_top_5_links", year=2024):
+                pass
+            with tracing.span("extract_source", url="http://example.com") as attributes:
+                attributes["source_type"] = "help"
+                attributes["ignored"] = object()
+
+        records = trace.to_records()
+        self.assertEqual([record["name"] for record in records], ["get_top_5_links", "extract_source"])
+        self.assertEqual(records[1]["attributes"], {"url": "http://example.com", "source_type": "help"})
+        self.assertTrue(all(record["trace_id"] == trace.trace_id for record in records))
+        self.assertIsNone(tracing.current_trace())
+
+    def test_spans_outside_a_trace_only_update_the_metrics(self):
+        with tracing.span("gpt_4o"):
+            pass
+        self.assertEqual(self.metrics.summary()["gpt_4o"]["count"], 1)
+
+    def test_failed_span_is_marked_as_error(self):
+        with tracing.start_trace("question") as trace:
+            with self.assertRaises(ValueError):
+                with tracing.span("forum.parse"):
+                    raise ValueError("broken page")
+
+        self.assertEqual(trace.to_records()[0]["status"], "error")
+        self.assertEqual(self.metrics.summary()["forum.parse"]["errors"], 1)
+
+    def test_threads_without_the_context_do_not_join_the_trace(self):
+        with tracing.start_trace("question") as trace:
+            thread = threading.Thread(target=lambda: tracing.span("extract_source").__enter__())
+            thread.start()
+            thread.join()
+        self.assertEqual(trace.to_records(), [])
+
+    def test_quantiles(self):
+        for i in range(1, 101):
+            self.metrics.observe("search.browser", i / 100)
+        quantiles = self.metrics.quantiles("search.browser")
+        self.assertAlmostEqual(quantiles[0.5], 0.51)
+        self.assertAlmostEqual(quantiles[0.95], 0.96)
+        self.assertAlmostEqual(quantiles[0.99], 1.0)
+        self.assertEqual(self.metrics.quantiles("unknown"), {})
+
+    def test_prometheus_text(self):
+        self.metrics.observe("gpt_4o", 0.3)
+        self.metrics.observe("gpt_4o", 3.0, error=True)
+        text = self.metrics.prometheus_text()
+
+        self.assertIn("# TYPE civil3d_stage_duration_seconds histogram", text)
+        self.assertIn('civil3d_stage_duration_seconds_bucket{stage="gpt_4o",le="0.25"} 0', text)
+        self.assertIn('civil3d_stage_duration_seconds_bucket{stage="gpt_4o",le="0.5"} 1', text)
+        self.assertIn('civil3d_stage_duration_seconds_bucket{stage="gpt_4o",le="+Inf"} 2', text)
+        self.assertIn('civil3d_stage_duration_seconds_count{stage="gpt_4o"} 2', text)
+        self.assertIn('civil3d_stage_duration_quantile_seconds{stage="gpt_4o",quantile="0.99"} 3.0', text)
+        self.assertIn('civil3d_stage_errors_total{stage="gpt_4o"} 1', text)
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, "traces.jsonl")
+            prometheus_path = os.path.join(directory, "metrics.prom")
+            with patch.dict('os.environ', {"TRACE_JSONL_PATH": jsonl_path, "METRICS_PROMETHEUS_PATH": prometheus_path}):
+                for _ in range(2):
+                    with tracing.start_trace("question"):
+                        with tracing.span("prompt_assembly"):
+                            pass
+
+            with open(jsonl_path, encoding="utf-8") as file:
+                records = [json.loads(line) for line in file]
+            with open(prometheus_path, encoding="utf-8") as file:
+                metrics = file.read()
+
+        self.assertEqual([record["name"] for record in records], ["prompt_assembly", "prompt_assembly"])
+        self.assertNotEqual(records[0]["trace_id"], records[1]["trace_id"])
+        self.assertIn('civil3d_stage_duration_seconds_count{stage="prompt_assembly"} 2', metrics)
+
+
+if __name__ == "__main__":
+    unittest.main()
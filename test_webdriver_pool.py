@@ -0,0 +1,135 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from webdriver_pool import BrowserBusyError, WebDriverPool
+
+
+class TestWebDriverPool(unittest.TestCase):
+
+    def setUp(self):
+        self.drivers = []
+
+        def factory():
+            driver = MagicMock()
+            self.drivers.append(driver)
+            return driver
+
+        self.factory = factory
+
+    def test_warm_up_starts_drivers_and_reuses_them(self):
+        pool = WebDriverPool(self.factory, size=2)
+        pool.warm_up()
+        self.assertEqual(len(self.drivers), 2)
+
+        with pool.driver() as driver:
+            self.assertIn(driver, self.drivers)
+
+        with pool.driver():
+            pass
+
+        stats = pool.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 0)
+        self.assertEqual(stats["idle"], 2)
+        self.assertEqual(len(self.drivers), 2)
+        pool.close()
+        for driver in self.drivers:
+            driver.quit.assert_called_once()
+
+    def test_driver_state_is_reset_between_uses(self):
+        pool = WebDriverPool(self.factory, size=1)
+        with pool.driver() as driver:
+            driver.window_handles = ["main", "popup"]
+
+        driver.execute_cdp_cmd.assert_called_with("Network.clearBrowserCookies", {})
+        driver.switch_to.window.assert_called_with("main")
+        driver.close.assert_called_once()
+        driver.get.assert_called_with("about:blank")
+
+    def test_worn_out_driver_is_replaced(self):
+        pool = WebDriverPool(self.factory, size=1, max_pages_per_driver=2)
+        for _ in range(3):
+            with pool.driver():
+                pass
+
+        self.assertEqual(len(self.drivers), 2)
+        self.drivers[0].quit.assert_called_once()
+        self.assertEqual(pool.stats()["retired"], 1)
+
+    def test_crashed_driver_is_replaced(self):
+        pool = WebDriverPool(self.factory, size=1)
+        with pool.driver() as driver:
+            driver.get.side_effect = Exception("chrome not reachable")
+
+        with pool.driver() as driver:
+            self.assertIs(driver, self.drivers[1])
+
+        self.drivers[0].quit.assert_called_once()
+        self.assertEqual(pool.stats()["crashed"], 1)
+
+    def test_exhausted_pool_waits_then_times_out(self):
+        pool = WebDriverPool(self.factory, size=1)
+        pooled = pool.acquire()
+        with self.assertRaises(BrowserBusyError):
+            pool.acquire(timeout=0.05)
+
+        # A waiting caller is served as soon as the driver is released
+        released = threading.Timer(0.05, pool.release, args=(pooled,))
+        released.start()
+        with pool.driver(timeout=5) as driver:
+            self.assertIs(driver, self.drivers[0])
+        released.join()
+
+        stats = pool.stats()
+        self.assertEqual(stats["waits"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_waiting_callers_are_served_in_arrival_order(self):
+        pool = WebDriverPool(self.factory, size=1)
+        pooled = pool.acquire()
+        served = []
+
+        def wait_for_driver(name):
+            with pool.driver(timeout=5):
+                served.append(name)
+
+        threads = []
+        for name in ("first", "second", "third"):
+            thread = threading.Thread(target=wait_for_driver, args=(name,))
+            thread.start()
+            threads.append(thread)
+            # Make sure every caller is queued before the next one arrives
+            while pool.stats()["queued"] < len(threads):
+                threading.Event().wait(0.01)
+
+        pool.release(pooled)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(served, ["first", "second", "third"])
+        stats = pool.stats()
+        self.assertEqual((stats["waits"], stats["max_queued"], stats["queued"]), (3, 3, 0))
+        self.assertGreater(stats["max_wait_seconds"], 0)
+
+    def test_full_queue_sheds_load(self):
+        pool = WebDriverPool(self.factory, size=1, max_queue=1)
+        pooled = pool.acquire()
+        waiter = threading.Thread(target=lambda: pool.release(pool.acquire(timeout=5)))
+        waiter.start()
+        while pool.stats()["queued"] < 1:
+            threading.Event().wait(0.01)
+
+        with self.assertRaises(BrowserBusyError):
+            pool.acquire(timeout=5)
+
+        pool.release(pooled)
+        waiter.join()
+        stats = pool.stats()
+        self.assertEqual((stats["shed"], stats["hits"], stats["misses"]), (1, 1, 1))
+        self.assertEqual(len(self.drivers), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
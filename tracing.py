@@ -0,0 +1,255 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+        The spans recorded while answering one question.
+
+        Attributes:
+            name (str): The name of the traced operation.
+            trace_id (str): A random identifier shared by the exported spans.
+            started (float): The time.monotonic() timestamp of the start of the trace.
+            spans (list of dict): The finished spans with their name, start and duration in seconds (relative to
+                the start of the trace), status and attributes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.monotonic()
+        self.wall_started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_records(self):
+        """
+            Returns the spans as JSON-serializable records, ordered by start time.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return [dict(span, trace_id=self.trace_id, trace=self.name, timestamp=self.wall_started + span["start"])
+                for span in spans]
+
+
+class StageMetrics:
+    """
+        Latency histograms per pipeline stage, exported in the Prometheus text format.
+
+        Besides the cumulative buckets, the most recent `window` durations of every stage are kept to compute the
+        p50, p95 and p99 quantiles.
+
+        Args:
+            window (int): The number of recent durations kept per stage for the quantiles.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        """
+            Records the duration of one run of a stage.
+        """
+        with self._lock:
+            metrics = self._stages.get(stage)
+            if metrics is None:
+                metrics = self._stages[stage] = {
+                    "buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0,
+                    "recent": deque(maxlen=self.window),
+                }
+            index = bisect.bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                metrics["buckets"][index] += 1
+            metrics["count"] += 1
+            metrics["sum"] += seconds
+            metrics["errors"] += int(error)
+            metrics["recent"].append(seconds)
+
+    def quantiles(self, stage):
+        """
+            Returns the p50, p95 and p99 of the recent durations of a stage, as a dict keyed by quantile.
+        """
+        with self._lock:
+            recent = sorted(self._stages[stage]["recent"]) if stage in self._stages else []
+        if not recent:
+            return {}
+        return {quantile: recent[min(len(recent) - 1, int(quantile * len(recent)))] for quantile in QUANTILES}
+
+    def quantile(self, stage, quantile, min_samples=1):
+        """
+            Returns a quantile of the recent durations of a stage, or None with fewer than min_samples durations.
+        """
+        with self._lock:
+            recent = sorted(self._stages[stage]["recent"]) if stage in self._stages else []
+        if len(recent) < max(1, min_samples):
+            return None
+        return recent[min(len(recent) - 1, int(quantile * len(recent)))]
+
+    def summary(self):
+        """
+            Returns the count, mean and quantiles of every stage.
+        """
+        with self._lock:
+            stages = {stage: (metrics["count"], metrics["sum"], metrics["errors"])
+                      for stage, metrics in self._stages.items()}
+        return {
+            stage: {"count": count, "errors": errors, "mean": total / count if count else 0.0,
+                    **{f"p{int(quantile * 100)}": value for quantile, value in self.quantiles(stage).items()}}
+            for stage, (count, total, errors) in stages.items()
+        }
+
+    def prometheus_text(self):
+        """
+            Renders the metrics in the Prometheus text exposition format.
+
+            Returns:
+                str: A histogram civil3d_stage_duration_seconds, a summary civil3d_stage_duration_quantile_seconds
+                    of the recent durations and a counter civil3d_stage_errors_total, all labelled by stage.
+        """
+        with self._lock:
+            stages = {stage: (list(metrics["buckets"]), metrics["count"], metrics["sum"], metrics["errors"])
+                      for stage, metrics in sorted(self._stages.items())}
+        lines = [
+            "# HELP civil3d_stage_duration_seconds Duration of the question pipeline stages.",
+            "# TYPE civil3d_stage_duration_seconds histogram",
+        ]
+        for stage, (buckets, count, total, _) in stages.items():
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'civil3d_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'civil3d_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'civil3d_stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'civil3d_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            f"# HELP civil3d_stage_duration_quantile_seconds Quantiles of the last {self.window} durations per stage.",
+            "# TYPE civil3d_stage_duration_quantile_seconds summary",
+        ]
+        for stage, (_, count, total, _) in stages.items():
+            for quantile, value in self.quantiles(stage).items():
+                lines.append(f'civil3d_stage_duration_quantile_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+            lines.append(f'civil3d_stage_duration_quantile_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'civil3d_stage_duration_quantile_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            "# HELP civil3d_stage_errors_total Stage runs that raised an exception.",
+            "# TYPE civil3d_stage_errors_total counter",
+        ]
+        for stage, (_, _, _, errors) in stages.items():
+            lines.append(f'civil3d_stage_errors_total{{stage="{stage}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide metrics, shared across Streamlit reruns and sessions
+stage_metrics = StageMetrics()
+_export_lock = threading.Lock()
+
+
+def current_trace():
+    """
+        Returns the trace of the current context, or None.
+    """
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name):
+    """
+        Context manager recording the spans of the enclosed code into a new trace.
+
+        When the trace ends its spans are appended to the JSONL file in TRACE_JSONL_PATH and the Prometheus metrics
+        are written to METRICS_PROMETHEUS_PATH, if set.
+
+        Args:
+            name (str): The name of the traced operation.
+
+        Yields:
+            Trace: The new trace.
+    """
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        export(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+        Context manager timing a pipeline stage.
+
+        The duration is added to the stage's histogram and, inside a trace, recorded as a span. Attributes can be
+        added to the yielded dict while the span is open.
+
+        Args:
+            name (str): The stage name.
+            **attributes: Attributes recorded with the span, e.g. the URL.
+
+        Yields:
+            dict: The attributes of the span.
+    """
+    started = time.monotonic()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        duration = time.monotonic() - started
+        stage_metrics.observe(name, duration, error=error is not None)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span({
+                "name": name,
+                "start": started - trace.started,
+                "duration": duration,
+                "status": "error" if error is not None else "ok",
+                "thread": threading.current_thread().name,
+                "attributes": {key: value for key, value in attributes.items()
+                               if isinstance(value, (str, int, float, bool)) or value is None},
+            })
+
+
+def export(trace):
+    """
+        Writes a finished trace to TRACE_JSONL_PATH and the current metrics to METRICS_PROMETHEUS_PATH, if set.
+    """
+    jsonl_path = os.getenv("TRACE_JSONL_PATH")
+    prometheus_path = os.getenv("METRICS_PROMETHEUS_PATH")
+    try:
+        with _export_lock:
+            if jsonl_path:
+                with open(jsonl_path, "a", encoding="utf-8") as file:
+                    for record in trace.to_records():
+                        file.write(json.dumps(record) + "\n")
+            if prometheus_path:
+                # Write then rename, so a scraper never reads a half-written file
+                with open(prometheus_path + ".tmp", "w", encoding="utf-8") as file:
+                    file.write(stage_metrics.prometheus_text())
+                os.replace(prometheus_path + ".tmp", prometheus_path)
+    except OSError as e:
+        logging.info(f"Failed to export the trace: {e}")
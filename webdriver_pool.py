@@ -0,0 +1,375 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from tracing import stage_metrics
+
+# The pool lives in its own module rather than in Streamlit_app.py because Streamlit re-executes the app
+# script on every rerun, while imported modules stay cached in sys.modules for the life of the process.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class BrowserBusyError(TimeoutError):
+    """
+        Raised when no browser can be handed out: the waiting queue is full, or no browser became free in time.
+    """
+
+
+class PooledDriver:
+    """
+        A WebDriver handed out by the pool together with the bookkeeping needed to recycle it.
+
+        Attributes:
+            driver: The underlying Selenium WebDriver instance.
+            pages_handled (int): The number of times the driver has been checked out and returned.
+            created_at (float): The time.monotonic() timestamp at which the driver was started.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages_handled = 0
+        self.created_at = time.monotonic()
+
+
+class _Waiter:
+    def __init__(self):
+        self.granted = False
+        self.pooled = None
+
+
+class WebDriverPool:
+    """
+        A thread-safe pool of already running WebDriver instances.
+
+        Drivers are created lazily by the factory up to the pool size (or eagerly by warm_up), reset after
+        every use, and replaced when they crash or have handled max_pages_per_driver pages. The pool size caps
+        the number of browsers of the process.
+
+        When every driver is busy, callers wait in a first-in, first-out queue, so a session that has waited
+        longest is served first. Once max_queue callers are waiting, further callers are turned away at once
+        with BrowserBusyError instead of piling up.
+
+        Args:
+            factory (callable): A zero-argument callable returning a new WebDriver.
+            size (int): The maximum number of drivers alive at the same time.
+            max_pages_per_driver (int): The number of uses after which a driver is retired and replaced.
+            acquire_timeout (float): The number of seconds to wait for a free driver before giving up.
+            max_queue (int): The maximum number of callers waiting for a driver, None for no limit.
+    """
+
+    def __init__(self, factory, size=2, max_pages_per_driver=50, acquire_timeout=60, max_queue=None):
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.factory = factory
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.acquire_timeout = acquire_timeout
+        self.max_queue = max_queue
+
+        self._idle = []
+        self._queue = deque()
+        self._total = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "max_queued": 0,
+            "created": 0,
+            "retired": 0,
+            "crashed": 0,
+            "timeouts": 0,
+            "shed": 0,
+        }
+
+    def warm_up(self, block=True):
+        """
+            Starts drivers until the pool holds `size` of them.
+
+            Args:
+                block (bool): If False, the drivers are started on a background thread.
+        """
+        if not block:
+            threading.Thread(target=self.warm_up, name="webdriver-pool-warm-up", daemon=True).start()
+            return
+
+        while True:
+            with self._condition:
+                if self._closed or self._total >= self.size:
+                    return
+                self._total += 1
+            try:
+                pooled = self._create()
+            except Exception as e:
+                with self._condition:
+                    self._total -= 1
+                    self._condition.notify()
+                logging.info(f"WebDriver pool warm-up failed: {e}")
+                return
+            with self._condition:
+                self._idle.append(pooled)
+                self._dispatch()
+
+    def acquire(self, timeout=None):
+        """
+            Checks out a running driver, starting a new one if the pool is not full yet.
+
+            Args:
+                timeout (float): The number of seconds to wait for a free driver. Defaults to acquire_timeout.
+
+            Returns:
+                PooledDriver: The checked out driver. It must be handed back with release().
+
+            Raises:
+                BrowserBusyError: If max_queue callers are already waiting, or no driver became available in time.
+                RuntimeError: If the pool has been closed.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The WebDriver pool is closed")
+            waiter = _Waiter()
+            # Callers only skip the queue when nobody is waiting in it
+            if not self._queue:
+                self._grant(waiter)
+            if not waiter.granted:
+                if self.max_queue is not None and len(self._queue) >= self.max_queue:
+                    self._stats["shed"] += 1
+                    raise BrowserBusyError(f"{len(self._queue)} requests are already waiting for a browser")
+                self._queue.append(waiter)
+                self._stats["waits"] += 1
+                self._stats["max_queued"] = max(self._stats["max_queued"], len(self._queue))
+                while not waiter.granted:
+                    if self._closed:
+                        self._queue.remove(waiter)
+                        raise RuntimeError("The WebDriver pool is closed")
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._queue.remove(waiter)
+                        self._stats["timeouts"] += 1
+                        raise BrowserBusyError(f"No WebDriver became available within {timeout} seconds")
+                    self._condition.wait(remaining)
+                wait_seconds = time.monotonic() - started
+                self._stats["wait_seconds"] += wait_seconds
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], wait_seconds)
+            pooled = waiter.pooled
+        stage_metrics.observe("webdriver.queue", time.monotonic() - started)
+
+        if pooled is None:
+            try:
+                pooled = self._create()
+            except Exception:
+                self._discard_slot()
+                raise
+        elif not self._is_alive(pooled):
+            # The idle driver died while waiting (e.g. Chrome was OOM-killed), start a replacement in its slot
+            self._quit(pooled)
+            with self._condition:
+                self._stats["crashed"] += 1
+            try:
+                pooled = self._create()
+            except Exception:
+                self._discard_slot()
+                raise
+        return pooled
+
+    def release(self, pooled):
+        """
+            Returns a driver to the pool after resetting its state, or replaces it if it is crashed or worn out.
+
+            Args:
+                pooled (PooledDriver): The driver previously returned by acquire().
+        """
+        pooled.pages_handled += 1
+        if self._closed:
+            self._quit(pooled)
+            self._discard_slot()
+            return
+
+        if pooled.pages_handled >= self.max_pages_per_driver:
+            self._quit(pooled)
+            with self._condition:
+                self._stats["retired"] += 1
+            self._discard_slot()
+            return
+
+        try:
+            self._reset(pooled.driver)
+        except Exception as e:
+            logging.info(f"Discarding WebDriver that failed to reset: {e}")
+            self._quit(pooled)
+            with self._condition:
+                self._stats["crashed"] += 1
+            self._discard_slot()
+            return
+
+        with self._condition:
+            self._idle.append(pooled)
+            self._dispatch()
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """
+            Context manager that checks out a driver and always hands it back.
+
+            Args:
+                timeout (float): The number of seconds to wait for a free driver.
+
+            Yields:
+                The Selenium WebDriver to use.
+        """
+        pooled = self.acquire(timeout=timeout)
+        try:
+            yield pooled.driver
+        finally:
+            self.release(pooled)
+
+    def stats(self):
+        """
+            Returns a snapshot of the pool statistics.
+
+            Returns:
+                dict: Counters for hits (an idle driver was reused), misses (a driver had to be started), waits
+                    (the caller was queued), time spent in the queue, callers turned away (shed), replaced
+                    drivers, plus the current number of idle and busy drivers and of queued callers.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._queue)
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._total - len(self._idle)
+            stats["size"] = self.size
+        checkouts = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / checkouts if checkouts else 0.0
+        return stats
+
+    def close(self):
+        """
+            Quits every idle driver. Drivers that are checked out are quit when they are released.
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._quit(pooled)
+        logging.info(f"WebDriver pool closed: {self.stats()}")
+
+    def _create(self):
+        driver = self.factory()
+        with self._condition:
+            self._stats["created"] += 1
+        return PooledDriver(driver)
+
+    def _grant(self, waiter):
+        # Must be called with the condition held. Hands an idle driver, or a slot to start one in, to the waiter.
+        if self._idle:
+            waiter.pooled = self._idle.pop()
+            self._stats["hits"] += 1
+        elif self._total < self.size:
+            self._total += 1
+            self._stats["misses"] += 1
+        else:
+            return False
+        waiter.granted = True
+        return True
+
+    def _dispatch(self):
+        # Must be called with the condition held. Serves the queued callers in arrival order.
+        granted = False
+        while self._queue and not self._closed and self._grant(self._queue[0]):
+            self._queue.popleft()
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _discard_slot(self):
+        with self._condition:
+            self._total -= 1
+            self._dispatch()
+
+    @staticmethod
+    def _is_alive(pooled):
+        try:
+            pooled.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(driver):
+        # Close every tab but the first one
+        handles = list(driver.window_handles)
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        if handles:
+            driver.switch_to.window(handles[0])
+
+        # delete_all_cookies() only clears the cookies of the current domain, so clear them browser-wide
+        # through the DevTools protocol when the driver supports it
+        if hasattr(driver, "execute_cdp_cmd"):
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        else:
+            driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    @staticmethod
+    def _quit(pooled):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logging.info(f"An error occurred while quitting a WebDriver: {e}")
+
+
+def get_driver_pool(factory=None):
+    """
+        Returns the process-wide WebDriver pool, creating it on first use.
+
+        The pool is configured through the WEBDRIVER_POOL_SIZE (default 2), WEBDRIVER_MAX_PAGES (default 50),
+        WEBDRIVER_MAX_QUEUE (default 8 waiting callers, 0 for no limit) and WEBDRIVER_QUEUE_TIMEOUT (default 60
+        seconds) environment variables.
+
+        Args:
+            factory (callable): The driver factory. Required the first time the pool is created.
+
+        Returns:
+            WebDriverPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if factory is None:
+                raise ValueError("A driver factory is required to create the WebDriver pool")
+            _pool = WebDriverPool(
+                factory,
+                size=int(os.getenv("WEBDRIVER_POOL_SIZE", "2")),
+                max_pages_per_driver=int(os.getenv("WEBDRIVER_MAX_PAGES", "50")),
+                acquire_timeout=float(os.getenv("WEBDRIVER_QUEUE_TIMEOUT", "60")),
+                max_queue=int(os.getenv("WEBDRIVER_MAX_QUEUE", "8")) or None,
+            )
+        return _pool
+
+
+def shutdown_driver_pool():
+    """
+        Closes the process-wide pool, if any, so the next get_driver_pool() call starts a fresh one.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_driver_pool)